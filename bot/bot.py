@@ -1,5 +1,8 @@
 import os
+import sys
 import io
+import gzip
+import zlib
 import asyncio
 import re
 import json
@@ -12,53 +15,41 @@ from typing import Optional
 import aiohttp
 import discord
 from discord import app_commands
-from discord.ext import tasks
 from discord.ext import commands
 from dotenv import load_dotenv
-import requests
 from datetime import datetime
 from enum import Enum
+from dataclasses import dataclass, field, replace
+from collections import OrderedDict, deque
 import sqlite3
 import random
 import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
 
 from discord.ui import View, button
 from discord import ButtonStyle
 
-# =========================
-# 데이터베이스
-# =========================
-
-conn = sqlite3.connect("economy.db")
-cur = conn.cursor()
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS economy(
-    user_id INTEGER PRIMARY KEY,
-    money INTEGER DEFAULT 0,
-    last_daily INTEGER DEFAULT 0,
-    exp INTEGER DEFAULT 0,
-    level INTEGER DEFAULT 1
+from storage import (
+    Database,
+    apply_migrations,
+    EconomyRow,
+    ShopItemRow,
+    RankChangeRow,
+    LedgerEntry,
+    EconomyRepo,
+    UserRepo,
+    ForcedVerifiedRepo,
+    ShopItemRepo,
+    CommandLogRepo,
+    RankHistoryRepo,
+    CurrentRankRepo,
+    RETENTION_BATCH_SIZE,
+    RETENTION_POLICIES,
+    archive_expired_batch,
 )
-""")
-
-conn.commit()
-
-
-def get_user(user_id):
 
-    cur.execute("SELECT * FROM economy WHERE user_id=?", (user_id,))
-    data = cur.fetchone()
-
-    if data is None:
-        cur.execute(
-            "INSERT INTO economy (user_id,money,last_daily,exp,level) VALUES (?,0,0,0,1)",
-            (user_id,)
-        )
-        conn.commit()
-        return (user_id,0,0,0,1)
-
-    return data
 
 VERIFY_ROLE_ID = 1461636782176075831      # 🟢 인증자 역할 ID
 UNVERIFY_ROLE_ID = 1478713261074550956     # 🔴 제거할 역할 ID (예: 미인증자)
@@ -73,29 +64,6 @@ ADMIN_LOG_CHANNEL_ID = 1468191799855026208 # 📋 관리자 로그 채널 ID
 
 API_BASE = "https://web-api-production-69fc.up.railway.app" 
 
-def is_already_verified(guild_id: int, user_id: int) -> bool:
-    try:
-        resp = requests.get(
-            f"{API_BASE}/api/logs/verify",
-            params={
-                "guild_id": guild_id,
-                "user_id": user_id,
-                "limit": 1,
-            },
-            timeout=5,
-        )
-        if resp.status_code != 200:
-            print("[WEB_CHECK_ERROR]", resp.status_code, resp.text)
-            return False 
-
-        data = resp.json()
-        # 한 건이라도 있으면 이미 인증한 걸로 간주
-        return len(data) > 0
-    except Exception as e:
-        print("[WEB_CHECK_EXCEPTION]", repr(e))
-        return False
-
-
 LOG_API_URL = "https://web-api-production-69fc.up.railway.app"  # 나중에 Railway 올리면 URL만 바꾸면 됨 
 
 intents = discord.Intents.default()
@@ -134,159 +102,1027 @@ if not TOKEN:
 
 intents = discord.Intents.all() 
 
-bot = commands.Bot(command_prefix="!", intents=intents) 
+# ---------- HTTP 세션 ----------
+# Roblox / 랭크 서버 / 웹 API 호출은 전부 이 세션 하나를 공유한다.
+# 매 요청마다 TCP+TLS 핸드셰이크를 하지 않도록 keep-alive 커넥션을 재사용.
+
+HTTP_POOL_LIMIT = 100            # 전체 동시 커넥션 수
+HTTP_POOL_LIMIT_PER_HOST = 20    # 호스트당 동시 커넥션 수
+HTTP_KEEPALIVE_SECONDS = 60
+HTTP_DNS_CACHE_SECONDS = 300
+
+http_session: aiohttp.ClientSession | None = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """공유 aiohttp 세션을 반환합니다. (setup_hook 이전 호출 시 지연 생성)"""
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+            ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+        )
+        http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+    return http_session
+
+
+async def close_http_session() -> None:
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+
+# ---------- 업스트림 레이트 리밋 ----------
+# 호스트(업스트림)마다 토큰 버킷 하나. 모든 HTTP 호출은 http_request() 를 거친다.
+# 429 응답의 Retry-After 는 해당 버킷 전체를 그 시간만큼 멈춘다.
+
+RATE_LIMITS: dict[str, tuple[float, float]] = {   # host -> (초당 요청 수, 버스트)
+    "users.roblox.com": (5, 10),
+    "groups.roblox.com": (5, 10),
+    urlsplit(RANK_API_URL_ROOT).hostname or "": (3, 6),
+    urlsplit(LOG_API_URL).hostname or "": (20, 40),
+}
+DEFAULT_RATE_LIMIT = (10, 20)
+DEFAULT_RETRY_AFTER = 5.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.throttled = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        self.waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        finally:
+            self.waiting -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "rate": self.rate,
+            "tokens": round(self.tokens, 2),
+            "capacity": self.capacity,
+            "waiting": self.waiting,
+            "paused_for": round(max(0.0, self.paused_until - now), 1),
+            "throttled": self.throttled,
+        }
+
+
+def parse_retry_after(value: str | None) -> float:
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class RateLimitRegistry:
+    def __init__(self, limits: dict[str, tuple[float, float]]):
+        self.limits = limits
+        self.buckets: dict[str, TokenBucket] = {}
+
+    def bucket_for(self, url: str) -> TokenBucket:
+        host = urlsplit(url).hostname or ""
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            rate, capacity = self.limits.get(host, DEFAULT_RATE_LIMIT)
+            bucket = self.buckets[host] = TokenBucket(rate, capacity)
+        return bucket
+
+    async def acquire(self, url: str) -> None:
+        await self.bucket_for(url).acquire()
+
+    def note_response(self, url: str, resp: aiohttp.ClientResponse) -> None:
+        if resp.status == 429:
+            self.bucket_for(url).pause(parse_retry_after(resp.headers.get("Retry-After")))
+
+    def snapshot(self) -> dict[str, dict]:
+        return {host: bucket.snapshot() for host, bucket in self.buckets.items()}
+
+
+rate_limits = RateLimitRegistry(RATE_LIMITS)
+
+
+@asynccontextmanager
+async def http_request(method: str, url: str, **kwargs):
+    """레이트 리밋을 거쳐 공유 세션으로 요청합니다. (async with 로 사용)"""
+    await rate_limits.acquire(url)
+    async with get_http_session().request(method, url, **kwargs) as resp:
+        rate_limits.note_response(url, resp)
+        yield resp
+
+
+class UpstreamHTTPError(Exception):
+    """업스트림이 성공 이외의 상태 코드를 돌려준 경우"""
+
+    def __init__(self, status: int, text: str):
+        super().__init__(f"HTTP {status}: {text}")
+        self.status = status
+        self.text = text
+
+
+# ---------- 서킷 브레이커 ----------
+# 랭크 서버 / 웹 API 가 죽어 있을 때 타임아웃을 쌓지 않고 바로 실패시킨다.
+# CLOSED → (연속 실패) → OPEN → (recovery_timeout 경과) → HALF_OPEN → 프로브 1건 결과로 CLOSED/OPEN
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RECOVERY_TIMEOUT = 30.0
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} 일시 차단 중 ({retry_in:.0f}초 후 재시도)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def _is_circuit_failure(exc: BaseException) -> bool:
+    # 4xx 는 서버가 살아서 답한 것이므로 장애로 치지 않는다
+    return not (isinstance(exc, UpstreamHTTPError) and exc.status < 500)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        if self.state is not CircuitState.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state is CircuitState.OPEN:
+            if self.retry_in() > 0:
+                self.rejected += 1
+                return False
+            self._transition(CircuitState.HALF_OPEN)
+
+        if self.state is CircuitState.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self.failures = 0
+        if self.state is not CircuitState.CLOSED:
+            self._transition(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state is CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(CircuitState.OPEN)
+
+    @asynccontextmanager
+    async def guard(self):
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+        try:
+            yield
+        except asyncio.CancelledError:
+            self._probe_in_flight = False
+            raise
+        except Exception as e:
+            if _is_circuit_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        else:
+            self.record_success()
+
+    def _transition(self, new_state: CircuitState) -> None:
+        old_state, self.state = self.state, new_state
+        if old_state is new_state:
+            return
+        print(f"[CIRCUIT] {self.name}: {old_state.value} -> {new_state.value}")
+        try:
+            task = asyncio.get_running_loop().create_task(
+                notify_circuit_change(self, old_state, new_state)
+            )
+        except RuntimeError:
+            return
+        _notify_tasks.add(task)
+        task.add_done_callback(_notify_tasks.discard)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 1),
+            "rejected": self.rejected,
+        }
+
+
+_notify_tasks: set[asyncio.Task] = set()
+
+
+async def notify_circuit_change(
+    breaker: CircuitBreaker,
+    old_state: CircuitState,
+    new_state: CircuitState,
+) -> None:
+    """서킷 상태 변경을 각 서버의 개발자 로그 채널에 알립니다."""
+    if not bot.is_ready():
+        return
+
+    color = {
+        CircuitState.OPEN: discord.Color.red(),
+        CircuitState.HALF_OPEN: discord.Color.orange(),
+        CircuitState.CLOSED: discord.Color.green(),
+    }[new_state]
+    embed = discord.Embed(
+        title=f"⚡ 서킷 브레이커: {breaker.name}",
+        description=f"`{old_state.value}` → `{new_state.value}`",
+        color=color,
+        timestamp=datetime.now(timezone.utc),
+    )
+    embed.add_field(name="연속 실패", value=str(breaker.failures), inline=True)
+    if new_state is CircuitState.OPEN:
+        embed.add_field(name="재시도", value=f"{breaker.recovery_timeout:.0f}초 후", inline=True)
+
+    for guild in bot.guilds:
+        ch_id = get_log_channel(guild.id, "dev")
+        if not ch_id:
+            continue
+        try:
+            ch = guild.get_channel(ch_id) or await guild.fetch_channel(ch_id)
+            if ch:
+                await ch.send(embed=embed)
+        except Exception as e:
+            print("[CIRCUIT_NOTIFY_ERROR]", repr(e))
+
+
+rank_api_breaker = CircuitBreaker("랭크 서버")
+web_api_breaker = CircuitBreaker("웹 API")
+
+
+class SkyBot(commands.Bot):
+    async def setup_hook(self) -> None:
+        get_http_session()
+        web_log_shipper.start()
+        economy_flush_task.start()
+        guild_config_reload_task.start()
+
+    async def close(self) -> None:
+        try:
+            await web_log_shipper.stop()
+            await super().close()
+        finally:
+            # 루프가 세션을 쓰는 도중에 닫히지 않도록 루프가 끝난 뒤에 닫는다
+            await asyncio.gather(*(loop.stop() for loop in supervised_loops.values()))
+            await close_http_session()
+            try:
+                await economy_accounts.flush()
+            except Exception as e:
+                add_error_log(f"economy_flush: {repr(e)}")
+            # 남은 쓰기를 모두 커밋한 뒤 DB 스레드 종료
+            await asyncio.to_thread(db.close)
+
+
+bot = SkyBot(command_prefix="!", intents=intents) 
 
 error_logs: list[dict] = []
 MAX_LOGS = 50 
 
+# 모든 테이블은 bot.db 하나에 둔다. (예전 economy.db 는 마이그레이션 2 에서 흡수)
+# 스키마 변경은 MIGRATIONS 에 새 버전을 추가하는 방식으로만 한다.
 DB_PATH = os.path.join(BASE_DIR, "bot.db")
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor() 
-
-# ---------- DB 스키마 ----------
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS rank_log_history(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        guild_id INTEGER,
-        log_data TEXT,
-        created_at TEXT
-    )"""
-)
-conn.commit() 
+db = Database(DB_PATH, on_write_error=lambda msg: add_error_log(msg))
+
+_applied = db.run_sync(apply_migrations, durable=True)
+if _applied:
+    print("[MIGRATION] applied:", _applied)
+
+
+economy_repo = EconomyRepo(db)
+user_repo = UserRepo(db)
+forced_verified_repo = ForcedVerifiedRepo(db)
+shop_item_repo = ShopItemRepo(db)
+command_log_repo = CommandLogRepo(db)
+rank_history_repo = RankHistoryRepo(db)
+current_rank_repo = CurrentRankRepo(db, rank_history_repo)
+
+
+# ---------- 백그라운드 루프 감독 ----------
+# tasks.loop 대신 쓰는 주기 작업. 루프마다 한 번에 한 틱만 돌고(single-flight),
+# 틱마다 마감 시간을 둔다. 앞 틱이 길어져 건너뛴 틱은 따라잡지 않고 개수만 센다.
+# 틱이 실패하면 백오프(최대 한 주기) 후 다시 돌리고, 루프 자체가 죽으면 되살린다.
+# 시작 시각에 지터를 줘서 여러 루프가 같은 순간에 몰리지 않게 한다.
+
+LOOP_BACKOFF_BASE = 5.0     # 초
+LOOP_BACKOFF_MAX = 300.0    # 초 (주기보다 길어지지는 않음)
+
+
+class SupervisedLoop:
+    def __init__(self, fn, name: str, interval: float, deadline: float, jitter: float):
+        self.fn = fn
+        self.name = name
+        self.interval = interval
+        self.deadline = deadline
+        self.jitter = jitter
+        self._before = None
+        self._task: Optional[asyncio.Task] = None
+        self.next_run: Optional[float] = None     # time.time() 기준
+        self.last_started: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0   # 마감 시간에 걸려 취소된 틱
+        self.skipped = 0    # 앞 틱이 아직 돌고 있어서 건너뛴 틱
+        self.missed = 0     # 이벤트 루프 지연/백오프 등으로 제때 못 깬 틱
+        self.restarts = 0
+        self._failures = 0
+
+    def before_loop(self, coro):
+        self._before = coro
+        return coro
+
+    def start(self) -> None:
+        if not self.is_running():
+            self._task = asyncio.create_task(self._supervise(), name=f"loop-{self.name}")
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """취소하고 실제로 끝날 때까지(최대 timeout 초) 기다립니다."""
+        self.cancel()
+        if self._task is not None and not self._task.done():
+            await asyncio.wait({self._task}, timeout=timeout)
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _backoff(self) -> float:
+        delay = min(LOOP_BACKOFF_MAX, LOOP_BACKOFF_BASE * (2 ** (self._failures - 1)))
+        return min(self.interval, delay) * random.uniform(0.8, 1.2)
+
+    async def _supervise(self) -> None:
+        if self._before is not None:
+            await self._before()
+        await self._sleep(random.uniform(0, self.jitter))
+        while True:
+            try:
+                await self._run_forever()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.restarts += 1
+                self._failures += 1
+                add_error_log(f"loop {self.name} 재시작: {repr(e)}")
+                await self._sleep(self._backoff())
+
+    async def _sleep(self, seconds: float) -> None:
+        self.next_run = time.time() + seconds
+        await asyncio.sleep(seconds)
+
+    async def _run_forever(self) -> None:
+        scheduled = time.monotonic()
+        while True:
+            late = time.monotonic() - scheduled
+            if late >= self.interval:
+                self.missed += int(late // self.interval)
+
+            started = time.monotonic()
+            self.last_started = time.time()
+            try:
+                await asyncio.wait_for(self.fn(), self.deadline)
+            except asyncio.TimeoutError:
+                self._fail(f"마감 {self.deadline:g}초 초과")
+                self.overruns += 1
+            except Exception as e:
+                self._fail(repr(e))
+            else:
+                self._failures = 0
+            finally:
+                self.runs += 1
+                self.last_duration = time.monotonic() - started
+
+            now = time.monotonic()
+            if self._failures:
+                # 실패하면 주기 대신 백오프 후 재시도하고, 일정은 거기서 다시 잡는다
+                delay = self._backoff()
+                scheduled = now + delay
+            else:
+                scheduled += self.interval
+                if scheduled <= now:
+                    behind = int((now - scheduled) // self.interval) + 1
+                    self.skipped += behind
+                    scheduled += behind * self.interval
+                delay = scheduled - now
+            await self._sleep(delay)
+
+    def _fail(self, error: str) -> None:
+        self.errors += 1
+        self._failures += 1
+        self.last_error = error
+        add_error_log(f"loop {self.name}: {error}")
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.is_running(),
+            "interval": self.interval,
+            "last_duration": self.last_duration,
+            "next_run": self.next_run,
+            "runs": self.runs,
+            "errors": self.errors,
+            "error_rate": self.errors / self.runs if self.runs else 0.0,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "missed": self.missed,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+        }
+
+
+supervised_loops: dict[str, SupervisedLoop] = {}
+
+
+def supervised_loop(
+    *,
+    seconds: float = 0,
+    minutes: float = 0,
+    hours: float = 0,
+    deadline: Optional[float] = None,
+    jitter: Optional[float] = None,
+):
+    """@tasks.loop 과 같은 모양으로 쓰는 감독 루프 데코레이터."""
+    interval = seconds + minutes * 60 + hours * 3600
+
+    def decorator(fn) -> SupervisedLoop:
+        loop = SupervisedLoop(
+            fn,
+            fn.__name__,
+            interval,
+            deadline if deadline is not None else interval,
+            jitter if jitter is not None else min(interval, 60.0) * 0.2,
+        )
+        supervised_loops[loop.name] = loop
+        return loop
+
+    return decorator
+
+
+# ---------- 경제 계정 캐시 (write-behind) ----------
+# 읽기/쓰기는 메모리의 EconomyRow 가 기준이다. 바뀐 계정만 ECONOMY_FLUSH_INTERVAL 마다
+# 한 번에 SQLite 로 내려보내고, 종료 시에도 flush 한다.
+# 잔액 확인과 차감은 await 없이 한 번에 처리하므로 이벤트 루프 안에서 원자적이다.
+# 돈의 이동은 모두 원장(LedgerEntry)으로 남기고, DB 잔액은 원장 delta 로만 바꾼다.
+# 같은 idempotency key 로 다시 들어온 요청은 아무것도 바꾸지 않는다.
+
+ECONOMY_FLUSH_INTERVAL = 5      # 초
+ECONOMY_CACHE_MAX = 50_000      # 넘으면 깨끗한(이미 저장된) 계정부터 내보냄
+LEDGER_KEY_CACHE = 10_000       # 최근 처리한 idempotency key 를 메모리에 기억하는 개수
+
+
+class LedgerSkip(str, Enum):
+    # 같은 idempotency key 가 이미 반영됨 — 역할 지급/응답 같은 부수 효과도 그쪽에서 끝났다
+    DUPLICATE = "duplicate"
+
+
+DUPLICATE = LedgerSkip.DUPLICATE
+
+
+class EconomyAccounts:
+    def __init__(self, repo: EconomyRepo, max_size: int = ECONOMY_CACHE_MAX):
+        self.repo = repo
+        self.max_size = max_size
+        self._accounts: OrderedDict[int, EconomyRow] = OrderedDict()
+        self._dirty: set[int] = set()
+        self._entries: list[LedgerEntry] = []
+        self._keys: OrderedDict[str, None] = OrderedDict()
+        # flush 는 한 번에 하나만 — 커밋 중인 계정을 다른 flush 의 _evict 가 내리지 않도록
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.duplicates = 0
+
+    async def get(self, user_id: int) -> EconomyRow:
+        account = self._accounts.get(user_id)
+        if account is not None:
+            self._accounts.move_to_end(user_id)
+            return account
+        loaded = await self.repo.get(user_id)
+        # 기다리는 동안 다른 코루틴이 먼저 올려놨으면 그쪽을 쓴다
+        account = self._accounts.get(user_id)
+        if account is None:
+            if loaded is None:
+                loaded = EconomyRow(user_id, 0, 0, 0, 1)
+                self._dirty.add(user_id)
+            account = self._accounts[user_id] = loaded
+        return account
+
+    async def _seen(self, key: Optional[str]) -> bool:
+        if key is None:
+            return False
+        if key in self._keys or await self.repo.has_entry(key):
+            self.duplicates += 1
+            return True
+        return False
 
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS senior_officer_settings(
-        guild_id INTEGER PRIMARY KEY,
-        senior_officer_role_id INTEGER
-    )"""
-)
-conn.commit() 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS blacklist(
-        guild_id INTEGER,
-        group_id INTEGER,
-        PRIMARY KEY(guild_id, group_id)
-    )"""
-)
-conn.commit() 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS rank_log_settings(
-        guild_id INTEGER PRIMARY KEY,
-        channel_id INTEGER,
-        enabled INTEGER DEFAULT 0
-    )"""
-)
-conn.commit() 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS forced_verified(
-        discord_id INTEGER,
-        guild_id INTEGER,
-        roblox_nick TEXT,
-        roblox_user_id INTEGER,
-        rank_role TEXT,
-        PRIMARY KEY(discord_id, guild_id)
-    )"""
-)
-conn.commit() 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS users(
-        discord_id INTEGER,
-        guild_id INTEGER,
-        roblox_nick TEXT,
-        roblox_user_id INTEGER,
-        code TEXT,
-        expire_time TEXT,
-        verified INTEGER DEFAULT 0,
-        PRIMARY KEY(discord_id, guild_id)
-    )"""
-) 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS stats(
-        guild_id INTEGER PRIMARY KEY,
-        verify_count INTEGER DEFAULT 0,
-        force_count INTEGER DEFAULT 0,
-        cancel_count INTEGER DEFAULT 0
-    )"""
-) 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS settings(
-        guild_id INTEGER PRIMARY KEY,
-        role_id INTEGER,
-        status_channel_id INTEGER,
-        admin_role_id TEXT
-    )"""
-) 
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS logchannels (
-    guildid   INTEGER,
-    logtype   TEXT,
-    channelid INTEGER,
-    PRIMARY KEY (guildid, logtype)
-)
-""")
-conn.commit() 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS officer_settings(
-        guild_id INTEGER PRIMARY KEY,
-        officer_role_id INTEGER
-    )"""
-)
-conn.commit() 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS group_settings(
-        guild_id INTEGER PRIMARY KEY,
-        group_id INTEGER
-    )"""
-) 
-
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS rollback_settings(
-        guild_id INTEGER PRIMARY KEY,
-        auto_rollback INTEGER DEFAULT 1
-    )"""
-)
-conn.commit()
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS shop_items(
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    guild_id INTEGER,
-    name TEXT,
-    price INTEGER,
-    type TEXT,          -- 'role', 'level', 'exp'
-    role_id INTEGER,    -- type='role' 일 때만 사용
-    level INTEGER,      -- type='level' 일 때만 사용
-    exp INTEGER         -- type='exp' 일 때만 사용
-)
-""")
-conn.commit()
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS command_logs(
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    guild_id INTEGER,
-    user_id INTEGER,
-    user_name TEXT,
-    command_name TEXT,
-    command_full TEXT,
-    created_at TEXT
-)
-""")
-conn.commit()
+    def _remember(self, key: Optional[str]) -> None:
+        if key is None:
+            return
+        self._keys[key] = None
+        if len(self._keys) > LEDGER_KEY_CACHE:
+            self._keys.popitem(last=False)
+
+    def _move(
+        self,
+        account: EconomyRow,
+        delta: int,
+        reason: str,
+        key: Optional[str],
+        guild_id: Optional[int],
+    ) -> None:
+        account.money += delta
+        self._dirty.add(account.user_id)
+        self._entries.append(
+            LedgerEntry(account.user_id, guild_id, delta, reason, key, datetime.now().isoformat())
+        )
+        self._remember(key)
+
+    async def add_money(
+        self,
+        user_id: int,
+        amount: int,
+        reason: str,
+        *,
+        key: Optional[str] = None,
+        guild_id: Optional[int] = None,
+    ) -> EconomyRow | LedgerSkip:
+        """돈을 더합니다. 이미 처리한 key 면 DUPLICATE."""
+        if await self._seen(key):
+            return DUPLICATE
+        account = await self.get(user_id)
+        self._move(account, amount, reason, key, guild_id)
+        return account
+
+    async def try_spend(
+        self,
+        user_id: int,
+        amount: int,
+        reason: str,
+        *,
+        add_exp: int = 0,
+        add_level: int = 0,
+        key: Optional[str] = None,
+        guild_id: Optional[int] = None,
+    ) -> Optional[EconomyRow] | LedgerSkip:
+        """잔액이 충분할 때만 차감(+보상 지급)합니다. 부족하면 None, 이미 처리한 key 면 DUPLICATE."""
+        if await self._seen(key):
+            return DUPLICATE
+        account = await self.get(user_id)
+        if account.money < amount:
+            return None
+        account.exp += add_exp
+        account.level += add_level
+        self._move(account, -amount, reason, key, guild_id)
+        return account
 
-conn.commit() 
+    async def claim_daily(
+        self,
+        user_id: int,
+        now: int,
+        reward: int,
+        cooldown: int = 86400,
+        *,
+        key: Optional[str] = None,
+        guild_id: Optional[int] = None,
+    ) -> int | LedgerSkip:
+        """보상을 지급하면 0, 아직 쿨다운이면 남은 초, 이미 처리한 key 면 DUPLICATE."""
+        if await self._seen(key):
+            return DUPLICATE
+        account = await self.get(user_id)
+        remain = cooldown - (now - account.last_daily)
+        if remain > 0:
+            return remain
+        account.last_daily = now
+        self._move(account, reward, "daily", key, guild_id)
+        return 0
+
+    async def add_xp(
+        self,
+        user_id: int,
+        gain: int,
+        guild_id: Optional[int] = None,
+    ) -> tuple[EconomyRow, int]:
+        """경험치를 더하고, 레벨업이면 보상까지 지급합니다. (메모리만 건드림)"""
+        account = await self.get(user_id)
+        account.exp += gain
+        self._dirty.add(user_id)
+        reward = 0
+        need = 50 + (account.level * 25)
+        if account.exp >= need:
+            account.level += 1
+            account.exp -= need
+            reward = account.level * 50
+            self._move(account, reward, "level_up", f"level_up:{user_id}:{account.level}", guild_id)
+        return account, reward
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            return await self._flush()
+
+    async def _flush(self) -> int:
+        if not self._dirty and not self._entries:
+            return 0
+        ids, self._dirty = self._dirty, set()
+        entries, self._entries = self._entries, []
+        rows = [
+            EconomyRow(a.user_id, a.money, a.last_daily, a.exp, a.level)
+            for a in (self._accounts.get(i) for i in ids)
+            if a is not None
+        ]
+        try:
+            # 돈이 움직였으면 durable 로 커밋
+            rejected = await self.repo.commit_batch(entries, rows, durable=bool(entries))
+        except Exception:
+            # 다음 주기에 다시 시도
+            self._dirty |= ids
+            self._entries[:0] = entries
+            raise
+        for user_id, delta in rejected:
+            # 메모리 잔액과 DB 가 어긋났다는 뜻. 그 유저의 원장 항목도 함께 되돌려졌다
+            add_error_log(f"economy_flush: 잔액 부족으로 반영 거절 user={user_id} delta={delta}")
+        if rejected:
+            await self._reload_money({user_id for user_id, _ in rejected})
+        self.flushes += 1
+        self._evict()
+        return len(rows)
+
+    async def _reload_money(self, user_ids: set[int]) -> None:
+        """거절된 계정의 메모리 잔액을 DB 잔액 + 아직 안 내려간 원장 delta 로 다시 맞춥니다."""
+        for user_id in user_ids:
+            row = await self.repo.get(user_id)
+            account = self._accounts.get(user_id)
+            if row is None or account is None:
+                continue
+            # 읽는 동안 쌓인 이동은 다음 flush 에 반영되므로 더해 둔다
+            pending = sum(e.delta for e in self._entries if e.user_id == user_id)
+            account.money = row.money + pending
+
+    def _evict(self) -> None:
+        excess = len(self._accounts) - self.max_size
+        if excess <= 0:
+            return
+        for user_id in list(self._accounts):
+            if excess <= 0:
+                break
+            if user_id not in self._dirty:
+                del self._accounts[user_id]
+                excess -= 1
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._accounts),
+            "dirty": len(self._dirty),
+            "ledger_pending": len(self._entries),
+            "duplicates": self.duplicates,
+            "flushes": self.flushes,
+        }
+
+
+economy_accounts = EconomyAccounts(economy_repo)
+
+
+def run_rebuild_balances() -> int:
+    """`python bot.py --rebuild-balances` — 봇이 꺼져 있을 때 잔액을 원장 합계로 다시 맞춥니다."""
+    changed = db.run_sync(lambda c: c.execute(EconomyRepo.SQL_REBUILD).rowcount, durable=True)
+    print(f"[LEDGER] 원장 기준으로 {changed}명 잔액 재계산")
+    db.close()
+    return 0
+
+
+@supervised_loop(seconds=ECONOMY_FLUSH_INTERVAL, deadline=30)
+async def economy_flush_task():
+    # 마감에 걸려도 이미 꺼낸 원장/계정은 끝까지 저장한다
+    await asyncio.shield(economy_accounts.flush())
+
+
+# ---------- 인증 상태 인덱스 ----------
+# users(verified=1) + forced_verified + legacy_verified 를 메모리에 들고 있는 인덱스.
+# 인증 여부 판단은 여기서만 하고, 웹 API는 send_log_to_web 으로 복제만 받는다.
+# 예전 버튼 인증은 웹 인증 로그에만 남아 있으므로, legacy_backfill_task 가 길드마다 한 번
+# 웹 인증 로그 전체를 페이지 단위로 읽어 legacy_verified 에 옮긴다. (명령 처리 중에는 HTTP 없음)
+# 이후 인증은 전부 인덱스에 들어온다.
+
+LEGACY_VERIFY_URL = f"{API_BASE}/api/logs/verify"
+LEGACY_BACKFILL_PAGE = 500
+LEGACY_BACKFILL_MAX_PAGES = 200
+
+
+async def _fetch_verify_log_page(guild_id: int, offset: int) -> list[dict]:
+    async with web_api_breaker.guard():
+        async with http_request(
+            "GET",
+            LEGACY_VERIFY_URL,
+            params={"guild_id": guild_id, "limit": LEGACY_BACKFILL_PAGE, "offset": offset},
+            timeout=aiohttp.ClientTimeout(total=15),
+        ) as resp:
+            if resp.status != 200:
+                raise UpstreamHTTPError(resp.status, await resp.text())
+            return await resp.json()
+
+
+async def _read_legacy_verified(guild_id: int) -> set[int]:
+    """웹 인증 로그에 한 번이라도 나온 멤버 id 전체"""
+    found: set[int] = set()
+    for page in range(LEGACY_BACKFILL_MAX_PAGES):
+        items = await _fetch_verify_log_page(guild_id, page * LEGACY_BACKFILL_PAGE)
+        before = len(found)
+        found.update(int(item["user_id"]) for item in items if item.get("user_id"))
+        # 마지막 페이지이거나, offset 을 무시하고 같은 페이지를 돌려주는 경우 멈춘다
+        if len(items) < LEGACY_BACKFILL_PAGE or len(found) == before:
+            return found
+    add_error_log(f"legacy_backfill {guild_id}: {LEGACY_BACKFILL_MAX_PAGES} 페이지에서 중단")
+    return found
+
+
+class VerifiedIndex:
+    def __init__(self):
+        self._by_guild: dict[int, set[int]] = {}
+        self._backfilled: set[int] = set()
+
+    def load(self) -> None:
+        by_guild: dict[int, set[int]] = {}
+        for guild_id, discord_id in user_repo.all_verified_sync():
+            by_guild.setdefault(guild_id, set()).add(discord_id)
+        self._by_guild = by_guild
+        self._backfilled = set(user_repo.legacy_backfilled_sync())
+
+    def backfilled(self, guild_id: int) -> bool:
+        """예전 인증 기록까지 인덱스에 들어와 있는지"""
+        return guild_id in self._backfilled
+
+    async def backfill(self, guild_id: int) -> int:
+        """웹 인증 로그를 한 번 다 읽어 legacy_verified 와 인덱스에 넣습니다. 새로 들어온 인원 수."""
+        if guild_id in self._backfilled:
+            return 0
+        found = await _read_legacy_verified(guild_id)
+        await user_repo.save_legacy_backfill(guild_id, found)
+        members = self._by_guild.setdefault(guild_id, set())
+        added = len(found - members)
+        members |= found
+        self._backfilled.add(guild_id)
+        return added
+
+    def is_verified(self, guild_id: int, discord_id: int) -> bool:
+        members = self._by_guild.get(guild_id)
+        return members is not None and discord_id in members
+
+    def members_of(self, guild_id: int) -> set[int]:
+        return self._by_guild.get(guild_id, set())
+
+    def mark(self, guild_id: int, discord_id: int) -> None:
+        self._by_guild.setdefault(guild_id, set()).add(discord_id)
+
+    async def refresh(self, guild_id: int, discord_id: int) -> None:
+        """DB 기준으로 한 명의 인증 여부를 다시 맞춥니다. (삭제 후 호출)"""
+        if await user_repo.is_verified(guild_id, discord_id):
+            self.mark(guild_id, discord_id)
+        else:
+            self.members_of(guild_id).discard(discord_id)
+
+
+verified_index = VerifiedIndex()
+verified_index.load()
+
+
+def is_already_verified(guild_id: int, user_id: int) -> bool:
+    return verified_index.is_verified(guild_id, user_id)
+
+
+@supervised_loop(minutes=30, deadline=600)
+async def legacy_backfill_task():
+    """아직 예전 인증 기록을 안 읽어 온 길드만 처리 (실패한 길드는 다음 주기에 다시)"""
+    for guild in bot.guilds:
+        if verified_index.backfilled(guild.id):
+            continue
+        try:
+            added = await verified_index.backfill(guild.id)
+        except Exception as e:
+            add_error_log(f"legacy_backfill {guild.id}: {repr(e)}")
+        else:
+            print(f"[LEGACY_BACKFILL] {guild.name} ({guild.id}): {added}명 추가")
+
+
+@legacy_backfill_task.before_loop
+async def before_legacy_backfill_task():
+    await bot.wait_until_ready()
+
+
+async def record_verification(
+    guild_id: int,
+    discord_id: int,
+    roblox_nick: str,
+    roblox_user_id: int,
+    code: str,
+) -> None:
+    """인증 완료를 users 테이블과 인덱스에 반영합니다."""
+    await user_repo.upsert_verified(guild_id, discord_id, roblox_nick, roblox_user_id, code)
+    verified_index.mark(guild_id, discord_id)
+    invalidate_roblox_identity(roblox_nick, roblox_user_id)
 
 # ---------- 설정/권한 유틸 ---------- 
 
+# ---------- 길드 설정 스냅샷 ----------
+# 설정 테이블(settings, logchannels, officer/senior/group/rollback/rank_log, blacklist)을
+# 시작 시 한 번 읽어 메모리에 들고 있는다. 권한/로그 채널 조회는 I/O 없이 여기서 끝난다.
+# set_* 은 DB 쓰기가 커밋된 뒤에만 새 GuildConfig 로 통째로 교체(원자적)한다.
+# rank_log_settings/rollback_settings 처럼 봇 밖(웹 대시보드)에서 바뀌는 설정은
+# guild_config_reload_task 가 GUILD_CONFIG_RELOAD_INTERVAL 마다 다시 읽어 반영한다.
+
+GUILD_CONFIG_RELOAD_INTERVAL = 60   # 초
+
+@dataclass(slots=True, frozen=True)
+class GuildConfig:
+    guild_id: int
+    version: int = 0
+    role_id: Optional[int] = None
+    admin_role_ids: tuple[int, ...] = ()
+    officer_role_id: Optional[int] = None
+    senior_officer_role_id: Optional[int] = None
+    group_id: Optional[int] = None
+    log_channels: dict[str, int] = field(default_factory=dict)
+    blacklist_groups: frozenset[int] = frozenset()
+    rank_log_channel_id: Optional[int] = None
+    rank_log_enabled: bool = False
+    auto_rollback: bool = True
+
+
+def _parse_admin_role_ids(raw) -> tuple[int, ...]:
+    if not raw:
+        return ()
+    try:
+        if isinstance(raw, str):
+            return tuple(map(int, json.loads(raw)))
+        return (int(raw),)
+    except Exception:
+        return ()
+
+
+class GuildConfigStore:
+    def __init__(self):
+        self._configs: dict[int, GuildConfig] = {}
+        self.version = 0
+
+    def load(self) -> None:
+        self._swap(self._read(), since=None)
+
+    async def reload(self) -> None:
+        """DB 를 다시 읽어 스냅샷을 교체합니다. 읽는 동안 update() 된 길드는 그대로 둡니다."""
+        since = self.version
+        self._swap(await asyncio.to_thread(self._read), since=since)
+
+    def _read(self) -> dict[int, dict]:
+        fields: dict[int, dict] = {}
+
+        def put(guild_id: int, **values) -> None:
+            fields.setdefault(guild_id, {}).update(values)
+
+        for guild_id, role_id, admin_raw in db.fetchall_sync(
+            "SELECT guild_id, role_id, admin_role_id FROM settings"
+        ):
+            put(guild_id, role_id=role_id, admin_role_ids=_parse_admin_role_ids(admin_raw))
+        for guild_id, role_id in db.fetchall_sync("SELECT guild_id, officer_role_id FROM officer_settings"):
+            put(guild_id, officer_role_id=role_id)
+        for guild_id, role_id in db.fetchall_sync(
+            "SELECT guild_id, senior_officer_role_id FROM senior_officer_settings"
+        ):
+            put(guild_id, senior_officer_role_id=role_id)
+        for guild_id, group_id in db.fetchall_sync("SELECT guild_id, group_id FROM group_settings"):
+            put(guild_id, group_id=group_id)
+        for guild_id, auto_rollback in db.fetchall_sync("SELECT guild_id, auto_rollback FROM rollback_settings"):
+            put(guild_id, auto_rollback=auto_rollback == 1)
+        for guild_id, channel_id, enabled in db.fetchall_sync(
+            "SELECT guild_id, channel_id, enabled FROM rank_log_settings"
+        ):
+            put(guild_id, rank_log_channel_id=channel_id, rank_log_enabled=enabled == 1)
+
+        log_channels: dict[int, dict[str, int]] = {}
+        for guild_id, log_type, channel_id in db.fetchall_sync(
+            "SELECT guildid, logtype, channelid FROM logchannels"
+        ):
+            log_channels.setdefault(guild_id, {})[log_type] = channel_id
+        blacklist: dict[int, set[int]] = {}
+        for guild_id, group_id in db.fetchall_sync("SELECT guild_id, group_id FROM blacklist"):
+            blacklist.setdefault(guild_id, set()).add(group_id)
+
+        for guild_id in set(log_channels) | set(blacklist):
+            put(
+                guild_id,
+                log_channels=log_channels.get(guild_id, {}),
+                blacklist_groups=frozenset(blacklist.get(guild_id, ())),
+            )
+        return fields
+
+    def _swap(self, fields: dict[int, dict], since: Optional[int]) -> None:
+        self.version += 1
+        configs = {
+            guild_id: GuildConfig(guild_id=guild_id, version=self.version, **values)
+            for guild_id, values in fields.items()
+        }
+        if since is not None:
+            # 다시 읽는 도중에 커밋된 변경은 읽은 값보다 새로울 수 있다
+            for guild_id, config in self._configs.items():
+                if config.version > since:
+                    configs[guild_id] = config
+        self._configs = configs
+
+    def get(self, guild_id: int) -> GuildConfig:
+        config = self._configs.get(guild_id)
+        return config if config is not None else GuildConfig(guild_id)
+
+    async def save(self, guild_id: int, sql: str, params: tuple, **changes) -> GuildConfig:
+        """sql 이 커밋된 뒤에 설정 일부를 바꾼 새 스냅샷으로 교체합니다. (실패하면 그대로 예외)"""
+        await db.execute(sql, params)
+        return self.update(guild_id, **changes)
+
+    def update(self, guild_id: int, **changes) -> GuildConfig:
+        """설정 일부를 바꾼 새 스냅샷으로 교체합니다."""
+        self.version += 1
+        config = replace(self.get(guild_id), version=self.version, **changes)
+        self._configs[guild_id] = config
+        return config
+
+    def rank_log_targets(self) -> list[tuple[int, Optional[int]]]:
+        return [
+            (c.guild_id, c.rank_log_channel_id)
+            for c in self._configs.values()
+            if c.rank_log_enabled
+        ]
+
+
+guild_configs = GuildConfigStore()
+guild_configs.load()
+
+
+@supervised_loop(seconds=GUILD_CONFIG_RELOAD_INTERVAL, deadline=30)
+async def guild_config_reload_task():
+    await guild_configs.reload()
+
 class CommandLogView(View):
     def __init__(self, pages: list[str]):
         super().__init__(timeout=60)
@@ -315,17 +1151,16 @@ class CommandLogView(View):
         await self.update(interaction)
 
 def get_senior_officer_role_id(guild_id: int) -> Optional[int]:
-    cursor.execute("SELECT senior_officer_role_id FROM senior_officer_settings WHERE guild_id=?", (guild_id,))
-    row = cursor.fetchone()
-    return row[0] if row else None 
+    return guild_configs.get(guild_id).senior_officer_role_id 
 
-def set_senior_officer_role_id(guild_id: int, role_id: int) -> None:
-    cursor.execute(
+async def set_senior_officer_role_id(guild_id: int, role_id: int) -> None:
+    await guild_configs.save(
+        guild_id,
         """INSERT OR REPLACE INTO senior_officer_settings(guild_id, senior_officer_role_id)
            VALUES(?, ?)""",
         (guild_id, role_id),
-    )
-    conn.commit() 
+        senior_officer_role_id=role_id,
+    ) 
 
 def check_is_officer(rank_num: int, rank_name: str) -> tuple[bool, bool]:
     """위관급, 영관급 여부 체크 - (is_junior_officer, is_senior_officer)"""
@@ -366,34 +1201,34 @@ def save_verification_log(discord_nick: str, roblox_nick: str):
     except Exception as e:
         print(f"로그 저장 실패: {e}") 
 
-def set_guild_group_id(guild_id: int, group_id: int) -> None:
-    cursor.execute(
+async def set_guild_group_id(guild_id: int, group_id: int) -> None:
+    await guild_configs.save(
+        guild_id,
         """
         INSERT INTO group_settings(guild_id, group_id)
         VALUES(?, ?)
         ON CONFLICT(guild_id) DO UPDATE SET group_id=excluded.group_id
         """,
         (guild_id, group_id),
+        group_id=group_id,
     )
-    conn.commit()
 
 
 def get_guild_role_id(guild_id: int) -> Optional[int]:
-    cursor.execute("SELECT role_id FROM settings WHERE guild_id=?", (guild_id,))
-    row = cursor.fetchone()
-    return row[0] if row else None
+    return guild_configs.get(guild_id).role_id
 
 
-def set_guild_role_id(guild_id: int, role_id: int) -> None:
-    cursor.execute(
+async def set_guild_role_id(guild_id: int, role_id: int) -> None:
+    await guild_configs.save(
+        guild_id,
         """
         INSERT INTO settings(guild_id, role_id)
         VALUES(?, ?)
         ON CONFLICT(guild_id) DO UPDATE SET role_id=excluded.role_id
         """,
         (guild_id, role_id),
+        role_id=role_id,
     )
-    conn.commit()
 
 async def send_admin_log(
     guild: discord.Guild,
@@ -418,60 +1253,41 @@ async def send_admin_log(
     embed.set_footer(text="관리자 로그")
     await channel.send(embed=embed)
 
-def set_log_channel(guild_id: int, log_type: str, channel_id: int | None):
+async def set_log_channel(guild_id: int, log_type: str, channel_id: int | None):
+    log_channels = dict(guild_configs.get(guild_id).log_channels)
     if channel_id is None:
-        cursor.execute(
-            "DELETE FROM logchannels WHERE guildid=? AND logtype=?",
-            (guild_id, log_type),
-        )
+        log_channels.pop(log_type, None)
+        sql = "DELETE FROM logchannels WHERE guildid=? AND logtype=?"
+        params = (guild_id, log_type)
     else:
-        cursor.execute(
-            """
+        log_channels[log_type] = channel_id
+        sql = """
             INSERT INTO logchannels(guildid, logtype, channelid)
             VALUES (?, ?, ?)
             ON CONFLICT(guildid, logtype)
             DO UPDATE SET channelid=excluded.channelid
-            """,
-            (guild_id, log_type, channel_id),
-        )
-    conn.commit() 
+            """
+        params = (guild_id, log_type, channel_id)
+    await guild_configs.save(guild_id, sql, params, log_channels=log_channels) 
 
 def get_log_channel(guild_id: int, log_type: str) -> int | None:
-    cursor.execute(
-        "SELECT channelid FROM logchannels WHERE guildid=? AND logtype=?",
-        (guild_id, log_type),
-    )
-    row = cursor.fetchone()
-    return row[0] if row else None 
+    return guild_configs.get(guild_id).log_channels.get(log_type) 
 
 def get_guild_admin_role_ids(guild_id: int) -> list[int]:
-    cursor.execute("SELECT admin_role_id FROM settings WHERE guild_id=?", (guild_id,))
-    row = cursor.fetchone()
-    if not row or not row[0]:
-        return []
-    try:
-        import json 
+    return list(guild_configs.get(guild_id).admin_role_ids)
 
-        if isinstance(row[0], str):
-            return list(map(int, json.loads(row[0])))
-        return [int(row[0])]
-    except Exception:
-        return []
 
-
-def set_guild_admin_role_ids(guild_id: int, role_ids: list[int]) -> None:
-    import json 
-
-    value = json.dumps(role_ids)
-    cursor.execute(
+async def set_guild_admin_role_ids(guild_id: int, role_ids: list[int]) -> None:
+    await guild_configs.save(
+        guild_id,
         """
         INSERT INTO settings(guild_id, admin_role_id)
         VALUES(?, ?)
         ON CONFLICT(guild_id) DO UPDATE SET admin_role_id=excluded.admin_role_id
         """,
-        (guild_id, value),
+        (guild_id, json.dumps(role_ids)),
+        admin_role_ids=tuple(int(r) for r in role_ids),
     )
-    conn.commit()
 
 
 def is_owner(user: discord.abc.User | discord.Member) -> bool:
@@ -480,6 +1296,10 @@ def is_owner(user: discord.abc.User | discord.Member) -> bool:
     return int(user.id) == int(OWNER_ID)
 
 
+def is_developer(user: discord.abc.User | discord.Member) -> bool:
+    return is_owner(user) or int(user.id) == int(DEVELOPER_ID)
+
+
 def is_admin(member: discord.Member) -> bool:
     # 1) 제작자
     if is_owner(member):
@@ -497,7 +1317,7 @@ def is_admin(member: discord.Member) -> bool:
     if guild is None:
         return False 
 
-    admin_ids = get_guild_admin_role_ids(guild.id)
+    admin_ids = guild_configs.get(guild.id).admin_role_ids
     if not admin_ids:
         return False 
 
@@ -513,6 +1333,128 @@ def _rank_api_headers():
         "X-API-KEY": RANK_API_KEY,
     } 
 
+# ---------- 랭크 서버 클라이언트 ----------
+# 랭크 서버 호출은 전부 RankApiClient 를 거친다. (이벤트 루프를 막지 않음)
+
+RANK_API_TIMEOUTS: dict[str, float] = {
+    "rank": 15,
+    "roles": 15,
+    "bulk-status": 30,
+    "bulk-role": 120,
+    "rollback-bulk": 10,   # 자동 롤백의 bulk 복구 — 늦으면 바로 개별 /rank 로 넘어간다
+}
+
+
+@dataclass(slots=True)
+class RankRole:
+    id: int
+    name: str
+    rank: int
+
+    @classmethod
+    def from_json(cls, data: dict | None) -> Optional["RankRole"]:
+        if not data:
+            return None
+        return cls(
+            id=data.get("id", 0),
+            name=data.get("name", "?"),
+            rank=data.get("rank", 0),
+        )
+
+
+def format_rank(role: Optional[RankRole]) -> str:
+    if role is None:
+        return "? (Rank ?)"
+    return f"{role.name} (Rank {role.rank})"
+
+
+@dataclass(slots=True)
+class RankChangeResult:
+    username: str
+    new_role: Optional[RankRole]
+    old_role: Optional[RankRole]
+
+
+@dataclass(slots=True)
+class RankStatus:
+    username: str
+    success: bool
+    role: Optional[RankRole] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> "RankStatus":
+        return cls(
+            username=data.get("username", ""),
+            success=bool(data.get("success")),
+            role=RankRole.from_json(data.get("role") or data.get("newRole")),
+            error=data.get("error"),
+        )
+
+
+class RankApiError(UpstreamHTTPError):
+    """랭크 서버가 200 이외의 상태 코드를 돌려준 경우"""
+
+
+class RankApiClient:
+    def __init__(self, base_url: str, api_key: Optional[str], timeouts: dict[str, float] | None = None):
+        self.base_url = base_url.rstrip("/") if base_url else base_url
+        self.api_key = api_key
+        self.timeouts = {**RANK_API_TIMEOUTS, **(timeouts or {})}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.base_url and self.api_key)
+
+    async def _request(self, method: str, path: str, timeout_key: str, payload: dict | None = None):
+        async with rank_api_breaker.guard():
+            async with http_request(
+                method,
+                f"{self.base_url}{path}",
+                json=payload,
+                headers={"X-API-KEY": self.api_key or ""},
+                timeout=aiohttp.ClientTimeout(total=self.timeouts[timeout_key]),
+            ) as resp:
+                text = await resp.text()
+                if resp.status != 200:
+                    raise RankApiError(resp.status, text)
+                return json.loads(text)
+
+    async def set_rank(self, username: str, rank: str | int) -> RankChangeResult:
+        data = await self._request("POST", "/rank", "rank", {"username": username, "rank": str(rank)})
+        return RankChangeResult(
+            username=data.get("username", username),
+            new_role=RankRole.from_json(data.get("newRole")),
+            old_role=RankRole.from_json(data.get("oldRole")),
+        )
+
+    async def get_roles(self) -> list[RankRole]:
+        data = await self._request("GET", "/roles", "roles")
+        return [RankRole.from_json(r) for r in data if r]
+
+    async def bulk_status(self, usernames: list[str]) -> list[RankStatus]:
+        data = await self._request("POST", "/bulk-status", "bulk-status", {"usernames": usernames})
+        return [RankStatus.from_json(r) for r in data.get("results", [])]
+
+    async def bulk_promote_to_role(
+        self, usernames: list[str], rank: str, timeout_key: str = "bulk-role"
+    ) -> list[RankStatus]:
+        data = await self._request(
+            "POST", "/bulk-promote-to-role", timeout_key, {"usernames": usernames, "rank": rank}
+        )
+        return [RankStatus.from_json(r) for r in data.get("results", [])]
+
+    async def bulk_demote_to_role(
+        self, usernames: list[str], rank: str, timeout_key: str = "bulk-role"
+    ) -> list[RankStatus]:
+        data = await self._request(
+            "POST", "/bulk-demote-to-role", timeout_key, {"usernames": usernames, "rank": rank}
+        )
+        return [RankStatus.from_json(r) for r in data.get("results", [])]
+
+
+rank_api = RankApiClient(RANK_API_URL_ROOT, RANK_API_KEY)
+
 def add_error_log(error_msg: str) -> None:
     error_logs.append({"timestamp": datetime.now(timezone.utc), "message": error_msg})
     if len(error_logs) > MAX_LOGS:
@@ -528,80 +1470,314 @@ ROBLOX_USERNAME_API = "https://users.roblox.com/v1/usernames/users"
 ROBLOX_USER_API = "https://users.roblox.com/v1/users/{userId}"
 
 
-async def roblox_get_user_id_by_username(username: str) -> Optional[int]:
-    payload = {"usernames": [username], "excludeBannedUsers": True}
-    async with aiohttp.ClientSession() as session:
+# ---------- Roblox 조회 캐시 ----------
+# username→userId, userId→그룹 목록을 종류별 TTL로 들고 있는 LRU 캐시.
+# "없음" 결과는 짧은 TTL로 따로 캐시해서 잘못된 닉네임을 반복 조회하지 않는다.
+
+ROBLOX_CACHE_MAX_ENTRIES = 10000
+ROBLOX_CACHE_TTLS: dict[str, float] = {
+    "user_id": 3600,   # username → userId
+    "groups": 300,     # userId → 그룹 ID 목록
+}
+ROBLOX_CACHE_NEGATIVE_TTL = 60
+
+_CACHE_MISS = object()
+
+
+class TTLCache:
+    def __init__(
+        self,
+        maxsize: int = ROBLOX_CACHE_MAX_ENTRIES,
+        ttls: dict[str, float] | None = None,
+        negative_ttl: float = ROBLOX_CACHE_NEGATIVE_TTL,
+    ):
+        self.maxsize = maxsize
+        self.ttls = dict(ttls or ROBLOX_CACHE_TTLS)
+        self.negative_ttl = negative_ttl
+        self._data: OrderedDict[tuple[str, object], tuple[float, object]] = OrderedDict()
+        self.hits: dict[str, int] = {kind: 0 for kind in self.ttls}
+        self.misses: dict[str, int] = {kind: 0 for kind in self.ttls}
+
+    def get(self, kind: str, key) -> object:
+        """값을 반환하고, 없거나 만료됐으면 _CACHE_MISS 를 반환합니다."""
+        entry = self._data.get((kind, key))
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end((kind, key))
+                self.hits[kind] = self.hits.get(kind, 0) + 1
+                return value
+            del self._data[(kind, key)]
+        self.misses[kind] = self.misses.get(kind, 0) + 1
+        return _CACHE_MISS
+
+    def set(self, kind: str, key, value, *, negative: bool = False) -> None:
+        ttl = self.negative_ttl if negative else self.ttls[kind]
+        self._data[(kind, key)] = (time.monotonic() + ttl, value)
+        self._data.move_to_end((kind, key))
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, kind: str, key) -> None:
+        self._data.pop((kind, key), None)
+
+    def stats(self) -> dict[str, tuple[int, int]]:
+        return {kind: (self.hits.get(kind, 0), self.misses.get(kind, 0)) for kind in self.ttls}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+roblox_cache = TTLCache()
+
+
+def invalidate_roblox_identity(roblox_nick: str | None, roblox_user_id: int | None) -> None:
+    if roblox_nick:
+        roblox_cache.invalidate("user_id", roblox_nick.lower())
+    if roblox_user_id:
+        roblox_cache.invalidate("groups", roblox_user_id)
+
+
+ROBLOX_USERNAME_BATCH_MAX = 100       # users API 한 번에 넣을 수 있는 최대 이름 수
+ROBLOX_USERNAME_BATCH_WINDOW = 0.05   # 이 시간(초) 안에 들어온 조회를 한 요청으로 합침
+
+
+class RobloxUsernameResolver:
+    """동시에 들어온 username→userId 조회를 모아 한 번의 POST로 처리합니다."""
+
+    def __init__(
+        self,
+        window: float = ROBLOX_USERNAME_BATCH_WINDOW,
+        max_batch: int = ROBLOX_USERNAME_BATCH_MAX,
+    ):
+        self.window = window
+        self.max_batch = max_batch
+        # 소문자 이름 -> (요청한 원래 이름, 기다리는 Future 목록)
+        self._pending: dict[str, tuple[str, list[asyncio.Future]]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def resolve(self, username: str) -> Optional[int]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        key = username.lower()
+        if key in self._pending:
+            self._pending[key][1].append(fut)
+        else:
+            self._pending[key] = (username, [fut])
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            keys = list(self._pending)[: self.max_batch]
+            batch = {k: self._pending.pop(k) for k in keys}
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: dict[str, tuple[str, list[asyncio.Future]]]) -> None:
+        ids: dict[str, int] = {}
+        payload = {
+            "usernames": [name for name, _ in batch.values()],
+            "excludeBannedUsers": True,
+        }
         try:
-            async with session.post(
+            async with http_request(
+                "POST",
                 ROBLOX_USERNAME_API,
                 json=payload,
                 timeout=aiohttp.ClientTimeout(total=10),
             ) as resp:
-                if resp.status != 200:
-                    return None
-                data = await resp.json()
-                results = data.get("data", [])
-                return results[0].get("id") if results else None
+                if resp.status == 200:
+                    data = await resp.json()
+                    for item in data.get("data", []):
+                        requested = item.get("requestedUsername") or item.get("name") or ""
+                        ids[requested.lower()] = item.get("id")
+                    # 정상 응답에서 빠진 이름은 존재하지 않는 계정 → 음성 캐시
+                    for key in batch:
+                        if ids.get(key):
+                            roblox_cache.set("user_id", key, ids[key])
+                        else:
+                            roblox_cache.set("user_id", key, None, negative=True)
         except Exception as e:
             add_error_log(f"roblox_get_user_id: {repr(e)}")
-            return None 
+
+        for key, (_, waiters) in batch.items():
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_result(ids.get(key))
+
+
+roblox_username_resolver = RobloxUsernameResolver()
+
+
+async def roblox_get_user_id_by_username(username: str) -> Optional[int]:
+    cached = roblox_cache.get("user_id", username.lower())
+    if cached is not _CACHE_MISS:
+        return cached
+    return await roblox_username_resolver.resolve(username)
 
 async def roblox_get_user_groups(user_id: int) -> list[int]:
     """사용자가 속한 Roblox 그룹 ID 목록을 반환합니다."""
+    cached = roblox_cache.get("groups", user_id)
+    if cached is not _CACHE_MISS:
+        return list(cached)
+
     url = f"https://groups.roblox.com/v2/users/{user_id}/groups/roles"
-    async with aiohttp.ClientSession() as session:
+    try:
+        async with http_request(
+            "GET", url, timeout=aiohttp.ClientTimeout(total=10)
+        ) as resp:
+            if resp.status != 200:
+                print(
+                    f"DEBUG: Roblox API error for user {user_id}: "
+                    f"status {resp.status}"
+                )
+                return [] 
+
+            data = await resp.json()
+            print(f"DEBUG: Roblox API response for {user_id}: {data}") 
+
+            groups = data.get("data", [])
+            group_ids = [
+                g.get("group", {}).get("id")
+                for g in groups
+                if g.get("group")
+            ]
+            print(f"DEBUG: Extracted group_ids: {group_ids}")
+            roblox_cache.set("groups", user_id, tuple(group_ids), negative=not group_ids)
+            return group_ids
+    except Exception as e:
+        add_error_log(f"roblox_get_user_groups: {repr(e)}")
+        print(f"DEBUG: Exception in roblox_get_user_groups: {e}")
+        return [] 
+
+# ---------- 재시도 / 헤징 ----------
+# 인증 버튼의 프로필 설명 조회는 일시 오류에 재시도(지터 백오프)하고,
+# 첫 요청이 평소 p90 지연을 넘기면 같은 요청을 하나 더 보내 먼저 온 응답을 쓴다.
+
+VERIFY_DESCRIPTION_DEADLINE = 8.0     # 버튼 한 번당 전체 허용 시간(초)
+VERIFY_DESCRIPTION_ATTEMPTS = 3
+VERIFY_RETRY_BASE_DELAY = 0.3
+VERIFY_RETRY_MAX_DELAY = 2.0
+VERIFY_HEDGE_PERCENTILE = 0.9
+
+
+class LatencyTracker:
+    def __init__(self, maxlen: int = 200, default: float = 1.5, min_samples: int = 20):
+        self.samples: deque[float] = deque(maxlen=maxlen)
+        self.default = default
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        if len(self.samples) < self.min_samples:
+            return self.default
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    if isinstance(exc, UpstreamHTTPError):
+        return exc.status == 429 or exc.status >= 500
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+async def hedged_call(factory, hedge_after: float):
+    """factory() 를 실행하고, hedge_after 초 안에 끝나지 않으면 한 번 더 실행해 먼저 성공한 결과를 반환합니다."""
+    first = asyncio.ensure_future(factory())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            tasks.add(asyncio.ensure_future(factory()))
+
+        error: BaseException | None = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_with_retry(
+    factory,
+    *,
+    attempts: int,
+    base_delay: float,
+    max_delay: float,
+    retryable=is_transient_error,
+):
+    for attempt in range(1, attempts + 1):
         try:
-            async with session.get(
-                url, timeout=aiohttp.ClientTimeout(total=10)
-            ) as resp:
-                if resp.status != 200:
-                    print(
-                        f"DEBUG: Roblox API error for user {user_id}: "
-                        f"status {resp.status}"
-                    )
-                    return [] 
-
-                data = await resp.json()
-                print(f"DEBUG: Roblox API response for {user_id}: {data}") 
-
-                groups = data.get("data", [])
-                group_ids = [
-                    g.get("group", {}).get("id")
-                    for g in groups
-                    if g.get("group")
-                ]
-                print(f"DEBUG: Extracted group_ids: {group_ids}")
-                return group_ids
+            return await factory()
         except Exception as e:
-            add_error_log(f"roblox_get_user_groups: {repr(e)}")
-            print(f"DEBUG: Exception in roblox_get_user_groups: {e}")
-            return [] 
+            if attempt == attempts or not retryable(e):
+                raise
+            # full jitter
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1))))
+
+
+description_latency = LatencyTracker()
+
 
-async def roblox_get_description_by_user_id(user_id: int) -> Optional[str]:
+async def _fetch_roblox_description(user_id: int) -> str:
     url = ROBLOX_USER_API.format(userId=user_id)
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                if resp.status != 200:
-                    return None
-                data = await resp.json()
-                return data.get("description")
-        except Exception as e:
-            add_error_log(f"roblox_get_description: {repr(e)}")
-            return None
+    started = time.monotonic()
+    async with http_request("GET", url, timeout=aiohttp.ClientTimeout(total=5)) as resp:
+        if resp.status != 200:
+            raise UpstreamHTTPError(resp.status, await resp.text())
+        data = await resp.json()
+    description_latency.observe(time.monotonic() - started)
+    return data.get("description") or ""
+
+
+async def roblox_get_description_by_user_id(
+    user_id: int,
+    deadline: float = VERIFY_DESCRIPTION_DEADLINE,
+) -> Optional[str]:
+    try:
+        async with asyncio.timeout(deadline):
+            return await call_with_retry(
+                lambda: hedged_call(
+                    lambda: _fetch_roblox_description(user_id),
+                    description_latency.percentile(VERIFY_HEDGE_PERCENTILE),
+                ),
+                attempts=VERIFY_DESCRIPTION_ATTEMPTS,
+                base_delay=VERIFY_RETRY_BASE_DELAY,
+                max_delay=VERIFY_RETRY_MAX_DELAY,
+            )
+    except Exception as e:
+        add_error_log(f"roblox_get_description: {repr(e)}")
+        return None
         
 def get_officer_role_id(guild_id: int) -> Optional[int]:
-    cursor.execute("SELECT officer_role_id FROM officer_settings WHERE guild_id=?", (guild_id,))
-    row = cursor.fetchone()
-    return row[0] if row else None 
+    return guild_configs.get(guild_id).officer_role_id 
 
-def set_officer_role_id(guild_id: int, role_id: int) -> None:
-    cursor.execute(
+async def set_officer_role_id(guild_id: int, role_id: int) -> None:
+    await guild_configs.save(
+        guild_id,
         """INSERT OR REPLACE INTO officer_settings(guild_id, officer_role_id)
            VALUES(?, ?)""",
         (guild_id, role_id),
+        officer_role_id=role_id,
     )
-    conn.commit()
 
 
 # ---------- 인증 View ---------- 
@@ -614,21 +1790,231 @@ class VerifyView(discord.ui.View):
         self.guild_id = guild_id 
 
 # ---------- View 클래스 ----------
-def send_log_to_web(guild_id: int, user_id: int, action: str, detail: str):
-    try:
-        resp = requests.post(
-            "https://web-api-production-69fc.up.railway.app/api/log",  # ← /api/log 로 변경
-            json={
-                "guild_id": guild_id,
-                "user_id": user_id,
-                "action": action,
-                "detail": detail,
-            },
-            timeout=5,
+# ---------- 웹 로그 전송 ----------
+# 감사 로그는 큐에 넣기만 하고, 백그라운드 태스크가 모아서 웹 API로 보낸다.
+# 웹 API가 죽어 있으면 bot.db 의 web_log_journal 에 쌓아 두었다가 복구 후 재전송.
+
+WEB_LOG_URL = f"{LOG_API_URL}/api/log"
+WEB_LOG_QUEUE_MAX = 5000
+WEB_LOG_BATCH_SIZE = 50
+WEB_LOG_FLUSH_INTERVAL = 2.0      # 배치가 다 안 차도 이 간격(초)마다 전송
+WEB_LOG_CONCURRENCY = 8
+WEB_LOG_RETRY_BASE = 1.0
+WEB_LOG_RETRY_MAX = 120.0
+
+
+class WebLogShipper:
+    def __init__(
+        self,
+        url: str,
+        *,
+        maxsize: int = WEB_LOG_QUEUE_MAX,
+        batch_size: int = WEB_LOG_BATCH_SIZE,
+        flush_interval: float = WEB_LOG_FLUSH_INTERVAL,
+    ):
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=maxsize)
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self._inflight: list[dict] = []   # 큐에서 꺼냈지만 아직 결과가 안 난 배치
+        self._failures = 0
+        self._retry_at = 0.0
+        self.sent = 0
+        self.spilled = 0
+        self.dropped = 0
+
+    # ----- 생산자 쪽 (이벤트 루프에서 즉시 반환) -----
+    def enqueue(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._spill([event])
+
+    # ----- 수명 주기 -----
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run(), name="web-log-shipper")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """남은 이벤트를 전송(실패 시 저널에 저장)하고 종료합니다."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self._closing = True
+        if self._task is not None:
+            # 지금 보내는 배치는 끝까지 보내게 두고, 시간이 넘으면 취소 (_run 이 저널로 옮김)
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            except Exception as e:
+                add_error_log(f"web_log_shipper: {repr(e)}")
+            self._task = None
+
+        pending = self._drain_nowait(self.queue.qsize())
+        if not pending:
+            return
+        try:
+            failed = await asyncio.wait_for(self._send_batch(pending), max(0.0, deadline - loop.time()))
+        except Exception:
+            failed = pending
+        self._spill(failed)
+
+    # ----- 내부 -----
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                batch = await self._collect_batch()
+                if batch:
+                    await self._ship(batch)
+                elif self._journal_ready() and not self._closing:
+                    await self._replay_journal()
+            except asyncio.CancelledError:
+                # 종료 중 취소: 꺼내 둔 이벤트는 버리지 않고 저널로 (중복 전송이 유실보다 낫다)
+                self._spill(self._inflight)
+                self._inflight = []
+                raise
+            except Exception as e:
+                add_error_log(f"web_log_shipper: {repr(e)}")
+                self._spill(self._inflight)
+            self._inflight = []
+
+    async def _collect_batch(self) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        batch: list[dict] = []
+        self._inflight = batch
+        while len(batch) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+            batch.extend(self._drain_nowait(self.batch_size - len(batch)))
+        return batch
+
+    def _drain_nowait(self, limit: int) -> list[dict]:
+        items: list[dict] = []
+        while len(items) < limit:
+            try:
+                items.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return items
+
+    def _journal_ready(self) -> bool:
+        return time.monotonic() >= self._retry_at
+
+    async def _ship(self, batch: list[dict]) -> None:
+        # 백오프 중이면 웹 API를 두드리지 않고 바로 저널로
+        if not self._journal_ready():
+            self._spill(batch)
+            self._inflight = []
+            return
+
+        failed = await self._send_batch(batch)
+        self._inflight = []
+        self._record_result(failed)
+        if failed:
+            self._spill(failed)
+        elif self._failures == 0:
+            await self._replay_journal()
+
+    async def _replay_journal(self) -> None:
+        rows = await db.fetchall(
+            "SELECT id, payload FROM web_log_journal ORDER BY id LIMIT ?",
+            (self.batch_size,),
         )
-        print("[WEB_LOG]", resp.status_code, resp.text)
-    except Exception as e:
-        print("[WEB_LOG_ERROR]", repr(e))
+        if not rows:
+            return
+
+        events = [json.loads(payload) for _, payload in rows]
+        failed = await self._send_batch(events)
+        self._record_result(failed)
+
+        # 일부만 실패해도 전달된 행은 지운다 (다음 재전송 때 중복으로 가지 않도록)
+        failed_ids = {id(e) for e in failed}
+        delivered = [(row_id,) for (row_id, _), e in zip(rows, events) if id(e) not in failed_ids]
+        if delivered:
+            await db.executemany("DELETE FROM web_log_journal WHERE id = ?", delivered)
+
+    def _record_result(self, failed: list[dict]) -> None:
+        if failed:
+            self._failures += 1
+            delay = min(WEB_LOG_RETRY_MAX, WEB_LOG_RETRY_BASE * (2 ** (self._failures - 1)))
+            self._retry_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+        else:
+            self._failures = 0
+            self._retry_at = 0.0
+
+    async def _send_batch(self, events: list[dict]) -> list[dict]:
+        """이벤트들을 전송하고 재시도가 필요한 이벤트 목록을 반환합니다."""
+        sem = asyncio.Semaphore(WEB_LOG_CONCURRENCY)
+
+        async def send_one(event: dict) -> bool:
+            async with sem:
+                try:
+                    async with web_api_breaker.guard():
+                        async with http_request(
+                            "POST",
+                            self.url,
+                            json=event,
+                            timeout=aiohttp.ClientTimeout(total=5),
+                        ) as resp:
+                            if resp.status >= 300:
+                                raise UpstreamHTTPError(resp.status, await resp.text())
+                    self.sent += 1
+                    return True
+                except CircuitOpenError:
+                    return False
+                except UpstreamHTTPError as e:
+                    if e.status == 429 or e.status >= 500:
+                        return False
+                    # 4xx 는 재시도해도 같은 결과라 버린다
+                    self.dropped += 1
+                    print("[WEB_LOG]", e.status, e.text)
+                    return True
+                except Exception as e:
+                    print("[WEB_LOG_ERROR]", repr(e))
+                    return False
+
+        results = await asyncio.gather(*(send_one(e) for e in events))
+        return [e for e, ok in zip(events, results) if not ok]
+
+    def _spill(self, events: list[dict]) -> None:
+        if not events:
+            return
+        now = datetime.now().isoformat()
+        rows = [(json.dumps(e, ensure_ascii=False), now) for e in events]
+        self.spilled += len(events)
+        db.submit_fn(
+            lambda c: c.executemany(
+                "INSERT INTO web_log_journal(payload, created_at) VALUES(?, ?)",
+                rows,
+            )
+        ).add_done_callback(db.log_write_error)
+
+
+web_log_shipper = WebLogShipper(WEB_LOG_URL)
+
+
+def send_log_to_web(guild_id: int, user_id: int, action: str, detail: str):
+    web_log_shipper.enqueue(
+        {
+            "guild_id": guild_id,
+            "user_id": user_id,
+            "action": action,
+            "detail": detail,
+        }
+    )
 
 
 class VerifyView(discord.ui.View):
@@ -647,12 +2033,22 @@ class VerifyView(discord.ui.View):
         self.roblox_nick = roblox_nick
         self.roblox_user_id = roblox_user_id
 
+    @staticmethod
+    async def _reply(interaction: discord.Interaction, message: str) -> None:
+        if interaction.response.is_done():
+            await interaction.followup.send(message, ephemeral=True)
+        else:
+            await interaction.response.send_message(message, ephemeral=True)
+
     @discord.ui.button(label="인증하기", style=discord.ButtonStyle.green)
     async def verifybutton(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction is None:
             return
 
         try:
+            # 3초 응답 제한 안에 먼저 defer 하고, 이후 응답은 전부 followup
+            await interaction.response.defer(ephemeral=True, thinking=True)
+
             # 0) 길드 확보
             guild: Optional[discord.Guild] = interaction.guild or bot.get_guild(self.guildid)
             if guild is None:
@@ -660,38 +2056,22 @@ class VerifyView(discord.ui.View):
                     f"[WEB_LOG_ERROR_VERIFY_BUTTON] guild is None, "
                     f"user={interaction.user} guild_id={self.guildid}"
                 )
-                if not interaction.response.is_done():
-                    await interaction.response.send_message(
-                        "길드를 찾을 수 없습니다. 서버에서 다시 /인증 해 주세요.",
-                        ephemeral=True,
-                    )
+                await self._reply(interaction, "길드를 찾을 수 없습니다. 서버에서 다시 /인증 해 주세요.")
                 return
 
             # 1) 만료 체크
             if datetime.now() > self.expiretime:
-                if not interaction.response.is_done():
-                    await interaction.response.send_message(
-                        "인증 코드가 만료되었습니다. 다시 /인증 명령을 사용해 주세요.",
-                        ephemeral=True,
-                    )
+                await self._reply(interaction, "인증 코드가 만료되었습니다. 다시 /인증 명령을 사용해 주세요.")
                 return
 
             # 2) Roblox 프로필 설명에서 코드 확인
             description = await roblox_get_description_by_user_id(self.roblox_user_id)
             if description is None:
-                if not interaction.response.is_done():
-                    await interaction.response.send_message(
-                        "Roblox 프로필 설명을 가져오지 못했습니다. 잠시 후 다시 시도해 주세요.",
-                        ephemeral=True,
-                    )
+                await self._reply(interaction, "Roblox 프로필 설명을 가져오지 못했습니다. 잠시 후 다시 시도해 주세요.")
                 return
 
             if self.code not in description:
-                if not interaction.response.is_done():
-                    await interaction.response.send_message(
-                        "Roblox 프로필 설명에 인증 코드가 없습니다. 설명에 코드를 넣고 다시 시도해 주세요.",
-                        ephemeral=True,
-                    )
+                await self._reply(interaction, "Roblox 프로필 설명에 인증 코드가 없습니다. 설명에 코드를 넣고 다시 시도해 주세요.")
                 return
 
             # 3) 역할 부여 + 관리자 로그
@@ -702,11 +2082,7 @@ class VerifyView(discord.ui.View):
 
             member = guild.get_member(interaction.user.id)
             if member is None:
-                if not interaction.response.is_done():
-                    await interaction.response.send_message(
-                        "서버에서 회원 정보를 찾을 수 없습니다.",
-                        ephemeral=True,
-                    )
+                await self._reply(interaction, "서버에서 회원 정보를 찾을 수 없습니다.")
                 return
 
             verify_role = guild.get_role(VERIFY_ROLE_ID)
@@ -714,20 +2090,12 @@ class VerifyView(discord.ui.View):
             log_channel = guild.get_channel(ADMIN_LOG_CHANNEL_ID)
 
             if verify_role is None:
-                if not interaction.response.is_done():
-                    await interaction.response.send_message(
-                        "인증 역할을 찾을 수 없습니다. 관리자에게 문의해 주세요.",
-                        ephemeral=True,
-                    )
+                await self._reply(interaction, "인증 역할을 찾을 수 없습니다. 관리자에게 문의해 주세요.")
                 return
 
             # 이미 인증된 경우 중복 방지
             if verify_role in member.roles:
-                if not interaction.response.is_done():
-                    await interaction.response.send_message(
-                        "이미 인증된 상태입니다.",
-                        ephemeral=True,
-                    )
+                await self._reply(interaction, "이미 인증된 상태입니다.")
                 return
 
             account_created = member.created_at.astimezone(KST).strftime("%Y-%m-%d %H:%M:%S")
@@ -833,7 +2201,14 @@ class VerifyView(discord.ui.View):
             except Exception as e:
                 print("[VERIFY_LOG_ERROR]", e)
 
-            # 6) 웹 로그
+            # 6) 로컬 인증 기록 + 웹 로그
+            await record_verification(
+                guild.id,
+                member.id,
+                self.roblox_nick,
+                self.roblox_user_id,
+                self.code,
+            )
             send_log_to_web(
                 guild_id=guild.id,
                 user_id=interaction.user.id,
@@ -861,17 +2236,12 @@ class VerifyView(discord.ui.View):
                 print("[VERIFY_SUCCESS_LOG_ERROR]", repr(e))
 
             # 8) 유저 응답
-            if not interaction.response.is_done():
-                await interaction.response.send_message("인증이 완료되었습니다!", ephemeral=True)
+            await self._reply(interaction, "인증이 완료되었습니다!")
 
         except Exception as e:
             add_error_log(f"verifybutton: {repr(e)}")
             print("[WEB_LOG_ERROR_VERIFY_BUTTON]", repr(e))
-            if not interaction.response.is_done():
-                await interaction.response.send_message(
-                    "인증 처리 중 오류가 발생했습니다. 잠시 후 다시 시도해 주세요.",
-                    ephemeral=True,
-                )
+            await self._reply(interaction, "인증 처리 중 오류가 발생했습니다. 잠시 후 다시 시도해 주세요.")
 
 
 # ---------- 클래스 ----------
@@ -1051,7 +2421,7 @@ async def verify(interaction: discord.Interaction, 로블닉: str):
 
     if is_already_verified(interaction.guild.id, interaction.user.id):
         await interaction.followup.send(
-            "이미 인증된 사용자입니다. (웹 로그 기준)",
+            "이미 인증된 사용자입니다. (인증 기록 기준)",
             ephemeral=True,
         )
         return
@@ -1065,11 +2435,7 @@ async def verify(interaction: discord.Interaction, 로블닉: str):
         return
     
 
-    cursor.execute(
-        "SELECT group_id FROM blacklist WHERE guild_id=?",
-        (interaction.guild.id,),
-    )
-    blacklist_groups = {row[0] for row in cursor.fetchall()}
+    blacklist_groups = guild_configs.get(interaction.guild.id).blacklist_groups
     if blacklist_groups:
         
 
@@ -1157,22 +2523,31 @@ async def bulk_force_verify(interaction: discord.Interaction):
     # 대상 멤버 (봇 제외)
     members: list[discord.Member] = [m for m in guild.members if not m.bot]
 
-    # 미인증자 필터 (웹 API 사용 안 함)
-    verified_ids: set[int] = set()
-    loop = asyncio.get_running_loop()
-
-    def _check_one(user_id: int) -> bool:
-        # is_already_verified가 웹 안 쓰도록 바꿨다면 그대로, 아니면 여기서 DB-only 버전 사용
-        return is_already_verified(guild.id, user_id)
+    # 미인증자 필터 (로컬 인증 인덱스 — 예전 인증 기록을 다 읽어 온 뒤에만)
+    if not verified_index.backfilled(guild.id):
+        await interaction.followup.send(
+            "예전 인증 기록을 아직 불러오는 중입니다. 잠시 후 다시 시도해 주세요.", ephemeral=True
+        )
+        return
+    verified_ids = verified_index.members_of(guild.id)
 
-    async def check_verified(m: discord.Member):
-        is_verified = await loop.run_in_executor(None, _check_one, m.id)
-        if is_verified:
-            verified_ids.add(m.id)
+    verify_role = guild.get_role(VERIFY_ROLE_ID)
+    unverify_role = guild.get_role(UNVERIFY_ROLE_ID)
 
-    await asyncio.gather(*(check_verified(m) for m in members))
+    targets = [
+        m for m in members
+        if m.id not in verified_ids and not (verify_role and verify_role in m.roles)
+    ]
 
-    targets = [m for m in members if m.id not in verified_ids]
+    # DB 기록은 멤버별 INSERT 대신 한 번에 (executemany, 커밋 1회)
+    try:
+        await forced_verified_repo.add_many(guild.id, [m.id for m in targets])
+    except Exception as e:
+        add_error_log(f"bulk_force_verify: {repr(e)}")
+        await interaction.followup.send(f"DB 기록 중 오류 발생: {e}", ephemeral=True)
+        return
+    for m in targets:
+        verified_index.mark(guild.id, m.id)
 
     total = len(targets)
     success = 0
@@ -1194,21 +2569,6 @@ async def bulk_force_verify(interaction: discord.Interaction):
 
     for idx, member in enumerate(targets, start=1):
         try:
-            verify_role = guild.get_role(VERIFY_ROLE_ID)
-            unverify_role = guild.get_role(UNVERIFY_ROLE_ID)
-
-            if verify_role and verify_role in member.roles:
-                continue
-
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO forced_verified(discord_id, guild_id, roblox_nick, roblox_user_id, rank_role)
-                VALUES(?, ?, ?, ?, ?)
-                """,
-                (member.id, guild.id, None, None, "forced")
-            )
-            conn.commit()
-
             if verify_role:
                 await member.add_roles(verify_role, reason="일괄 강제인증")
             if unverify_role and unverify_role in member.roles:
@@ -1246,7 +2606,7 @@ async def bulk_force_verify(interaction: discord.Interaction):
                 progress_msg = None
 
     # stats 업데이트
-    cursor.execute(
+    await db.execute(
         """
         INSERT INTO stats(guild_id, verify_count, force_count, cancel_count)
         VALUES(?, 0, ?, 0)
@@ -1254,7 +2614,6 @@ async def bulk_force_verify(interaction: discord.Interaction):
         """,
         (guild.id, success, success)
     )
-    conn.commit()
 
     result_text = (
         f"대상: {total}명\n"
@@ -1308,11 +2667,8 @@ async def force_unverify(
     unverify_role = guild.get_role(UNVERIFY_ROLE_ID)
 
     # DB에서 강제인증 기록 삭제
-    cursor.execute(
-        "DELETE FROM forced_verified WHERE discord_id = ? AND guild_id = ?",
-        (member.id, guild.id),
-    )
-    conn.commit()
+    await forced_verified_repo.delete(guild.id, member.id)
+    await verified_index.refresh(guild.id, member.id)
 
     # 역할 롤백
     try:
@@ -1334,7 +2690,7 @@ async def force_unverify(
     )
 
     # stats.cancel_count 증가
-    cursor.execute(
+    await db.execute(
         """
         INSERT INTO stats(guild_id, verify_count, force_count, cancel_count)
         VALUES(?, 0, 0, 1)
@@ -1342,7 +2698,6 @@ async def force_unverify(
         """,
         (guild.id,),
     )
-    conn.commit()
 
     await interaction.followup.send(
         f"{member.mention} 님의 강제인증을 해제했습니다.",
@@ -1407,12 +2762,7 @@ async def force_verify(interaction: discord.Interaction, user: discord.User, rob
         return 
 
     # users 테이블에 verified=1로 저장
-    cursor.execute(
-        """INSERT OR REPLACE INTO users(discord_id, guild_id, roblox_nick, roblox_user_id, code, expire_time, verified)
-           VALUES(?, ?, ?, ?, ?, ?, 1)""",
-        (user.id, interaction.guild.id, roblox_nick, user_id, "forced", datetime.now().isoformat()),
-    )
-    conn.commit() 
+    await record_verification(interaction.guild.id, user.id, roblox_nick, user_id, "forced") 
 
     # 강제인증 로그 기록
     try:
@@ -1434,22 +2784,15 @@ async def force_verify(interaction: discord.Interaction, user: discord.User, rob
 
     # 현재 랭크 조회 및 닉네임 변경
     try:
-        resp = requests.post(
-            f"{RANK_API_URL_ROOT}/bulk-status",
-            json={"usernames": [roblox_nick]},
-            headers=_rank_api_headers(),
-            timeout=15,
-        )
-        
         rank_name = "?"
         rank_num = 0
-        if resp.status_code == 200:
-            data = resp.json()
-            results = data.get("results", [])
-            if results and results[0].get("success"):
-                role_info = results[0].get("role", {})
-                rank_name = role_info.get("name", "?")
-                rank_num = role_info.get("rank", 0)
+        try:
+            statuses = await rank_api.bulk_status([roblox_nick])
+        except RankApiError:
+            statuses = []
+        if statuses and statuses[0].success and statuses[0].role:
+            rank_name = statuses[0].role.name
+            rank_num = statuses[0].role.rank
 
         is_junior, is_senior = check_is_officer(rank_num, rank_name)
         
@@ -1508,23 +2851,21 @@ async def view_verification_log(interaction: discord.Interaction, 최근: int =
     await interaction.response.defer(ephemeral=True) 
 
     try:
-        resp = requests.get(
+        async with web_api_breaker.guard(), http_request(
+            "GET",
             f"{API_BASE}/api/logs/verify",
             params={
                 "guild_id": interaction.guild.id,
                 "user_id": interaction.user.id,  # or 특정 유저만, 전체면 이 줄 빼기
                 "limit": 최근,
             },
-            timeout=5,
-        )
-        if resp.status_code != 200:
-            await interaction.followup.send(
-                f"웹 로그 조회 실패: {resp.status_code} {resp.text}",
-                ephemeral=True,
-            )
-            return 
+            timeout=aiohttp.ClientTimeout(total=5),
+        ) as resp:
+            if resp.status != 200:
+                # guard 안에서 올려야 브레이커가 실패로 센다
+                raise UpstreamHTTPError(resp.status, await resp.text())
 
-        data = resp.json()
+            data = await resp.json()
         if not data:
             await interaction.followup.send("인증 로그가 없습니다.", ephemeral=True)
             return 
@@ -1545,6 +2886,11 @@ async def view_verification_log(interaction: discord.Interaction, 최근: int =
 
         await interaction.followup.send(embed=embed, ephemeral=True) 
 
+    except UpstreamHTTPError as e:
+        await interaction.followup.send(
+            f"웹 로그 조회 실패: {e.status} {e.text[:1500]}",
+            ephemeral=True,
+        )
     except Exception as e:
         await interaction.followup.send(f"로그 읽기 실패: {e}", ephemeral=True) 
 
@@ -1571,21 +2917,8 @@ async def verify_stats(interaction: discord.Interaction):
     # ----------------- 서버 멤버 가져오기 -----------------
     members: list[discord.Member] = [m for m in guild.members if not m.bot] 
 
-    # ----------------- API 체크 (인증 여부) -----------------
-    verified_ids: set[int] = set()
-    loop = asyncio.get_running_loop() 
-
-    def _check_one(user_id: int) -> bool:
-        # sync 함수는 run_in_executor 안에서만 호출
-        return is_already_verified(guild.id, user_id) 
-
-    async def check_verified(m: discord.Member):
-        is_verified = await loop.run_in_executor(None, _check_one, m.id)
-        if is_verified:
-            verified_ids.add(m.id) 
-
-    # 여러 코루틴을 한 번에 실행
-    await asyncio.gather(*(check_verified(m) for m in members)) 
+    # ----------------- 인증 여부 (로컬 인덱스) -----------------
+    verified_ids = verified_index.members_of(guild.id) 
 
     # ----------------- 멤버 객체 기준으로 분류 -----------------
     verified_members = [m for m in members if m.id in verified_ids]
@@ -1694,7 +3027,7 @@ async def set_admin_roles(
 
     # reset
     if 모드.value == "reset":
-        set_guild_admin_role_ids(guild.id, [])
+        await set_guild_admin_role_ids(guild.id, [])
         await interaction.response.send_message(
             "관리자 역할을 전부 초기화했습니다.", ephemeral=True
         )
@@ -1715,7 +3048,7 @@ async def set_admin_roles(
 
     if 모드.value == "add":
         current_roles.add(역할.id)
-        set_guild_admin_role_ids(guild.id, list(current_roles))
+        await set_guild_admin_role_ids(guild.id, list(current_roles))
         await interaction.response.send_message(
             f"{역할.mention} 을(를) 관리자 역할로 추가했습니다.",
             ephemeral=True
@@ -1724,7 +3057,7 @@ async def set_admin_roles(
     elif 모드.value == "remove":
         if 역할.id in current_roles:
             current_roles.remove(역할.id)
-            set_guild_admin_role_ids(guild.id, list(current_roles))
+            await set_guild_admin_role_ids(guild.id, list(current_roles))
             await interaction.response.send_message(
                 f"{역할.mention} 을(를) 관리자 역할에서 제거했습니다.",
                 ephemeral=True
@@ -1751,27 +3084,17 @@ async def command_logs(
         return
 
     # 최신 순으로 200개 정도까지만
-    cursor.execute(
-        """
-        SELECT id, user_name, user_id, command_name, command_full, created_at
-        FROM command_logs
-        WHERE guild_id=?
-        ORDER BY id DESC
-        LIMIT 200
-        """,
-        (guild.id,),
-    )
-    rows = cursor.fetchall()
+    rows = await command_log_repo.recent(guild.id, 200)
     if not rows:
         await interaction.response.send_message("로그가 없습니다.", ephemeral=True)
         return
 
     # 문자열로 가공
     lines = []
-    for log_id, user_name, user_id, cmd_name, full, created_at in rows:
+    for row in rows:
         lines.append(
-            f"{log_id}. [{created_at}] /{cmd_name} - {user_name} ({user_id})\n"
-            f"    ⤷ {full}"
+            f"{row.id}. [{row.created_at}] /{row.command_name} - {row.user_name} ({row.user_id})\n"
+            f"    ⤷ {row.command_full}"
         )
 
     # 페이지 나누기
@@ -1801,7 +3124,7 @@ async def list_roles(interaction: discord.Interaction):
         await interaction.response.send_message("관리자만 사용할 수 있습니다.", ephemeral=True)
         return 
 
-    if not RANK_API_URL_ROOT or not RANK_API_KEY:
+    if not rank_api.configured:
         await interaction.response.send_message(
             "랭킹 서버 설정이 되어 있지 않습니다.", ephemeral=True
         )
@@ -1810,19 +3133,15 @@ async def list_roles(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True) 
 
     try:
-        resp = requests.get(
-            f"{RANK_API_URL_ROOT}/roles",
-            headers=_rank_api_headers(),
-            timeout=15,
-        )
-        if resp.status_code != 200:
+        try:
+            roles = await rank_api.get_roles()
+        except RankApiError as e:
             await interaction.followup.send(
-                f"역할 목록 불러오기 실패 (HTTP {resp.status_code}): {resp.text}",
+                f"역할 목록 불러오기 실패 (HTTP {e.status}): {e.text}",
                 ephemeral=True,
             )
             return 
 
-        roles = resp.json()  # [{ name, rank, id }, ...]
         total = len(roles) 
 
         if not roles:
@@ -1845,9 +3164,9 @@ async def list_roles(interaction: discord.Interaction):
             embed.set_footer(text=f"총 역할 개수: {total}개") 
 
             for r in chunk:
-                name = r.get("name", "?")
-                rank = r.get("rank", "?")
-                role_id = r.get("id", "?") 
+                name = r.name
+                rank = r.rank
+                role_id = r.id 
 
                 # name/field 형식은 취향대로
                 embed.add_field(
@@ -1881,7 +3200,7 @@ async def promote_cmd(
         await interaction.response.send_message("관리자만 사용할 수 있습니다.", ephemeral=True)
         return 
 
-    if not RANK_API_URL_ROOT or not RANK_API_KEY:
+    if not rank_api.configured:
         await interaction.response.send_message(
             "랭킹 서버 설정이 되어 있지 않습니다.", ephemeral=True
         )
@@ -1890,54 +3209,45 @@ async def promote_cmd(
     await interaction.response.defer(ephemeral=True) 
 
     try:
-        payload = {"username": username, "rank": role_name}
-        resp = requests.post(
-            f"{RANK_API_URL_ROOT}/rank",
-            json=payload,
-            headers=_rank_api_headers(),
-            timeout=15,
-        ) 
-
-        if resp.status_code == 200:
-            data = resp.json()
-            new_role = data.get("newRole", {})  # { name, rank }
-            old_role = data.get("oldRole", {})  # 백엔드에서 같이 주면 사용 
+        result = await rank_api.set_rank(username, role_name)
+        rank_poll.nudge(interaction.guild_id, (username,))
+    except RankApiError as e:
+        await interaction.followup.send(
+            f"승진 실패 (HTTP {e.status}): {e.text}",
+            ephemeral=True,
+        )
+        return
+    except Exception as e:
+        await interaction.followup.send(f"요청 중 에러 발생: {e}", ephemeral=True)
+        return 
 
-            old_rank_str = f"{old_role.get('name','?')} (Rank {old_role.get('rank','?')})"
-            new_rank_str = f"{new_role.get('name','?')} (Rank {new_role.get('rank','?')})" 
+    old_rank_str = format_rank(result.old_role)  # 백엔드에서 같이 주면 사용
+    new_rank_str = format_rank(result.new_role) 
 
-            await interaction.followup.send(
-                f"`{username}` 님을 역할 `{role_name}` 으로 변경했습니다.\n"
-                f"실제 반영: {new_rank_str}",
-                ephemeral=True,
-            ) 
-
-            # 🔵 그룹변경 로그 채널로 embed 전송
-            guild = interaction.guild
-            if guild:
-                log_channel_id = get_log_channel(guild.id, "group_change")
-                if log_channel_id:
-                    try:
-                        log_ch = guild.get_channel(log_channel_id) or await guild.fetch_channel(log_channel_id)
-                        if log_ch:
-                            embed = make_rank_log_embed(
-                                RankLogType.PROMOTE,
-                                target_name=username,
-                                old_rank=old_rank_str,
-                                new_rank=new_rank_str,
-                                executor=interaction.user,
-                            )
-                            await log_ch.send(embed=embed)
-                    except Exception as e:
-                        print("[RANK_PROMOTE_LOG_ERROR]", repr(e)) 
+    await interaction.followup.send(
+        f"`{username}` 님을 역할 `{role_name}` 으로 변경했습니다.\n"
+        f"실제 반영: {new_rank_str}",
+        ephemeral=True,
+    ) 
 
-        else:
-            await interaction.followup.send(
-                f"승진 실패 (HTTP {resp.status_code}): {resp.text}",
-                ephemeral=True,
-            )
-    except Exception as e:
-        await interaction.followup.send(f"요청 중 에러 발생: {e}", ephemeral=True)
+    # 🔵 그룹변경 로그 채널로 embed 전송
+    guild = interaction.guild
+    if guild:
+        log_channel_id = get_log_channel(guild.id, "group_change")
+        if log_channel_id:
+            try:
+                log_ch = guild.get_channel(log_channel_id) or await guild.fetch_channel(log_channel_id)
+                if log_ch:
+                    embed = make_rank_log_embed(
+                        RankLogType.PROMOTE,
+                        target_name=username,
+                        old_rank=old_rank_str,
+                        new_rank=new_rank_str,
+                        executor=interaction.user,
+                    )
+                    await log_ch.send(embed=embed)
+            except Exception as e:
+                print("[RANK_PROMOTE_LOG_ERROR]", repr(e))
 
 
 @bot.tree.command(name="강등", description="Roblox 그룹 랭크를 특정 역할로 변경합니다. (관리자)")
@@ -1954,7 +3264,7 @@ async def demote_to_role_cmd(
         await interaction.response.send_message("관리자만 사용할 수 있습니다.", ephemeral=True)
         return 
 
-    if not RANK_API_URL_ROOT or not RANK_API_KEY:
+    if not rank_api.configured:
         await interaction.response.send_message(
             "랭킹 서버 설정이 되어 있지 않습니다.", ephemeral=True
         )
@@ -1963,54 +3273,44 @@ async def demote_to_role_cmd(
     await interaction.response.defer(ephemeral=True) 
 
     try:
-        payload = {"username": username, "rank": role_name} 
-
-        resp = requests.post(
-            f"{RANK_API_URL_ROOT}/rank",
-            json=payload,
-            headers=_rank_api_headers(),
-            timeout=30,
-    )
-    
-        if resp.status_code == 200:
-            data = resp.json()
-            new_role = data.get("newRole", {})
-            old_role = data.get("oldRole", {}) 
-
-            old_rank_str = f"{old_role.get('name','?')} (Rank {old_role.get('rank','?')})"
-            new_rank_str = f"{new_role.get('name','?')} (Rank {new_role.get('rank','?')})" 
+        result = await rank_api.set_rank(username, role_name)
+        rank_poll.nudge(interaction.guild_id, (username,))
+    except RankApiError as e:
+        await interaction.followup.send(
+            f"강등 실패 (HTTP {e.status}): {e.text}",
+            ephemeral=True,
+        )
+        return
+    except Exception as e:
+        await interaction.followup.send(f"요청 중 에러 발생: {e}", ephemeral=True)
+        return 
 
-            await interaction.followup.send(
-                f"`{username}` 님을 역할 `{role_name}` 으로 변경했습니다.\n"
-                f"실제 반영: {new_rank_str}",
-                ephemeral=True,
-            ) 
+    old_rank_str = format_rank(result.old_role)
+    new_rank_str = format_rank(result.new_role) 
 
-            guild = interaction.guild
-            if guild:
-                log_channel_id = get_log_channel(guild.id, "group_change")
-                if log_channel_id:
-                    try:
-                        log_ch = guild.get_channel(log_channel_id) or await guild.fetch_channel(log_channel_id)
-                        if log_ch:
-                            embed = make_rank_log_embed(
-                                RankLogType.DEMOTE,
-                                target_name=username,
-                                old_rank=old_rank_str,
-                                new_rank=new_rank_str,
-                                executor=interaction.user,
-                            )
-                            await log_ch.send(embed=embed)
-                    except Exception as e:
-                        print("[RANK_DEMOTE_LOG_ERROR]", repr(e)) 
+    await interaction.followup.send(
+        f"`{username}` 님을 역할 `{role_name}` 으로 변경했습니다.\n"
+        f"실제 반영: {new_rank_str}",
+        ephemeral=True,
+    ) 
 
-        else:
-            await interaction.followup.send(
-                f"강등 실패 (HTTP {resp.status_code}): {resp.text}",
-                ephemeral=True,
-            )
-    except Exception as e:
-        await interaction.followup.send(f"요청 중 에러 발생: {e}", ephemeral=True)
+    guild = interaction.guild
+    if guild:
+        log_channel_id = get_log_channel(guild.id, "group_change")
+        if log_channel_id:
+            try:
+                log_ch = guild.get_channel(log_channel_id) or await guild.fetch_channel(log_channel_id)
+                if log_ch:
+                    embed = make_rank_log_embed(
+                        RankLogType.DEMOTE,
+                        target_name=username,
+                        old_rank=old_rank_str,
+                        new_rank=new_rank_str,
+                        executor=interaction.user,
+                    )
+                    await log_ch.send(embed=embed)
+            except Exception as e:
+                print("[RANK_DEMOTE_LOG_ERROR]", repr(e))
 
 
 @bot.tree.command(name="일괄승진", description="인증된 모든 유저를 특정 역할로 승진합니다. (관리자)")
@@ -2021,7 +3321,7 @@ async def bulk_promote_to_role(interaction: discord.Interaction, role_name: str)
         await interaction.response.send_message("관리자만 사용할 수 있습니다.", ephemeral=True)
         return 
 
-    if not RANK_API_URL_ROOT or not RANK_API_KEY:
+    if not rank_api.configured:
         await interaction.response.send_message(
             "랭킹 서버 설정이 되어 있지 않습니다.", ephemeral=True
         )
@@ -2030,17 +3330,9 @@ async def bulk_promote_to_role(interaction: discord.Interaction, role_name: str)
     await interaction.response.defer(ephemeral=True) 
 
     # 인증된 유저 목록
-    cursor.execute(
-        "SELECT roblox_nick FROM users WHERE guild_id=? AND verified=1",
-        (interaction.guild.id,),
-    )
-    verified_users = [row[0] for row in cursor.fetchall() if row[0]] 
+    verified_users = await user_repo.verified_nicks(interaction.guild.id) 
 
-    cursor.execute(
-        "SELECT roblox_nick FROM forced_verified WHERE guild_id=?",
-        (interaction.guild.id,),
-    )
-    forced_excluded = {row[0] for row in cursor.fetchall() if row[0]} 
+    forced_excluded = await forced_verified_repo.nicks(interaction.guild.id) 
 
     all_users = [u for u in verified_users if u not in forced_excluded] 
 
@@ -2057,23 +3349,14 @@ async def bulk_promote_to_role(interaction: discord.Interaction, role_name: str)
         ) 
 
     BATCH_SIZE = 100
-    all_results: list[dict] = [] 
+    all_results: list[RankStatus] = [] 
 
     for i in range(0, total, BATCH_SIZE):
-        batch = all_users[i:i + BATCH_SIZE] 
-
-        try:
-            payload = {"usernames": batch, "rank": role_name}
-            resp = requests.post(
-                f"{RANK_API_URL_ROOT}/bulk-promote-to-role",
-                json=payload,
-                headers=_rank_api_headers(),
-                timeout=120,
-            ) 
+        batch = all_users[i:i + BATCH_SIZE] 
 
-            if resp.status_code == 200:
-                data = resp.json()
-                all_results.extend(data.get("results", [])) 
+        try:
+            all_results.extend(await rank_api.bulk_promote_to_role(batch, role_name)) 
+            rank_poll.nudge(interaction.guild_id, tuple(batch))
 
             if (i + BATCH_SIZE) % 1000 == 0:
                 await interaction.followup.send(
@@ -2087,8 +3370,8 @@ async def bulk_promote_to_role(interaction: discord.Interaction, role_name: str)
             print(f"Batch {i} error: {e}")
             continue 
 
-    success_cnt = len([r for r in all_results if r.get("success")])
-    fail_cnt = len([r for r in all_results if not r.get("success")]) 
+    success_cnt = len([r for r in all_results if r.success])
+    fail_cnt = len([r for r in all_results if not r.success]) 
 
     summary = make_bulk_rank_summary_embed(
         RankSummaryType.BULK_PROMOTE,
@@ -2115,7 +3398,7 @@ async def bulk_demote_to_role(interaction: discord.Interaction, role_name: str):
         await interaction.response.send_message("관리자만 사용할 수 있습니다.", ephemeral=True)
         return 
 
-    if not RANK_API_URL_ROOT or not RANK_API_KEY:
+    if not rank_api.configured:
         await interaction.response.send_message(
             "랭킹 서버 설정이 되어 있지 않습니다.", ephemeral=True
         )
@@ -2123,17 +3406,9 @@ async def bulk_demote_to_role(interaction: discord.Interaction, role_name: str):
 
     await interaction.response.defer(ephemeral=True) 
 
-    cursor.execute(
-        "SELECT roblox_nick FROM users WHERE guild_id=? AND verified=1",
-        (interaction.guild.id,),
-    )
-    verified_users = [row[0] for row in cursor.fetchall() if row[0]] 
+    verified_users = await user_repo.verified_nicks(interaction.guild.id) 
 
-    cursor.execute(
-        "SELECT roblox_nick FROM forced_verified WHERE guild_id=?",
-        (interaction.guild.id,),
-    )
-    forced_excluded = {row[0] for row in cursor.fetchall() if row[0]} 
+    forced_excluded = await forced_verified_repo.nicks(interaction.guild.id) 
 
     all_users = [u for u in verified_users if u not in forced_excluded] 
 
@@ -2150,23 +3425,14 @@ async def bulk_demote_to_role(interaction: discord.Interaction, role_name: str):
         ) 
 
     BATCH_SIZE = 100
-    all_results: list[dict] = [] 
+    all_results: list[RankStatus] = [] 
 
     for i in range(0, total, BATCH_SIZE):
         batch = all_users[i:i + BATCH_SIZE] 
 
         try:
-            payload = {"usernames": batch, "rank": role_name}
-            resp = requests.post(
-                f"{RANK_API_URL_ROOT}/bulk-demote-to-role",
-                json=payload,
-                headers=_rank_api_headers(),
-                timeout=120,
-            ) 
-
-            if resp.status_code == 200:
-                data = resp.json()
-                all_results.extend(data.get("results", [])) 
+            all_results.extend(await rank_api.bulk_demote_to_role(batch, role_name)) 
+            rank_poll.nudge(interaction.guild_id, tuple(batch))
 
             if (i + BATCH_SIZE) % 1000 == 0:
                 await interaction.followup.send(
@@ -2180,8 +3446,8 @@ async def bulk_demote_to_role(interaction: discord.Interaction, role_name: str):
             print(f"Batch {i} error: {e}")
             continue 
 
-    success_cnt = len([r for r in all_results if r.get("success")])
-    fail_cnt = len([r for r in all_results if not r.get("success")]) 
+    success_cnt = len([r for r in all_results if r.success])
+    fail_cnt = len([r for r in all_results if not r.success]) 
 
     summary = make_bulk_rank_summary_embed(
         RankSummaryType.BULK_DEMOTE,
@@ -2219,6 +3485,132 @@ async def sync_commands(interaction: discord.Interaction):
     except Exception as e:
         await interaction.followup.send(f"동기화 중 오류: {e}", ephemeral=True) 
 
+@bot.tree.command(name="진단", description="업스트림/캐시 상태를 확인합니다. (개발자 전용)")
+async def diagnostics(interaction: discord.Interaction):
+    if not is_developer(interaction.user):
+        await interaction.response.send_message("개발자만 사용할 수 있습니다.", ephemeral=True)
+        return 
+
+    embed = discord.Embed(title="🩺 진단", color=discord.Color.dark_teal()) 
+
+    bucket_lines = []
+    for host, b in rate_limits.snapshot().items():
+        line = (
+            f"`{host}` {b['tokens']}/{b['capacity']} (초당 {b['rate']}) "
+            f"대기 {b['waiting']} · 429 {b['throttled']}회"
+        )
+        if b["paused_for"]:
+            line += f" · ⏸ {b['paused_for']}초"
+        bucket_lines.append(line)
+    embed.add_field(name="레이트 리밋", value="\n".join(bucket_lines) or "호출 기록 없음", inline=False) 
+
+    cache_lines = [
+        f"`{kind}` hit {hits} / miss {misses}"
+        for kind, (hits, misses) in roblox_cache.stats().items()
+    ]
+    cache_lines.append(f"항목 수: {len(roblox_cache)}")
+    embed.add_field(name="Roblox 캐시", value="\n".join(cache_lines), inline=False) 
+
+    breaker_lines = [
+        f"`{b.name}` {snap['state']} · 연속 실패 {snap['failures']} · 차단 {snap['rejected']}회"
+        + (f" · {snap['retry_in']}초 후 재시도" if snap["retry_in"] else "")
+        for b in (rank_api_breaker, web_api_breaker)
+        for snap in (b.snapshot(),)
+    ]
+    embed.add_field(name="서킷 브레이커", value="\n".join(breaker_lines), inline=False) 
+
+    embed.add_field(
+        name="웹 로그",
+        value=(
+            f"대기 {web_log_shipper.queue.qsize()} · 전송 {web_log_shipper.sent} · "
+            f"저널 {web_log_shipper.spilled} · 폐기 {web_log_shipper.dropped}"
+        ),
+        inline=False,
+    ) 
+
+    embed.add_field(
+        name="DB 쓰기",
+        value=(
+            f"대기 {db.pending_writes} · 커밋 {db.commits}회 · 작업 {db.committed_jobs}건"
+        ),
+        inline=False,
+    ) 
+
+    eco = economy_accounts.stats()
+    embed.add_field(
+        name="경제 캐시",
+        value=(
+            f"계정 {eco['cached']} · 미저장 {eco['dirty']} · 원장 대기 {eco['ledger_pending']}건 · "
+            f"중복 요청 {eco['duplicates']}건 · flush {eco['flushes']}회"
+        ),
+        inline=False,
+    ) 
+
+    polls = rank_poll.snapshot()
+    embed.add_field(
+        name="랭크 폴링",
+        value="\n".join(
+            f"`{gid}` 간격 {p['interval']:.0f}s · {p['due_in']}s 후 · 샤드 {p['shard']} · "
+            f"우선 {p['hot']}명 · 폴링 {p['polls']}회 · 변경 {p['changes']}회"
+            for gid, p in list(polls.items())[:10]
+        ) or "대상 없음",
+        inline=False,
+    ) 
+
+    for loop_name, runs in last_guild_runs.items():
+        slowest = max((r.elapsed for r in runs), default=0.0)
+        embed.add_field(
+            name=f"길드별 실행 · {loop_name}",
+            value=(
+                f"길드 {len(runs)}곳 · 실패 {sum(not r.ok for r in runs)}곳 · 최장 {slowest:.1f}s\n"
+                + "\n".join(f"`{r.guild_id}` {r.error}" for r in runs if not r.ok)[:900]
+            ),
+            inline=False,
+        ) 
+
+    report = last_retention_report
+    embed.add_field(
+        name="보존 정리",
+        value=(
+            f"{report.finished_at:%m-%d %H:%M} · "
+            + ", ".join(f"`{t}` {n}건" for t, n in report.archived.items())
+            + f" · 회수 {report.reclaimed:,} bytes"
+        ) if report else "아직 실행 안 됨",
+        inline=False,
+    ) 
+
+    embed.add_field(
+        name="길드 설정 스냅샷",
+        value=f"v{guild_configs.version} · 이 서버 v{guild_configs.get(interaction.guild_id or 0).version}",
+        inline=False,
+    ) 
+
+    await interaction.response.send_message(embed=embed, ephemeral=True) 
+
+
+@bot.tree.command(name="루프상태", description="백그라운드 루프 상태를 확인합니다. (개발자 전용)")
+async def loop_status(interaction: discord.Interaction):
+    if not is_developer(interaction.user):
+        await interaction.response.send_message("개발자만 사용할 수 있습니다.", ephemeral=True)
+        return 
+
+    embed = discord.Embed(title="⏱ 백그라운드 루프", color=discord.Color.dark_teal()) 
+
+    for name, loop in supervised_loops.items():
+        snap = loop.snapshot()
+        last = f"{snap['last_duration']:.2f}s" if snap["last_duration"] is not None else "-"
+        next_run = f"<t:{int(snap['next_run'])}:R>" if snap["next_run"] and snap["running"] else "-"
+        value = (
+            f"{'🟢' if snap['running'] else '⚪'} 주기 {snap['interval']:g}s · 최근 {last} · 다음 {next_run}\n"
+            f"실행 {snap['runs']} · 오류율 {snap['error_rate']:.0%} · 마감초과 {snap['overruns']} · "
+            f"건너뜀 {snap['skipped']} · 지연 {snap['missed']} · 재시작 {snap['restarts']}"
+        )
+        if snap["last_error"]:
+            value += f"\n최근 오류: `{snap['last_error'][:200]}`"
+        embed.add_field(name=name, value=value, inline=False) 
+
+    await interaction.response.send_message(embed=embed, ephemeral=True) 
+
 # @bot.tree.command(
 #     name="일괄닉네임변경",
 #     description="인증된 유저의 닉네임을 [랭크] 본닉 형식으로 변경합니다. (관리자)"
@@ -2339,27 +3731,27 @@ async def set_log_channels(
     changed: list[str] = []
 
     if 인증 is not None:
-        set_log_channel(guild.id, "verify", 인증.id)
+        await set_log_channel(guild.id, "verify", 인증.id)
         changed.append(f"인증: {인증.mention}")
 
     if 그룹변경 is not None:
-        set_log_channel(guild.id, "group_change", 그룹변경.id)
+        await set_log_channel(guild.id, "group_change", 그룹변경.id)
         changed.append(f"그룹변경: {그룹변경.mention}")
 
     if 관리자 is not None:
-        set_log_channel(guild.id, "admin", 관리자.id)
+        await set_log_channel(guild.id, "admin", 관리자.id)
         changed.append(f"관리자: {관리자.mention}")
 
     if 보안 is not None:
-        set_log_channel(guild.id, "security", 보안.id)
+        await set_log_channel(guild.id, "security", 보안.id)
         changed.append(f"보안: {보안.mention}")
 
     if 개발자 is not None:
-        set_log_channel(guild.id, "dev", 개발자.id)
+        await set_log_channel(guild.id, "dev", 개발자.id)
         changed.append(f"개발자: {개발자.mention}")
 
     if 아이템 is not None:  # 🔹 추가
-        set_log_channel(guild.id, "item", 아이템.id)
+        await set_log_channel(guild.id, "item", 아이템.id)
         changed.append(f"아이템: {아이템.mention}")
 
     if not changed:
@@ -2385,22 +3777,24 @@ async def manage_blacklist(interaction: discord.Interaction, group_id: int, acti
 
     if action.lower() == "add":
         try:
-            cursor.execute(
+            await db.execute(
                 "INSERT INTO blacklist(guild_id, group_id) VALUES(?, ?)",
                 (interaction.guild.id, group_id),
             )
-            conn.commit()
+            config = guild_configs.get(interaction.guild.id)
+            guild_configs.update(interaction.guild.id, blacklist_groups=config.blacklist_groups | {group_id})
             await interaction.response.send_message(
                 f" 그룹 ID `{group_id}` 을(를) 블랙리스트에 추가했습니다.", ephemeral=True
             )
         except Exception as e:
             await interaction.response.send_message(f"추가 실패: {e}", ephemeral=True)
     else:
-        cursor.execute(
+        await db.execute(
             "DELETE FROM blacklist WHERE guild_id=? AND group_id=?",
             (interaction.guild.id, group_id),
         )
-        conn.commit()
+        config = guild_configs.get(interaction.guild.id)
+        guild_configs.update(interaction.guild.id, blacklist_groups=config.blacklist_groups - {group_id})
         await interaction.response.send_message(
             f" 그룹 ID `{group_id}` 을(를) 블랙리스트에서 제거했습니다.", ephemeral=True
         ) 
@@ -2412,15 +3806,14 @@ async def view_blacklist(interaction: discord.Interaction):
         await interaction.response.send_message("관리자만 사용할 수 있습니다.", ephemeral=True)
         return 
 
-    cursor.execute("SELECT group_id FROM blacklist WHERE guild_id=?", (interaction.guild.id,))
-    rows = cursor.fetchall() 
+    groups = guild_configs.get(interaction.guild.id).blacklist_groups 
 
     embed = discord.Embed(title="블랙리스트 그룹", color=discord.Color.red()) 
 
-    if not rows:
+    if not groups:
         embed.description = "블랙리스트에 그룹이 없습니다."
     else:
-        group_ids = [str(row[0]) for row in rows]
+        group_ids = [str(g) for g in sorted(groups)]
         embed.description = "\n".join(group_ids) 
 
     await interaction.response.send_message(embed=embed, ephemeral=True) 
@@ -2502,49 +3895,38 @@ async def on_message(message):
 
     xp_cooldown[user_id] = now
 
-    user = get_user(user_id)
-
-    exp = user[3]
-    level = user[4]
-
+    # 채팅 XP 는 메모리에서만 처리 (economy_flush_task 가 모아서 저장)
     gain = random.randint(10,20)
-    exp += gain
-
-    need = 50 + (level * 25)
-
-    if exp >= need:
-
-        level += 1
-        exp -= need
-
-        reward = level * 50
-
-        cur.execute(
-            "UPDATE economy SET money = money + ? WHERE user_id=?",
-            (reward, user_id)
-        )
-
-    cur.execute(
-        "UPDATE economy SET exp=?, level=? WHERE user_id=?",
-        (exp, level, user_id)
-    )
+    await economy_accounts.add_xp(user_id, gain, message.guild.id if message.guild else None)
 
-    conn.commit()
 
 
 # =========================
 # 슬래시 명령어
 # =========================
 
+async def _reply_duplicate(interaction: discord.Interaction) -> None:
+    """같은 interaction 이 다시 들어온 경우 — 첫 처리에서 응답했으면 아무것도 하지 않는다."""
+    if not interaction.response.is_done():
+        await interaction.response.send_message("이미 처리된 요청입니다.", ephemeral=True)
+
+
 @bot.tree.command(name="돈", description="24시간마다 돈 받기")
 async def daily(interaction: discord.Interaction):
 
-    user = get_user(interaction.user.id)
     now = int(time.time())
+    reward = random.randint(100,300)
+
+    remain = await economy_accounts.claim_daily(
+        interaction.user.id, now, reward,
+        key=f"daily:{interaction.id}", guild_id=interaction.guild_id,
+    )
+    if remain is DUPLICATE:
+        await _reply_duplicate(interaction)
+        return
 
-    if now - user[2] < 86400:
+    if remain > 0:
 
-        remain = 86400 - (now - user[2])
         h = remain // 3600
         m = (remain % 3600) // 60
 
@@ -2553,15 +3935,6 @@ async def daily(interaction: discord.Interaction):
         )
         return
 
-    reward = random.randint(100,300)
-
-    cur.execute(
-        "UPDATE economy SET money = money + ?, last_daily=? WHERE user_id=?",
-        (reward, now, interaction.user.id)
-    )
-
-    conn.commit()
-
     await interaction.response.send_message(
         f"💰 {reward}원을 받았습니다!"
     )
@@ -2575,25 +3948,30 @@ async def daily(interaction: discord.Interaction):
 @app_commands.describe(amount="도박 금액")
 async def gamble(interaction: discord.Interaction, amount: int):
 
-    user = get_user(interaction.user.id)
-
     if amount <= 0:
         await interaction.response.send_message("금액 오류")
         return
 
-    if user[1] < amount:
+    user = await economy_accounts.get(interaction.user.id)
+
+    if user.money < amount:
         await interaction.response.send_message("돈이 부족합니다")
         return
 
     r = random.random()
 
     if r <= 0.50:
-        # 패배
-        cur.execute(
-            "UPDATE economy SET money = money - ? WHERE user_id=?",
-            (amount, interaction.user.id)
+        # 패배 (그 사이 잔액이 줄었으면 거절)
+        spent = await economy_accounts.try_spend(
+            interaction.user.id, amount, "gamble_loss",
+            key=f"gamble:{interaction.id}", guild_id=interaction.guild_id,
         )
-        conn.commit()
+        if spent is DUPLICATE:
+            await _reply_duplicate(interaction)
+            return
+        if spent is None:
+            await interaction.response.send_message("돈이 부족합니다")
+            return
 
         await interaction.response.send_message(
             f"💀 도박 실패\n잃은 돈 : {amount}"
@@ -2611,12 +3989,14 @@ async def gamble(interaction: discord.Interaction, amount: int):
 
     win = amount * multi
 
-    cur.execute(
-        "UPDATE economy SET money = money + ? WHERE user_id=?",
-        (win, interaction.user.id)
+    won = await economy_accounts.add_money(
+        interaction.user.id, win, "gamble_win",
+        key=f"gamble:{interaction.id}", guild_id=interaction.guild_id,
     )
+    if won is DUPLICATE:
+        await _reply_duplicate(interaction)
+        return
 
-    conn.commit()
 
     await interaction.response.send_message(
         f"🎰 도박 성공!\n배율 : x{multi}\n획득 : {win}"
@@ -2632,34 +4012,25 @@ async def shop(interaction: discord.Interaction):
         await interaction.response.send_message("길드에서만 사용 가능합니다.", ephemeral=True)
         return
 
-    cursor.execute(
-        """
-        SELECT name, price, type, role_id, level, exp
-        FROM shop_items
-        WHERE guild_id=?
-        ORDER BY price ASC
-        """,
-        (guild.id,),
-    )
-    rows = cursor.fetchall()
+    items = await shop_item_repo.list(guild.id)
 
-    if not rows:
+    if not items:
         await interaction.response.send_message("상점에 등록된 아이템이 없습니다.", ephemeral=True)
         return
 
     lines = []
-    for name, price, itype, role_id, level_val, exp_val in rows:
+    for item in items:
         extra = ""
-        if itype == "role" and role_id:
-            role = guild.get_role(role_id)
+        if item.type == "role" and item.role_id:
+            role = guild.get_role(item.role_id)
             if role:
                 extra = f" → 역할: {role.mention}"
-        elif itype == "level" and level_val is not None:
-            extra = f" → 레벨 +{level_val}"
-        elif itype == "exp" and exp_val is not None:
-            extra = f" → 경험치 +{exp_val}"
+        elif item.type == "level" and item.level is not None:
+            extra = f" → 레벨 +{item.level}"
+        elif item.type == "exp" and item.exp is not None:
+            extra = f" → 경험치 +{item.exp}"
 
-        lines.append(f"• `{name}` | 가격: `{price}` | 타입: `{itype}`{extra}")
+        lines.append(f"• `{item.name}` | 가격: `{item.price}` | 타입: `{item.type}`{extra}")
 
     desc = "\n".join(lines)
 
@@ -2685,35 +4056,36 @@ async def buy(interaction: discord.Interaction, 이름: str):
         return
 
     # 아이템 조회
-    cursor.execute(
-        """
-        SELECT price, type, role_id, level, exp
-        FROM shop_items
-        WHERE guild_id=? AND name=?
-        """,
-        (guild.id, 이름),
-    )
-    row = cursor.fetchone()
-    if not row:
+    item = await shop_item_repo.get(guild.id, 이름)
+    if not item:
         await interaction.followup.send("해당 이름의 아이템이 없습니다.", ephemeral=True)
         return
 
-    price, item_type, role_id, level_val, exp_val = row
-
-    # 유저 경제 정보
-    user = get_user(member.id)  # (user_id, money, last_daily, exp, level)
-    _, money, _, cur_exp, cur_level = user
+    price, item_type, role_id, level_val, exp_val = item.price, item.type, item.role_id, item.level, item.exp
 
-    if money < price:
-        await interaction.followup.send("잔액이 부족합니다.", ephemeral=True)
+    if item_type not in ("role", "level", "exp"):
+        await interaction.followup.send("알 수 없는 아이템 타입입니다.", ephemeral=True)
         return
 
-    # 돈 차감
-    new_money = money - price
-    cur.execute(
-        "UPDATE economy SET money=? WHERE user_id=?",
-        (new_money, member.id),
+    # 돈 차감 + 레벨/경험치 지급 (잔액 확인과 함께 한 번에)
+    add_level = int(level_val) if item_type == "level" and level_val is not None else 0
+    add_exp = int(exp_val) if item_type == "exp" and exp_val is not None else 0
+    user = await economy_accounts.try_spend(
+        member.id, price, f"buy:{이름}",
+        add_exp=add_exp, add_level=add_level,
+        key=f"buy:{interaction.id}", guild_id=guild.id,
     )
+    if user is DUPLICATE:
+        # 같은 구매가 이미 처리됨 — 역할 지급/로그를 다시 하지 않는다
+        await interaction.followup.send("이미 처리된 구매입니다.", ephemeral=True)
+        return
+    if user is None:
+        await interaction.followup.send("잔액이 부족합니다.", ephemeral=True)
+        return
+    # try_spend 가 이미 보상을 더했으므로 user 는 구매 후 값이다
+    new_money = user.money
+    cur_level = user.level - add_level
+    cur_exp = user.exp - add_exp
 
     detail = ""
 
@@ -2731,33 +4103,16 @@ async def buy(interaction: discord.Interaction, 이름: str):
 
     elif item_type == "level":
         if level_val is not None:
-            add_level = int(level_val)
-            new_level = cur_level + add_level
-            cur.execute(
-                "UPDATE economy SET level=? WHERE user_id=?",
-                (new_level, member.id),
-            )
-            detail = f"레벨 {add_level} 상승! (현재 레벨: {new_level})"
+            detail = f"레벨 {add_level} 상승! (현재 레벨: {user.level})"
         else:
             detail = "이 아이템에는 레벨 값이 설정되어 있지 않습니다."
 
-    elif item_type == "exp":
+    else:  # "exp"
         if exp_val is not None:
-            add_exp = int(exp_val)
-            new_exp = cur_exp + add_exp
-            cur.execute(
-                "UPDATE economy SET exp=? WHERE user_id=?",
-                (new_exp, member.id),
-            )
-            detail = f"경험치 {add_exp} 획득! (현재 경험치: {new_exp})"
+            detail = f"경험치 {add_exp} 획득! (현재 경험치: {user.exp})"
         else:
             detail = "이 아이템에는 경험치 값이 설정되어 있지 않습니다."
 
-    else:
-        await interaction.followup.send("알 수 없는 아이템 타입입니다.", ephemeral=True)
-        return
-
-    conn.commit()
 
     # 유저에게 응답
     user_embed = discord.Embed(
@@ -2879,14 +4234,7 @@ async def add_item(
         exp_val = 경험치
 
     # DB 저장
-    cursor.execute(
-        """
-        INSERT INTO shop_items(guild_id, name, price, type, role_id, level, exp)
-        VALUES(?, ?, ?, ?, ?, ?, ?)
-        """,
-        (guild.id, 이름, 가격, item_type, role_id, level_val, exp_val),
-    )
-    conn.commit()
+    await shop_item_repo.add(guild.id, ShopItemRow(이름, 가격, item_type, role_id, level_val, exp_val))
 
     # 유저에게 응답
     await interaction.response.send_message(f"✅ `{이름}` 아이템을 추가했습니다.", ephemeral=True)
@@ -2936,27 +4284,15 @@ async def delete_item(interaction: discord.Interaction, 이름: str):
         return
 
     # 삭제 전 정보 조회 (로그용)
-    cursor.execute(
-        """
-        SELECT price, type, role_id, level, exp
-        FROM shop_items
-        WHERE guild_id=? AND name=?
-        """,
-        (guild.id, 이름),
-    )
-    row = cursor.fetchone()
-    if not row:
+    item = await shop_item_repo.get(guild.id, 이름)
+    if not item:
         await interaction.response.send_message("해당 이름의 아이템이 없습니다.", ephemeral=True)
         return
 
-    price, item_type, role_id, level_val, exp_val = row
+    price, item_type, role_id, level_val, exp_val = item.price, item.type, item.role_id, item.level, item.exp
 
     # 삭제
-    cursor.execute(
-        "DELETE FROM shop_items WHERE guild_id=? AND name=?",
-        (guild.id, 이름),
-    )
-    conn.commit()
+    await shop_item_repo.delete(guild.id, 이름)
 
     await interaction.response.send_message(f"🗑 `{이름}` 아이템을 삭제했습니다.", ephemeral=True)
 
@@ -2999,15 +4335,15 @@ async def userinfo(interaction: discord.Interaction, member: discord.Member=None
     if member is None:
         member = interaction.user
 
-    user = get_user(member.id)
+    user = await economy_accounts.get(member.id)
 
-    exp = user[3]
-    level = user[4]
+    exp = user.exp
+    level = user.level
     need = 50 + (level * 25)
 
     embed = discord.Embed(title=f"{member.name} 정보")
 
-    embed.add_field(name="💰 돈", value=user[1])
+    embed.add_field(name="💰 돈", value=user.money)
     embed.add_field(name="⭐ 레벨", value=level)
     embed.add_field(name="📊 EXP", value=f"{exp}/{need}")
 
@@ -3021,15 +4357,14 @@ async def userinfo(interaction: discord.Interaction, member: discord.Member=None
 @bot.tree.command(name="랭킹", description="레벨 랭킹")
 async def ranking(interaction: discord.Interaction):
 
-    cur.execute(
-        "SELECT user_id, level, exp FROM economy ORDER BY level DESC, exp DESC LIMIT 10"
-    )
-
-    rows = cur.fetchall()
+    # 캐시에만 있는 변경분을 먼저 내려보낸 뒤 조회
+    await economy_accounts.flush()
+    rows = await economy_repo.top_by_level(10)
 
     text = ""
 
-    for i,(uid,level,exp) in enumerate(rows, start=1):
+    for i, row in enumerate(rows, start=1):
+        uid, level = row.user_id, row.level
 
         member = interaction.guild.get_member(uid)
 
@@ -3057,250 +4392,777 @@ DEVELOPER_ID = 1276176866440642561
 
 KST = timezone(timedelta(hours=9)) 
 
-@tasks.loop(hours=6)
-async def sync_all_nicknames_task():
-    """6시간마다 전체 유저의 Roblox 정보를 동기화하고 닉네임 업데이트"""
+# ---------- 보존 정책 / 아카이브 / 정리 ----------
+# 만료된 행은 배치마다 LOG_DIR/archive/<table>-<날짜>-<첫 id>.jsonl.gz 로 옮긴 뒤 지운다.
+# 트랜잭션 안에서는 .tmp 파일에만 쓰고 DELETE 하며, 커밋이 끝난 뒤에야 제 이름으로 rename 한다.
+# (커밋 전에 죽어 남은 .tmp 는 다음 실행 때 행이 아직 테이블에 있으면 버리고, 없으면 마저 rename)
+
+RETENTION_ARCHIVE_DIR = os.path.join(LOG_DIR, "archive")
+
+
+@dataclass(slots=True)
+class RetentionReport:
+    archived: dict[str, int]
+    bytes_before: int
+    bytes_after: int
+    finished_at: datetime
+
+    @property
+    def reclaimed(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+last_retention_report: Optional[RetentionReport] = None
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _first_archived_id(tmp_path: str) -> Optional[int]:
     try:
-        cursor.execute("SELECT guild_id FROM rank_log_settings WHERE enabled=1")
-        settings = cursor.fetchall() 
-
-        for (guild_id,) in settings:
-            guild = bot.get_guild(guild_id)
-            if not guild:
-                continue 
-
-            # 인증된 모든 유저 조회
-            cursor.execute(
-                "SELECT discord_id, roblox_nick FROM users WHERE guild_id=? AND verified=1",
-                (guild_id,),
+        with gzip.open(tmp_path, "rt", encoding="utf-8") as f:
+            line = f.readline()
+        return json.loads(line)["id"] if line else None
+    except (OSError, EOFError, ValueError, KeyError):
+        return None
+
+
+async def _recover_archive_tmp() -> None:
+    """지난 실행에서 rename 전에 멈춘 .tmp 아카이브를 정리합니다."""
+    if not os.path.isdir(RETENTION_ARCHIVE_DIR):
+        return
+    tables = {p.table for p in RETENTION_POLICIES}
+    for name in os.listdir(RETENTION_ARCHIVE_DIR):
+        if not name.endswith(".jsonl.gz.tmp"):
+            continue
+        tmp_path = os.path.join(RETENTION_ARCHIVE_DIR, name)
+        table = name.rsplit("-", 2)[0]
+        first_id = _first_archived_id(tmp_path)
+        if table not in tables or first_id is None:
+            _remove_quietly(tmp_path)
+            continue
+        # DELETE 가 커밋되지 않았으면 행이 그대로 남아 있고, 다음 배치가 다시 아카이브한다
+        still_there = await db.fetchone(f"SELECT 1 FROM {table} WHERE id=?", (first_id,))
+        if still_there:
+            _remove_quietly(tmp_path)
+        else:
+            os.replace(tmp_path, tmp_path[: -len(".tmp")])
+
+
+def _db_file_bytes(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def _compact(c: sqlite3.Connection) -> None:
+    # auto_vacuum 은 한 번 INCREMENTAL 로 바꾼 뒤 전체 VACUUM 을 해야 적용된다
+    if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        c.execute("VACUUM")
+    c.execute("PRAGMA incremental_vacuum")
+    c.execute("PRAGMA optimize")
+    c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+async def run_retention() -> RetentionReport:
+    """보존 정책 적용 → 아카이브 → incremental vacuum / optimize 까지 한 번 돌립니다."""
+    global last_retention_report
+    bytes_before = _db_file_bytes(db.path)
+
+    await _recover_archive_tmp()
+
+    archived: dict[str, int] = {}
+    for policy in RETENTION_POLICIES:
+        total = 0
+        while True:
+            moved, tmp_path = await db.run(
+                lambda c, p=policy: archive_expired_batch(c, p, RETENTION_ARCHIVE_DIR), durable=True
             )
-            users = cursor.fetchall() 
+            if tmp_path is not None:
+                # 여기까지 왔으면 DELETE 가 커밋된 것 — 이제 아카이브를 제 이름으로 둔다
+                os.replace(tmp_path, tmp_path[: -len(".tmp")])
+            total += moved
+            if moved < RETENTION_BATCH_SIZE:
+                break
+        archived[policy.table] = total
+
+    await db.maintenance(_compact)
+
+    report = RetentionReport(archived, bytes_before, _db_file_bytes(db.path), datetime.now())
+    last_retention_report = report
+    print(
+        "[RETENTION]",
+        ", ".join(f"{t} {n}건" for t, n in archived.items()),
+        f"| 회수 {report.reclaimed} bytes",
+    )
+    return report
 
-            if not users:
-                continue 
 
-            usernames = [u[1] for u in users]
-            
-            # 배치 처리 (100명씩)
-            BATCH_SIZE = 100
-            for i in range(0, len(usernames), BATCH_SIZE):
-                batch = usernames[i:i + BATCH_SIZE]
-                
-                try:
-                    # 현재 Roblox 정보 조회
-                    resp = requests.post(
-                        f"{RANK_API_URL_ROOT}/bulk-status",
-                        json={"usernames": batch},
-                        headers=_rank_api_headers(),
-                        timeout=30,
-                    ) 
-
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        
-                        for r in data.get("results", []):
-                            if r.get("success"):
-                                username = r['username']
-                                role_info = r.get("role", {})
-                                rank_name = role_info.get("name", "?")
-                                
-                                # Discord 닉네임 업데이트
-                                for discord_id, roblox_nick in users:
-                                    if roblox_nick == username:
-                                        member = guild.get_member(discord_id)
-                                        if member:
-                                            try:
-                                                new_nick = f"[{rank_name}] {username}"
-                                                if len(new_nick) > 32:
-                                                    new_nick = new_nick[:32]
-                                                
-                                                # 닉네임이 다를 때만 변경
-                                                if member.nick != new_nick:
-                                                    await member.edit(nick=new_nick)
-                                            except Exception as e:
-                                                print(f"닉네임 변경 실패 {username}: {e}")
-                                        break
-                    
-                    # Rate limit 방지
-                    await asyncio.sleep(1)
-                    
-                except Exception as e:
-                    print(f"Batch {i} sync error: {e}")
-                    continue 
+@supervised_loop(hours=24, deadline=3600)
+async def retention_task():
+    await run_retention()
+
+
+@retention_task.before_loop
+async def before_retention_task():
+    await bot.wait_until_ready()
+
+
+# ---------- 길드별 병렬 실행 ----------
+# 백그라운드 루프의 길드별 작업을 세마포어로 묶어 동시에 돌린다.
+# 길드마다 마감 시간과 예외를 따로 두어, 느리거나 실패한 길드가 다른 길드를 막지 않는다.
+
+GUILD_TASK_CONCURRENCY = int(os.getenv("GUILD_TASK_CONCURRENCY", "4"))
+RANK_LOG_GUILD_DEADLINE = 30.0          # 초 — 길드 하나의 랭크 폴링
+NICKNAME_SYNC_GUILD_DEADLINE = 1800.0   # 초 — 길드 하나의 닉네임 동기화
+
+
+@dataclass(slots=True)
+class GuildRunResult:
+    guild_id: int
+    ok: bool
+    elapsed: float
+    error: Optional[str] = None
+
+
+# 루프 이름 -> 마지막 실행의 길드별 결과 (/진단 용)
+last_guild_runs: dict[str, list[GuildRunResult]] = {}
+
+
+async def run_per_guild(
+    name: str,
+    jobs: list[tuple[int, tuple]],
+    fn,
+    *,
+    deadline: float,
+    concurrency: int = GUILD_TASK_CONCURRENCY,
+) -> list[GuildRunResult]:
+    """jobs 의 (guild_id, args) 마다 fn(*args) 를 동시에 실행하고 길드별 결과를 돌려줍니다."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run_one(guild_id: int, args: tuple) -> GuildRunResult:
+        async with sem:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(fn(*args), deadline)
+            except asyncio.TimeoutError:
+                error = f"{deadline:g}초 초과"
+            except Exception as e:
+                error = repr(e)
+            else:
+                return GuildRunResult(guild_id, True, time.monotonic() - started)
+            print(f"[{name.upper()}] guild {guild_id} 실패: {error}")
+            return GuildRunResult(guild_id, False, time.monotonic() - started, error)
+
+    results = list(await asyncio.gather(*(run_one(guild_id, args) for guild_id, args in jobs)))
+    last_guild_runs[name] = results
+    return results
+
+
+async def sync_guild_nicknames(guild_id: int) -> None:
+    """길드 하나의 인증 유저 Roblox 정보를 조회해 닉네임 업데이트"""
+    guild = bot.get_guild(guild_id)
+    if not guild:
+        return 
+
+    # 인증된 모든 유저 조회
+    users = await user_repo.verified_members(guild_id) 
+
+    if not users:
+        return 
 
-        print(f"[{datetime.now()}] 전체 닉네임 동기화 완료")
+    usernames = [u[1] for u in users]
+    
+    # 배치 처리 (100명씩)
+    BATCH_SIZE = 100
+    for i in range(0, len(usernames), BATCH_SIZE):
+        batch = usernames[i:i + BATCH_SIZE]
         
-    except Exception as e:
-        print(f"sync_all_nicknames_task error: {e}")
+        try:
+            # 현재 Roblox 정보 조회
+            statuses = await rank_api.bulk_status(batch)
+
+            if statuses:
+                for r in statuses:
+                    if r.success:
+                        username = r.username
+                        rank_name = r.role.name if r.role else "?"
+                        
+                        # Discord 닉네임 업데이트
+                        for discord_id, roblox_nick in users:
+                            if roblox_nick == username:
+                                member = guild.get_member(discord_id)
+                                if member:
+                                    try:
+                                        new_nick = f"[{rank_name}] {username}"
+                                        if len(new_nick) > 32:
+                                            new_nick = new_nick[:32]
+                                        
+                                        # 닉네임이 다를 때만 변경
+                                        if member.nick != new_nick:
+                                            await member.edit(nick=new_nick)
+                                    except Exception as e:
+                                        print(f"닉네임 변경 실패 {username}: {e}")
+                                break
+            
+            # Rate limit 방지
+            await asyncio.sleep(1)
+            
+        except Exception as e:
+            print(f"Batch {i} sync error: {e}")
+            continue
+
+
+@supervised_loop(hours=6, deadline=2 * 3600)
+async def sync_all_nicknames_task():
+    """6시간마다 전체 유저의 Roblox 정보를 동기화하고 닉네임 업데이트"""
+    results = await run_per_guild(
+        "nickname_sync",
+        [(guild_id, (guild_id,)) for guild_id, _ in guild_configs.rank_log_targets()],
+        sync_guild_nicknames,
+        deadline=NICKNAME_SYNC_GUILD_DEADLINE,
+    )
+    failed = sum(not r.ok for r in results)
+    print(f"[{datetime.now()}] 전체 닉네임 동기화 완료 (길드 {len(results)}곳, 실패 {failed}곳)")
 
 
 @sync_all_nicknames_task.before_loop
 async def before_sync_all_nicknames_task():
     await bot.wait_until_ready() 
     
-@tasks.loop(seconds=5)
-async def rank_log_task():
-    """5분마다 그룹 가입자들의 랭크를 로그"""
-    try:
-        cursor.execute("SELECT guild_id, channel_id FROM rank_log_settings WHERE enabled=1")
-        settings = cursor.fetchall() 
+# ---------- 랭크 폴링 스케줄러 ----------
+# 길드마다 폴링 간격을 따로 둔다. 변화가 없으면 간격을 2배씩 늘리고(최대 RANK_POLL_MAX_INTERVAL),
+# 변경이 잡히거나 승진/강등 명령이 돌면 RANK_POLL_MIN_INTERVAL 로 되돌린다.
+# rank_log_task 는 RANK_POLL_MIN_INTERVAL 마다 깨어나서 차례가 된 길드만 조회한다.
+#
+# 한 번의 폴링은 명단 전체가 아니라 샤드 하나만 조회한다. 샤드는 roblox_user_id(없으면 닉네임)
+# 해시로 고정 배정하고, 샤드 수는 명단 크기 / RANK_SCAN_SHARD_SIZE 로 정한다.
+# 샤드 K 개를 한 바퀴 도는 시간이 RANK_POLL_MAX_INTERVAL 을 넘지 않도록 간격 상한을 1/K 로 줄인다.
+# 최근 바뀐 유저 / 명령으로 랭크를 바꾼 유저는 다음 몇 번의 폴링에 샤드와 함께 먼저 넣는다.
+
+RANK_POLL_MIN_INTERVAL = 5.0      # 초 (rank_log_task 주기)
+RANK_POLL_MAX_INTERVAL = 300.0    # 초 — 조용한 길드도 한 바퀴에 이보다 오래 묵히지 않는다
+RANK_POLL_BACKOFF = 2.0
+RANK_SCAN_SHARD_SIZE = 200        # 샤드 하나의 목표 인원 (= 한 번에 보내는 요청 크기)
+RANK_SCAN_HOT_POLLS = 3           # 최근 변경 유저를 우선 조회할 폴링 횟수
+RANK_SCAN_HOT_MAX = 100           # 우선 조회 목록 최대 인원
+
+
+def roster_shard(username: str, roblox_user_id: Optional[int], shards: int) -> int:
+    key = roblox_user_id if roblox_user_id else zlib.crc32(username.lower().encode())
+    return key % shards
+
+
+@dataclass(slots=True)
+class RankPollState:
+    interval: float = RANK_POLL_MIN_INTERVAL
+    next_due: float = 0.0
+    polls: int = 0
+    changes: int = 0
+    shards: int = 1
+    cursor: int = 0
+    hot: dict[str, int] = field(default_factory=dict)   # username -> 남은 우선 조회 횟수
+
+
+class RankPollScheduler:
+    def __init__(
+        self,
+        min_interval: float = RANK_POLL_MIN_INTERVAL,
+        max_interval: float = RANK_POLL_MAX_INTERVAL,
+        backoff: float = RANK_POLL_BACKOFF,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._states: dict[int, RankPollState] = {}
+
+    def _state(self, guild_id: int) -> RankPollState:
+        state = self._states.get(guild_id)
+        if state is None:
+            state = self._states[guild_id] = RankPollState(interval=self.min_interval)
+        return state
+
+    def due(self, guild_id: int) -> bool:
+        return time.monotonic() >= self._state(guild_id).next_due
+
+    def next_batch(self, guild_id: int, roster: dict[str, Optional[int]]) -> list[str]:
+        """이번 폴링에서 조회할 닉네임. 우선 조회 유저 + 다음 샤드."""
+        state = self._state(guild_id)
+        shards = max(1, -(-len(roster) // RANK_SCAN_SHARD_SIZE))
+        if shards != state.shards:
+            state.shards = shards
+            state.cursor %= shards
+        shard = state.cursor
+        state.cursor = (state.cursor + 1) % shards
+
+        batch = []
+        for username in list(state.hot):
+            if username in roster:
+                batch.append(username)
+            state.hot[username] -= 1
+            if state.hot[username] <= 0:
+                del state.hot[username]
+        picked = set(batch)
+        batch.extend(
+            username for username, roblox_user_id in roster.items()
+            if username not in picked and roster_shard(username, roblox_user_id, shards) == shard
+        )
+        return batch
+
+    def record(self, guild_id: int, changed: bool, usernames: tuple[str, ...] = ()) -> None:
+        """폴링 결과를 반영해 다음 차례를 정합니다."""
+        state = self._state(guild_id)
+        state.polls += 1
+        self._mark_hot(state, usernames)
+        if changed:
+            state.changes += 1
+            state.interval = self.min_interval
+        else:
+            # 샤드를 한 바퀴 도는 데 max_interval 을 넘지 않도록
+            ceiling = max(self.min_interval, self.max_interval / state.shards)
+            state.interval = min(ceiling, state.interval * self.backoff)
+        state.next_due = time.monotonic() + state.interval
+
+    def nudge(self, guild_id: Optional[int], usernames: tuple[str, ...] = ()) -> None:
+        """랭크를 바꾸는 명령을 실행한 뒤 호출 — 다음 틱에 바로 확인하도록 당긴다."""
+        if guild_id is None:
+            return
+        state = self._state(guild_id)
+        self._mark_hot(state, usernames)
+        state.interval = self.min_interval
+        state.next_due = min(state.next_due, time.monotonic() + self.min_interval)
+
+    @staticmethod
+    def _mark_hot(state: RankPollState, usernames) -> None:
+        for username in usernames:
+            if username not in state.hot and len(state.hot) >= RANK_SCAN_HOT_MAX:
+                break
+            state.hot[username] = RANK_SCAN_HOT_POLLS
+
+    def snapshot(self) -> dict[int, dict]:
+        now = time.monotonic()
+        return {
+            guild_id: {
+                "interval": state.interval,
+                "due_in": round(max(0.0, state.next_due - now), 1),
+                "polls": state.polls,
+                "changes": state.changes,
+                "shard": f"{(state.cursor - 1) % state.shards + 1}/{state.shards}",
+                "hot": len(state.hot),
+            }
+            for guild_id, state in self._states.items()
+        }
+
+
+rank_poll = RankPollScheduler()
+
+
+# ---------- 대량 변경 자동 롤백 ----------
+# 최근 AUTO_ROLLBACK_WINDOW 초 동안 길드에서 랭크가 바뀐 인원이 AUTO_ROLLBACK_THRESHOLD 명
+# 이상이면 이전 랭크로 되돌린다. 폴링은 샤드 하나씩만 보므로, 여러 샤드에 흩어진 대량 변경도
+# 잡히도록 한 번의 폴링이 아니라 시간 창(샤드 한 바퀴)으로 센다.
+# 1) (이전 랭크, 방향) 이 같은 유저끼리 ROLLBACK_BULK_SIZE 명씩 묶어 bulk-promote/demote-to-role
+#    로 한 번에 복구 (짧은 타임아웃, 재시도 없음)
+# 2) 그 묶음에서 실패/누락된 유저는 기다리지 않고 바로 /rank 로 개별 복구
+#    (동시 ROLLBACK_CONCURRENCY 건, 재시도 포함)
+# 롤백은 폴링과 따로 돌고, 진행 상황은 한 개의 embed 를 계속 고쳐서 보여준다.
+# 롤백 중인 유저는 그 길드의 폴링 diff 에서 빠진다. (같은 변경으로 롤백이 겹치지 않도록)
+# 미러(current_rank)는 이번 폴링의 롤백 대상 행을 바꾸지 않은 채로 두고(창 안의 이전 폴링
+# 변경은 이미 반영돼 있다), 롤백이 끝나면 복구된 유저는 이전 랭크, 복구 못 한 유저는 관측한
+# 새 랭크가 미러와 다를 때만 그 차이를 미러와 기록에 반영한다.
+# (그래야 다음 폴링에서 같은 변경으로 다시 롤백하지 않는다)
+# 미러 반영이 실패하더라도, 복구 못 한 (유저, 새 랭크) 는 랭크가 다시 바뀌기 전까지
+# 창에 세지 않는다. (실패한 롤백이 폴링마다 되풀이되지 않도록)
+
+AUTO_ROLLBACK_THRESHOLD = 10
+AUTO_ROLLBACK_WINDOW = RANK_POLL_MAX_INTERVAL   # 초
+ROLLBACK_CONCURRENCY = 8
+ROLLBACK_ATTEMPTS = 3
+ROLLBACK_BULK_SIZE = 40        # 랭크 서버가 8명씩 병렬 처리 → 한 묶음이 몇 초 안에 끝나는 크기
+ROLLBACK_EMBED_INTERVAL = 2.0   # 초 — 진행 embed 수정 최소 간격
+
+
+class RollbackStatus(str, Enum):
+    PENDING = "pending"
+    RESTORED = "restored"
+    FAILED = "failed"
+
+
+@dataclass(slots=True)
+class RollbackOutcome:
+    username: str
+    old_rank: int
+    old_rank_name: Optional[str]
+    new_rank: Optional[int]
+    status: RollbackStatus = RollbackStatus.PENDING
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class RankRollback:
+    def __init__(
+        self,
+        guild_id: int,
+        channel: discord.abc.Messageable,
+        changes: list[RankChangeRow],
+        mirror: dict[str, tuple[Optional[int], Optional[str]]] | None = None,
+    ):
+        self.guild_id = guild_id
+        self.channel = channel
+        self.changes = {ch.username: ch for ch in changes}
+        # 유저별로 지금 미러에 들어 있는 (rank, rank_name). 없으면 이전 랭크 그대로라고 본다
+        self.mirror = mirror or {}
+        self.outcomes: dict[str, RollbackOutcome] = {
+            ch.username: RollbackOutcome(ch.username, ch.old_rank, ch.old_rank_name, ch.new_rank)
+            for ch in changes
+        }
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self._message: Optional[discord.Message] = None
+        self._rendered_at = 0.0
+
+    def count(self, status: RollbackStatus) -> int:
+        return sum(o.status is status for o in self.outcomes.values())
+
+    def settled_rows(self) -> list[RankChangeRow]:
+        """롤백이 끝난 뒤 미러/기록에 반영할 행 (미러 값 → 복구된 이전 랭크 또는 관측한 새 랭크)"""
+        rows = []
+        for name, o in self.outcomes.items():
+            ch = self.changes[name]
+            seen_rank, seen_name = self.mirror.get(name, (ch.old_rank, ch.old_rank_name))
+            if o.status is RollbackStatus.RESTORED:
+                rank, rank_name = ch.old_rank, ch.old_rank_name
+            else:
+                rank, rank_name = ch.new_rank, ch.new_rank_name
+            if rank != seen_rank:
+                rows.append(RankChangeRow(name, seen_rank, seen_name, rank, rank_name))
+        return rows
+
+    async def run(self) -> None:
+        await self._render(force=True)
+        sem = asyncio.Semaphore(ROLLBACK_CONCURRENCY)
+
+        groups: dict[tuple[int, bool], list[str]] = {}
+        for o in self.outcomes.values():
+            demote = o.new_rank is not None and o.new_rank > o.old_rank
+            groups.setdefault((o.old_rank, demote), []).append(o.username)
+        await asyncio.gather(*(
+            self._restore_chunk(sem, rank, demote, names[i:i + ROLLBACK_BULK_SIZE])
+            for (rank, demote), names in groups.items()
+            for i in range(0, len(names), ROLLBACK_BULK_SIZE)
+        ))
+        self.finished = time.monotonic()
+        await self._render(force=True)
+
+    async def _restore_chunk(self, sem: asyncio.Semaphore, rank: int, demote: bool, usernames: list[str]) -> None:
+        """bulk 한 번 → 남은 유저는 곧바로 개별 복구"""
+        await self._restore_bulk(sem, rank, demote, usernames)
+        await asyncio.gather(*(
+            self._restore_one(sem, self.outcomes[username])
+            for username in usernames
+            if self.outcomes[username].status is RollbackStatus.PENDING
+        ))
+
+    async def _restore_bulk(self, sem: asyncio.Semaphore, rank: int, demote: bool, usernames: list[str]) -> None:
+        call = rank_api.bulk_demote_to_role if demote else rank_api.bulk_promote_to_role
+        async with sem:
+            try:
+                # 한 번만 시도한다 — 실패하면 개별 복구가 재시도를 맡는다
+                results = await call(usernames, str(rank), timeout_key="rollback-bulk")
+            except Exception as e:
+                # 개별 복구 단계에서 다시 시도
+                for username in usernames:
+                    self.outcomes[username].attempts += 1
+                    self.outcomes[username].error = repr(e)
+                return
+        by_name = {r.username.lower(): r for r in results}
+        for username in usernames:
+            o = self.outcomes[username]
+            o.attempts += 1
+            r = by_name.get(username.lower())
+            if r is not None and r.success and (r.role is None or r.role.rank == o.old_rank):
+                o.status = RollbackStatus.RESTORED
+                o.error = None
+            else:
+                o.error = (r.error if r is not None else None) or "bulk 결과 없음"
+        await self._render()
+
+    async def _restore_one(self, sem: asyncio.Semaphore, o: RollbackOutcome) -> None:
+        async def attempt():
+            o.attempts += 1
+            return await rank_api.set_rank(o.username, o.old_rank)
+
+        async with sem:
+            try:
+                await call_with_retry(attempt, attempts=ROLLBACK_ATTEMPTS, base_delay=0.5, max_delay=4.0)
+            except Exception as e:
+                o.status = RollbackStatus.FAILED
+                o.error = e.text[:100] if isinstance(e, UpstreamHTTPError) else repr(e)
+            else:
+                o.status = RollbackStatus.RESTORED
+                o.error = None
+        await self._render()
+
+    def _embed(self) -> discord.Embed:
+        restored = self.count(RollbackStatus.RESTORED)
+        failed = self.count(RollbackStatus.FAILED)
+        pending = self.count(RollbackStatus.PENDING)
+        elapsed = (self.finished or time.monotonic()) - self.started
+        if self.finished is None:
+            title, color = "자동 롤백 진행 중", discord.Color.red()
+        elif failed:
+            title, color = "자동 롤백 완료 (일부 실패)", discord.Color.orange()
+        else:
+            title, color = "자동 롤백 완료", discord.Color.green()
+        embed = discord.Embed(
+            title=title,
+            description=f"최근 {AUTO_ROLLBACK_WINDOW:g}초 동안 {len(self.outcomes)}명 변경 감지 → 이전 랭크로 복구",
+            color=color,
+            timestamp=datetime.now(timezone.utc),
+        )
+        embed.add_field(
+            name="진행",
+            value=f"복구 {restored} · 실패 {failed} · 대기 {pending} · {elapsed:.1f}초",
+            inline=False,
+        )
+        failed_lines = [
+            f"{o.username} → {o.old_rank_name or o.old_rank}: {o.error} ({o.attempts}회)"
+            for o in self.outcomes.values()
+            if o.status is RollbackStatus.FAILED
+        ]
+        if failed_lines:
+            embed.add_field(name="실패", value="\n".join(failed_lines[:20])[:1024], inline=False)
+        restored_lines = [
+            f"{o.username} → {o.old_rank_name or o.old_rank}"
+            for o in self.outcomes.values()
+            if o.status is RollbackStatus.RESTORED
+        ]
+        if restored_lines:
+            embed.add_field(name="복구됨", value="\n".join(restored_lines[:20])[:1024], inline=False)
+        return embed
 
-        for guild_id, channel_id in settings:
-            guild = bot.get_guild(guild_id)
-            if not guild:
-                continue 
+    async def _render(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._rendered_at < ROLLBACK_EMBED_INTERVAL:
+            return
+        self._rendered_at = now
+        try:
+            if self._message is None:
+                self._message = await self.channel.send(embed=self._embed())
+            else:
+                await self._message.edit(embed=self._embed())
+        except Exception as e:
+            add_error_log(f"rollback_embed {self.guild_id}: {repr(e)}")
+
+
+class RankRollbackManager:
+    def __init__(self):
+        self._active: dict[int, list[RankRollback]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._recent: dict[int, deque[tuple[float, RankChangeRow]]] = {}
+        # 롤백에 실패한 유저 → 그때 관측한 새 랭크. 같은 랭크로 다시 잡혀도 롤백을 또 걸지 않는다
+        self._unrecoverable: dict[int, dict[str, Optional[int]]] = {}
+
+    def in_flight(self, guild_id: int) -> set[str]:
+        return {name for rb in self._active.get(guild_id, ()) for name in rb.outcomes}
+
+    def observe(self, guild_id: int, changes: list[RankChangeRow], window: float = AUTO_ROLLBACK_WINDOW) -> list[RankChangeRow]:
+        """랭크 변경을 길드의 시간 창에 넣고, 창 안의 변경을 유저별로 합쳐 돌려줍니다."""
+        failed = self._unrecoverable.get(guild_id)
+        if failed:
+            counted = []
+            for ch in changes:
+                if ch.username in failed and failed[ch.username] == ch.new_rank:
+                    continue
+                # 랭크가 또 바뀌었으면 새 변경으로 센다
+                failed.pop(ch.username, None)
+                counted.append(ch)
+            changes = counted
+        now = time.monotonic()
+        recent = self._recent.setdefault(guild_id, deque())
+        recent.extend((now, ch) for ch in changes)
+        while recent and now - recent[0][0] > window:
+            recent.popleft()
+        if not recent:
+            del self._recent[guild_id]
+            return []
+        # 한 유저가 여러 번 바뀌었으면 처음 랭크 → 마지막 랭크로 합친다
+        merged: dict[str, RankChangeRow] = {}
+        for _, ch in recent:
+            first = merged.get(ch.username)
+            if first is None:
+                merged[ch.username] = ch
+            else:
+                merged[ch.username] = RankChangeRow(
+                    ch.username, first.old_rank, first.old_rank_name, ch.new_rank, ch.new_rank_name
+                )
+        return [ch for ch in merged.values() if ch.old_rank != ch.new_rank]
 
-            channel = guild.get_channel(channel_id)
-            if not channel:
-                continue 
+    def forget(self, guild_id: int) -> None:
+        self._recent.pop(guild_id, None)
 
+    def start(
+        self,
+        guild_id: int,
+        channel,
+        changes: list[RankChangeRow],
+        mirror: dict[str, tuple[Optional[int], Optional[str]]] | None = None,
+    ) -> RankRollback:
+        self.forget(guild_id)
+        rollback = RankRollback(guild_id, channel, changes, mirror)
+        self._active.setdefault(guild_id, []).append(rollback)
+        task = asyncio.create_task(self._run(rollback), name=f"rollback-{guild_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return rollback
+
+    async def _run(self, rollback: RankRollback) -> None:
+        try:
             try:
-                cursor.execute(
-                    "SELECT roblox_nick FROM users WHERE guild_id=? AND verified=1",
-                    (guild_id,),
+                await rollback.run()
+            except Exception as e:
+                add_error_log(f"rollback {rollback.guild_id}: {repr(e)}")
+            failed = {
+                name: rollback.changes[name].new_rank
+                for name, o in rollback.outcomes.items()
+                if o.status is not RollbackStatus.RESTORED
+            }
+            if failed:
+                self._unrecoverable.setdefault(rollback.guild_id, {}).update(failed)
+            settled = rollback.settled_rows()
+            if settled:
+                await asyncio.shield(_commit_rank_diff(rollback.guild_id, settled, {}))
+        except Exception as e:
+            add_error_log(f"rollback_commit {rollback.guild_id}: {repr(e)}")
+        finally:
+            self._active[rollback.guild_id].remove(rollback)
+            if not self._active[rollback.guild_id]:
+                del self._active[rollback.guild_id]
+            # 복구 결과를 다음 폴링에서 바로 확인
+            rank_poll.nudge(rollback.guild_id, tuple(rollback.outcomes))
+
+
+rank_rollbacks = RankRollbackManager()
+
+
+async def _commit_rank_diff(guild_id: int, diff: list[RankChangeRow], user_ids: dict) -> int:
+    await current_rank_repo.apply(guild_id, diff, user_ids)
+    return await rank_history_repo.record(
+        guild_id, diff, lambda: current_rank_repo.snapshot(guild_id)
+    )
+
+
+async def poll_rank_log_guild(guild_id: int, channel_id: int) -> None:
+    """차례가 된 길드 하나의 그룹 가입자 랭크를 비교해 로그"""
+    guild = bot.get_guild(guild_id)
+    if not guild:
+        return 
+
+    channel = guild.get_channel(channel_id)
+    if not channel:
+        return 
+
+    if not rank_poll.due(guild_id):
+        return 
+
+    changed = False
+    changed_users: tuple[str, ...] = ()
+    try:
+        user_ids = await user_repo.verified_roblox_ids(guild_id) 
+
+        if not user_ids:
+            return 
+
+        # 샤드 하나 + 우선 조회 유저만 (미러는 조회한 행만 갱신된다)
+        statuses = await rank_api.bulk_status(rank_poll.next_batch(guild_id, user_ids))
+
+        if not statuses:
+            return 
+
+        # current_rank 미러와 한 번 훑어 바뀐 행만 추린다
+        diff = await current_rank_repo.diff(guild_id, statuses) 
+
+        # 롤백 중인 유저는 롤백이 끝난 뒤 다시 본다
+        busy = rank_rollbacks.in_flight(guild_id)
+        if busy:
+            diff = [ch for ch in diff if ch.username not in busy]
+        changed = bool(diff)
+        changed_users = tuple(ch.username for ch in diff)
+
+        # 변경 사항만 찾기 (새로 들어온 유저는 랭크 변경이 아님)
+        rank_changes = [ch for ch in diff if ch.old_rank is not None and ch.old_rank != ch.new_rank]
+        changes = [
+            {
+                "username": ch.username,
+                "old_rank": ch.old_rank,
+                "old_rank_name": ch.old_rank_name,
+                "new_rank": ch.new_rank,
+                "new_rank_name": ch.new_rank_name,
+            }
+            for ch in rank_changes
+        ] 
+
+        # 최근 AUTO_ROLLBACK_WINDOW 초 동안 AUTO_ROLLBACK_THRESHOLD 명 이상 바뀌면 자동 롤백
+        window = rank_rollbacks.observe(guild_id, rank_changes) if rank_changes else []
+        if len(window) >= AUTO_ROLLBACK_THRESHOLD and guild_configs.get(guild_id).auto_rollback:
+            current = {ch.username: ch for ch in rank_changes}
+            # 이번 폴링의 변경은 아직 미러에 없고, 창 안의 이전 폴링 변경은 이미 반영돼 있다
+            mirror = {
+                ch.username: (
+                    (current[ch.username].old_rank, current[ch.username].old_rank_name)
+                    if ch.username in current else (ch.new_rank, ch.new_rank_name)
                 )
-                users = cursor.fetchall() 
+                for ch in window
+            }
+            rank_rollbacks.start(guild_id, channel, window, mirror)
+            # 이번 폴링의 롤백 대상 행은 롤백이 끝날 때 반영한다 (RankRollbackManager._run).
+            # 가입/이름 변경처럼 롤백과 무관한 행은 지금 바로 반영한다.
+            rest = [ch for ch in diff if ch.username not in current]
+            if rest:
+                await asyncio.shield(_commit_rank_diff(guild_id, rest, user_ids))
+            return 
 
-                if not users:
-                    continue 
+        if not diff:
+            return 
 
-                usernames = [u[0] for u in users]
-                
-                try:
-                    resp = requests.post(
-                        f"{RANK_API_URL_ROOT}/bulk-status",
-                        json={"usernames": usernames},
-                        headers=_rank_api_headers(),
-                        timeout=30,
-                    ) 
-
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        
-                        # 현재 상태
-                        current_state = {}
-                        for r in data.get("results", []):
-                            if r.get("success"):
-                                role_info = r.get("role", {})
-                                current_state[r['username']] = {
-                                    "rank": role_info.get('rank', 0),
-                                    "rank_name": role_info.get('name', '?')
-                                } 
-
-                        # 이전 로그 가져오기
-                        cursor.execute(
-                            "SELECT id, log_data FROM rank_log_history WHERE guild_id=? ORDER BY id DESC LIMIT 1",
-                            (guild_id,),
-                        )
-                        prev_row = cursor.fetchone() 
-
-                        changes = []
-                        if prev_row:
-                            prev_id, prev_log = prev_row
-                            prev_data = json.loads(prev_log)
-                            prev_state = {item["username"]: item for item in prev_data} 
-
-                            # 변경 사항만 찾기
-                            for username, current in current_state.items():
-                                if username in prev_state:
-                                    prev = prev_state[username]
-                                    if prev["rank"] != current["rank"]:
-                                        changes.append({
-                                            "username": username,
-                                            "old_rank": prev["rank"],
-                                            "old_rank_name": prev["rank_name"],
-                                            "new_rank": current["rank"],
-                                            "new_rank_name": current["rank_name"]
-                                        }) 
-
-                        # 변경사항이 있을 때만 처리
-                        if changes:
-                            # 5초 안에 10명 이상 변경 시 자동 롤백 체크
-                            cursor.execute(
-                                "SELECT auto_rollback FROM rollback_settings WHERE guild_id=?",
-                                (guild_id,),
-                            )
-                            rollback_row = cursor.fetchone()
-                            auto_rollback = rollback_row[0] if rollback_row else 1 
-
-                            if len(changes) >= 10 and auto_rollback == 1:
-                                # 자동 롤백 실행
-                                try:
-                                    rollback_results = []
-                                    for change in changes:
-                                        resp_rollback = requests.post(
-                                            f"{RANK_API_URL_ROOT}/rank",
-                                            json={
-                                                "username": change["username"],
-                                                "rank": change["old_rank"]
-                                            },
-                                            headers=_rank_api_headers(),
-                                            timeout=15,
-                                        )
-                                        if resp_rollback.status_code == 200:
-                                            rollback_results.append(f"{change['username']}")
-                                        else:
-                                            rollback_results.append(f"{change['username']}") 
-
-                                    # 롤백 알림
-                                    embed = discord.Embed(
-                                        title="자동 롤백 실행",
-                                        description=f"5분 내 {len(changes)}명 변경 감지 → 자동 롤백",
-                                        color=discord.Color.red(),
-                                        timestamp=datetime.now(timezone.utc),
-                                    )
-                                    embed.add_field(
-                                        name="롤백 결과",
-                                        value="\n".join(rollback_results[:20]),
-                                        inline=False
-                                    )
-                                    await channel.send(embed=embed)
-                                    
-                                    # 롤백했으니 로그는 저장 안 함
-                                    continue 
-
-                                except Exception as e:
-                                    print(f"Auto rollback error: {e}") 
-
-                            # 로그 저장
-                            log_data = [{"username": k, **v} for k, v in current_state.items()]
-                            cursor.execute(
-                                "INSERT INTO rank_log_history(guild_id, log_data, created_at) VALUES(?, ?, ?)",
-                                (guild_id, json.dumps(log_data), datetime.now().isoformat()),
-                            )
-                            conn.commit()
-                            
-                            cursor.execute(
-                                "SELECT id FROM rank_log_history WHERE guild_id=? ORDER BY id DESC LIMIT 1",
-                                (guild_id,),
-                            )
-                            log_id = cursor.fetchone()[0]
-                            
-                            # 변경사항 출력
-                            change_lines = []
-                            for c in changes:
-                                change_lines.append(
-                                    f"{c['username']}: {c['old_rank_name']}(rank {c['old_rank']}) → {c['new_rank_name']}(rank {c['new_rank']})"
-                                )
-                            
-                            msg = "\n".join(change_lines)
-                            embed = discord.Embed(
-                                title="명단 변경 로그",
-                                description=msg[:2000],
-                                color=discord.Color.orange(),
-                                timestamp=datetime.now(timezone.utc),
-                            )
-                            embed.set_footer(text=f"일련번호: {log_id} | 변경: {len(changes)}건")
-                            await channel.send(embed=embed) 
+        # 바뀐 행만 upsert + 기록 (가입/이름 변경 같은 조용한 변경도 남긴다)
+        # 마감 시간에 걸려도 반영과 기록은 끝까지 간다 (반쪽 반영 방지)
+        log_id = await asyncio.shield(_commit_rank_diff(guild_id, diff, user_ids))
 
-                except Exception as e:
-                    print(f"rank_log_task API error: {e}") 
+        if changes:
+            # 변경사항 출력
+            change_lines = []
+            for c in changes:
+                change_lines.append(
+                    f"{c['username']}: {c['old_rank_name']}(rank {c['old_rank']}) → {c['new_rank_name']}(rank {c['new_rank']})"
+                )
+            
+            msg = "\n".join(change_lines)
+            embed = discord.Embed(
+                title="명단 변경 로그",
+                description=msg[:2000],
+                color=discord.Color.orange(),
+                timestamp=datetime.now(timezone.utc),
+            )
+            embed.set_footer(text=f"일련번호: {log_id} | 변경: {len(changes)}건")
+            await channel.send(embed=embed)
 
-            except Exception as e:
-                print(f"rank_log_task error for guild {guild_id}: {e}") 
+    finally:
+        rank_poll.record(guild_id, changed, changed_users)
 
-    except Exception as e:
-        print(f"rank_log_task error: {e}")
+
+@supervised_loop(seconds=RANK_POLL_MIN_INTERVAL, deadline=RANK_LOG_GUILD_DEADLINE * 2)
+async def rank_log_task():
+    """차례가 된 길드들을 동시에(최대 GUILD_TASK_CONCURRENCY 개) 폴링"""
+    await run_per_guild(
+        "rank_log",
+        [(guild_id, (guild_id, channel_id)) for guild_id, channel_id in guild_configs.rank_log_targets()],
+        poll_rank_log_guild,
+        deadline=RANK_LOG_GUILD_DEADLINE,
+    )
 
 
 @rank_log_task.before_loop
@@ -3437,23 +5299,13 @@ async def on_app_command_completion(
         if options:
             full_str += " " + " ".join(options)
 
-        cursor.execute(
-            """
-            INSERT INTO command_logs(
-                guild_id, user_id, user_name,
-                command_name, command_full, created_at
-            )
-            VALUES(?, ?, ?, ?, ?, datetime('now'))
-            """,
-            (
-                guild_id,
-                user.id,
-                f"{user.name}#{user.discriminator}",
-                command.qualified_name,
-                full_str,
-            ),
+        command_log_repo.add(
+            guild_id,
+            user.id,
+            f"{user.name}#{user.discriminator}",
+            command.qualified_name,
+            full_str,
         )
-        conn.commit()
     except Exception as e:
         add_error_log(f"command_log: {repr(e)}")
 
@@ -3482,6 +5334,12 @@ async def on_ready():
 
     if not sync_all_nicknames_task.is_running():
         sync_all_nicknames_task.start()
+
+    if not retention_task.is_running():
+        retention_task.start()
+
+    if not legacy_backfill_task.is_running():
+        legacy_backfill_task.start()
 @bot.event
 async def on_interaction(interaction: discord.Interaction): 
 
@@ -3496,4 +5354,6 @@ async def on_interaction(interaction: discord.Interaction):
                 return 
 
 if __name__ == "__main__":
+    if "--rebuild-balances" in sys.argv:
+        sys.exit(run_rebuild_balances())
     bot.run(TOKEN)
@@ -0,0 +1,1174 @@
+"""bot.db 접근 계층: Database(스레드 분리 SQLite), 마이그레이션, 저장소(repository), 핫 쿼리 목록.
+
+이 모듈은 import 만으로는 아무 DB 도 열지 않는다. 커넥션/마이그레이션은 bot.py 가 시작할 때 한다.
+"""
+import os
+import re
+import gzip
+import json
+import time
+import queue
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# =========================
+# 데이터베이스
+# =========================
+# 이벤트 루프에서 SQLite 를 직접 만지지 않는다.
+# 읽기: 작은 스레드 풀에서 스레드마다 자기 커넥션으로 실행
+# 쓰기: 전용 writer 스레드 하나가 큐에서 꺼내 순서대로 실행하고,
+#       WAL + synchronous=NORMAL 에서 여러 건을 묶어 한 번에 커밋(group commit)
+#       돈이 걸린 쓰기는 durable=True 로 보내면 그 묶음을 synchronous=FULL 로 즉시 커밋
+
+DB_READ_POOL_SIZE = 4
+DB_GROUP_COMMIT_WINDOW = 0.05   # 첫 쓰기 이후 이만큼 더 모아서 커밋 (초)
+DB_GROUP_COMMIT_MAX = 64        # 한 번에 커밋할 최대 작업 수
+
+
+@dataclass(slots=True)
+class WriteResult:
+    lastrowid: Optional[int]
+    rowcount: int
+
+
+class Database:
+    def __init__(
+        self,
+        path: str,
+        read_pool_size: int = DB_READ_POOL_SIZE,
+        on_write_error: Callable[[str], None] = print,
+    ):
+        self.path = path
+        self.on_write_error = on_write_error
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(
+            max_workers=read_pool_size,
+            thread_name_prefix=f"db-read-{os.path.basename(path)}",
+        )
+        self._writes: queue.Queue = queue.Queue()
+        self._pending = None
+        self.commits = 0
+        self.committed_jobs = 0
+        self._writer = threading.Thread(
+            target=self._writer_loop,
+            name=f"db-writer-{os.path.basename(path)}",
+            daemon=True,
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: 트랜잭션은 writer 가 BEGIN/COMMIT 으로 직접 관리
+        c = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        return c
+
+    def _reader(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = self._local.conn = self._connect()
+        return c
+
+    # ----- 읽기 -----
+    def fetchone_sync(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        """현재 스레드의 커넥션으로 바로 읽습니다. (동기 함수 전용, 짧은 PK 조회만)"""
+        return self._reader().execute(sql, params).fetchone()
+
+    def fetchall_sync(self, sql: str, params: tuple = ()) -> list[tuple]:
+        return self._reader().execute(sql, params).fetchall()
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self.fetchone_sync, sql, params)
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> list[tuple]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self.fetchall_sync, sql, params)
+
+    @property
+    def pending_writes(self) -> int:
+        """writer 큐에 쌓여 있는 쓰기 작업 수"""
+        return self._writes.qsize()
+
+    # ----- 쓰기 -----
+    def submit_fn(self, fn, durable: bool = False) -> Future:
+        """fn(conn) 을 writer 스레드에서 실행합니다. (실패하면 fn 의 변경만 롤백)"""
+        fut: Future = Future()
+        self._writes.put((fn, fut, durable, False))
+        return fut
+
+    async def maintenance(self, fn):
+        """fn(conn) 을 트랜잭션 밖에서 실행합니다. (VACUUM, PRAGMA optimize 등)"""
+        fut: Future = Future()
+        self._writes.put((fn, fut, True, True))
+        return await asyncio.wrap_future(fut)
+
+    def submit(self, sql: str, params: tuple = ()) -> Future:
+        """기다릴 필요 없는 쓰기용. 실패는 에러 로그에 남깁니다."""
+        fut = self.submit_fn(lambda c: _write_result(c.execute(sql, params)))
+        fut.add_done_callback(self.log_write_error)
+        return fut
+
+    async def run(self, fn, durable: bool = False):
+        return await asyncio.wrap_future(self.submit_fn(fn, durable))
+
+    def run_sync(self, fn, durable: bool = False):
+        return self.submit_fn(fn, durable).result()
+
+    async def execute(self, sql: str, params: tuple = (), durable: bool = False) -> WriteResult:
+        return await self.run(lambda c: _write_result(c.execute(sql, params)), durable)
+
+    async def executemany(self, sql: str, seq_of_params, durable: bool = False) -> WriteResult:
+        rows = list(seq_of_params)
+        return await self.run(lambda c: _write_result(c.executemany(sql, rows)), durable)
+
+    def _collect_group(self, first) -> tuple[list, bool]:
+        """첫 작업 뒤로 창(window)이 끝나거나 durable 작업이 올 때까지 모읍니다."""
+        group = [first]
+        if first[2]:
+            return group, False
+        deadline = time.monotonic() + DB_GROUP_COMMIT_WINDOW
+        while len(group) < DB_GROUP_COMMIT_MAX:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._writes.get(timeout=remaining) if remaining > 0 else self._writes.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return group, True
+            if item[3]:
+                self._pending = item
+                break
+            group.append(item)
+            if item[2]:
+                break
+        return group, False
+
+    def _commit_group(self, c: sqlite3.Connection, group: list) -> None:
+        durable = any(item[2] for item in group)
+        done = []
+        if durable:
+            # 트랜잭션 안에서는 바꿀 수 없으므로 BEGIN 전에 올리고 끝나면 되돌린다
+            c.execute("PRAGMA synchronous=FULL")
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            for fn, fut, *_ in group:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                # 작업마다 SAVEPOINT: 하나가 실패해도 같은 묶음의 다른 작업은 살린다
+                c.execute("SAVEPOINT job")
+                try:
+                    result = fn(c)
+                except BaseException as e:
+                    c.execute("ROLLBACK TO job")
+                    c.execute("RELEASE job")
+                    fut.set_exception(e)
+                else:
+                    c.execute("RELEASE job")
+                    done.append((fut, result))
+            c.execute("COMMIT")
+        except BaseException as e:
+            if c.in_transaction:
+                try:
+                    c.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+            # 시작도 못 한 작업, ROLLBACK TO 에서 멈춘 작업까지 모두 실패로 알린다
+            # 커밋 전이라 done 의 결과도 무효. 아직 결과를 안 알린 future 는 모두 실패 처리
+            for _, fut, *_ in group:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            if durable:
+                c.execute("PRAGMA synchronous=NORMAL")
+        self.commits += 1
+        self.committed_jobs += len(done)
+        # 커밋이 끝난 뒤에야 결과를 알려준다
+        for fut, result in done:
+            fut.set_result(result)
+
+    def _writer_loop(self) -> None:
+        c = self._connect()
+        stop = False
+        while not stop:
+            item, self._pending = self._pending or self._writes.get(), None
+            if item is None:
+                break
+            if item[3]:
+                self._run_outside_transaction(c, item)
+                continue
+            group, stop = self._collect_group(item)
+            self._commit_group(c, group)
+        c.close()
+
+    def _run_outside_transaction(self, c: sqlite3.Connection, item) -> None:
+        fn, fut = item[0], item[1]
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(c)
+        except BaseException as e:
+            fut.set_exception(e)
+        else:
+            fut.set_result(result)
+
+    def log_write_error(self, fut: Future) -> None:
+        """기다리지 않는 쓰기의 실패를 on_write_error 로 넘깁니다. (add_done_callback 용)"""
+        if not fut.cancelled() and fut.exception() is not None:
+            self.on_write_error(f"db_write: {repr(fut.exception())}")
+
+    def close(self) -> None:
+        """쌓인 쓰기를 모두 처리한 뒤 writer 를 멈춥니다."""
+        if self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
+        self._readers.shutdown(wait=True)
+
+
+def _write_result(cur: sqlite3.Cursor) -> WriteResult:
+    return WriteResult(cur.lastrowid, cur.rowcount)
+
+
+
+
+# ---------- DB 스키마 ----------
+def _migration_001_baseline(c: sqlite3.Connection) -> None:
+    """기존에 import 시점마다 만들던 테이블 전부 + economy."""
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS rank_log_history(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER,
+            log_data TEXT,
+            created_at TEXT
+        )"""
+    )
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS senior_officer_settings(
+            guild_id INTEGER PRIMARY KEY,
+            senior_officer_role_id INTEGER
+        )"""
+    )
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS blacklist(
+            guild_id INTEGER,
+            group_id INTEGER,
+            PRIMARY KEY(guild_id, group_id)
+        )"""
+    )
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS rank_log_settings(
+            guild_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            enabled INTEGER DEFAULT 0
+        )"""
+    )
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS forced_verified(
+            discord_id INTEGER,
+            guild_id INTEGER,
+            roblox_nick TEXT,
+            roblox_user_id INTEGER,
+            rank_role TEXT,
+            PRIMARY KEY(discord_id, guild_id)
+        )"""
+    )
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS users(
+            discord_id INTEGER,
+            guild_id INTEGER,
+            roblox_nick TEXT,
+            roblox_user_id INTEGER,
+            code TEXT,
+            expire_time TEXT,
+            verified INTEGER DEFAULT 0,
+            PRIMARY KEY(discord_id, guild_id)
+        )"""
+    ) 
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS stats(
+            guild_id INTEGER PRIMARY KEY,
+            verify_count INTEGER DEFAULT 0,
+            force_count INTEGER DEFAULT 0,
+            cancel_count INTEGER DEFAULT 0
+        )"""
+    ) 
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS settings(
+            guild_id INTEGER PRIMARY KEY,
+            role_id INTEGER,
+            status_channel_id INTEGER,
+            admin_role_id TEXT
+        )"""
+    ) 
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS logchannels (
+        guildid   INTEGER,
+        logtype   TEXT,
+        channelid INTEGER,
+        PRIMARY KEY (guildid, logtype)
+    )
+    """)
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS officer_settings(
+            guild_id INTEGER PRIMARY KEY,
+            officer_role_id INTEGER
+        )"""
+    )
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS group_settings(
+            guild_id INTEGER PRIMARY KEY,
+            group_id INTEGER
+        )"""
+    ) 
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS rollback_settings(
+            guild_id INTEGER PRIMARY KEY,
+            auto_rollback INTEGER DEFAULT 1
+        )"""
+    )
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS shop_items(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER,
+        name TEXT,
+        price INTEGER,
+        type TEXT,          -- 'role', 'level', 'exp'
+        role_id INTEGER,    -- type='role' 일 때만 사용
+        level INTEGER,      -- type='level' 일 때만 사용
+        exp INTEGER         -- type='exp' 일 때만 사용
+    )
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS command_logs(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER,
+        user_id INTEGER,
+        user_name TEXT,
+        command_name TEXT,
+        command_full TEXT,
+        created_at TEXT
+    )
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS web_log_journal(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        payload TEXT,
+        created_at TEXT
+    )
+    """)
+
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS economy(
+            user_id INTEGER PRIMARY KEY,
+            money INTEGER DEFAULT 0,
+            last_daily INTEGER DEFAULT 0,
+            exp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1
+        )"""
+    )
+
+
+def _migration_002_import_legacy_economy(c: sqlite3.Connection) -> None:
+    """예전 economy.db (작업 디렉터리 기준 상대경로) 의 데이터를 가져옵니다."""
+    # ATTACH 는 트랜잭션 안에서 못 쓰므로 별도 커넥션으로 읽어서 넣는다
+    seen = set()
+    for path in (os.path.abspath("economy.db"), os.path.join(BASE_DIR, "economy.db")):
+        real = os.path.realpath(path)
+        if real in seen or not os.path.exists(real):
+            continue
+        seen.add(real)
+        try:
+            legacy = sqlite3.connect(f"file:{real}?mode=ro", uri=True)
+            try:
+                rows = legacy.execute(
+                    "SELECT user_id, money, last_daily, exp, level FROM economy"
+                ).fetchall()
+            finally:
+                legacy.close()
+        except sqlite3.Error as e:
+            print("[MIGRATION] legacy economy.db 읽기 실패:", real, repr(e))
+            continue
+        c.executemany(
+            "INSERT OR IGNORE INTO economy(user_id, money, last_daily, exp, level) VALUES(?, ?, ?, ?, ?)",
+            rows,
+        )
+        print(f"[MIGRATION] legacy economy.db 에서 {len(rows)}명 이전: {real}")
+
+
+def _migration_003_hot_query_indexes(c: sqlite3.Connection) -> None:
+    """HOT_QUERIES 가 테이블 풀스캔을 하지 않도록 커버링 인덱스를 추가합니다."""
+    # rank_log_task (5초마다) / 일괄 승진·강등 / 닉네임 동기화
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_guild_verified "
+        "ON users(guild_id, verified, roblox_nick, discord_id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_forced_verified_guild "
+        "ON forced_verified(guild_id, roblox_nick)"
+    )
+    # rowid(id) 는 인덱스에 자동으로 붙으므로 ORDER BY id 도 인덱스 순서로 읽힌다
+    c.execute("CREATE INDEX IF NOT EXISTS idx_command_logs_guild ON command_logs(guild_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rank_log_history_guild ON rank_log_history(guild_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_economy_level_exp ON economy(level DESC, exp DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_shop_items_guild_name ON shop_items(guild_id, name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_shop_items_guild_price ON shop_items(guild_id, price)")
+
+
+def _migration_004_rank_history_deltas(c: sqlite3.Connection) -> None:
+    """랭크 기록을 keyframe + delta 방식으로. 기존 행은 모두 전체 스냅샷이므로 keyframe."""
+    c.execute("ALTER TABLE rank_log_history ADD COLUMN kind TEXT NOT NULL DEFAULT 'keyframe'")
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS rank_log_changes(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            log_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            old_rank INTEGER,
+            old_rank_name TEXT,
+            new_rank INTEGER,
+            new_rank_name TEXT,
+            created_at TEXT
+        )"""
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_rank_log_changes_guild_log "
+        "ON rank_log_changes(guild_id, log_id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_rank_log_history_guild_kind "
+        "ON rank_log_history(guild_id, kind)"
+    )
+
+
+def _migration_005_current_rank(c: sqlite3.Connection) -> None:
+    """길드별 현재 랭크. rank_log_task 는 이 테이블(의 메모리 미러)과만 비교한다."""
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS current_rank(
+            guild_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            roblox_user_id INTEGER,
+            rank INTEGER NOT NULL,
+            rank_name TEXT,
+            updated_at TEXT,
+            PRIMARY KEY(guild_id, username)
+        )"""
+    )
+
+
+def _migration_006_economy_ledger(c: sqlite3.Connection) -> None:
+    """돈의 모든 이동을 남기는 원장. 기존 잔액은 opening_balance 항목 하나로 옮긴다."""
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS economy_ledger(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            guild_id INTEGER,
+            delta INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            created_at TEXT
+        )"""
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_economy_ledger_user ON economy_ledger(user_id, delta)")
+    c.execute(
+        "INSERT INTO economy_ledger(user_id, guild_id, delta, reason, created_at) "
+        "SELECT user_id, NULL, money, 'opening_balance', ? FROM economy WHERE money != 0",
+        (datetime.now().isoformat(),),
+    )
+
+
+def _migration_007_legacy_verified(c: sqlite3.Connection) -> None:
+    """예전 버튼 인증은 users.verified 를 쓰지 않았다. 웹 인증 로그로 확인한 결과를 남겨 둔다."""
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS legacy_verified(
+            guild_id INTEGER NOT NULL,
+            discord_id INTEGER NOT NULL,
+            verified INTEGER NOT NULL,
+            checked_at TEXT,
+            PRIMARY KEY(guild_id, discord_id)
+        )"""
+    )
+
+
+def _migration_008_legacy_backfill(c: sqlite3.Connection) -> None:
+    """웹 인증 로그는 길드별로 한 번에 읽어 온다. 멤버별로 물어서 쌓인 '미인증' 답은 버린다."""
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS legacy_backfill(
+            guild_id INTEGER PRIMARY KEY,
+            imported INTEGER NOT NULL,
+            completed_at TEXT
+        )"""
+    )
+    c.execute("DELETE FROM legacy_verified WHERE verified=0")
+
+
+# (버전, 설명, 함수) — 순서대로 추가만 하고, 이미 배포된 항목은 수정하지 않는다
+MIGRATIONS: list[tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "baseline schema", _migration_001_baseline),
+    (2, "import legacy economy.db", _migration_002_import_legacy_economy),
+    (3, "hot query indexes", _migration_003_hot_query_indexes),
+    (4, "rank history keyframes + deltas", _migration_004_rank_history_deltas),
+    (5, "current_rank", _migration_005_current_rank),
+    (6, "economy ledger", _migration_006_economy_ledger),
+    (7, "legacy verified lookups", _migration_007_legacy_verified),
+    (8, "legacy verified backfill per guild", _migration_008_legacy_backfill),
+]
+
+
+def apply_migrations(c: sqlite3.Connection) -> list[int]:
+    """밀린 마이그레이션을 한 트랜잭션 안에서 순서대로 적용합니다."""
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version(
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )"""
+    )
+    current = c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if version <= current:
+            continue
+        fn(c)
+        c.execute(
+            "INSERT INTO schema_version(version, description, applied_at) VALUES(?, ?, ?)",
+            (version, description, datetime.now().isoformat()),
+        )
+        applied.append(version)
+    return applied
+
+
+# ---------- 저장소(repository) ----------
+# 테이블별 SQL 은 여기에만 둔다. 호출부는 튜플 인덱스 대신 slots 행 객체를 받는다.
+
+@dataclass(slots=True)
+class EconomyRow:
+    user_id: int
+    money: int
+    last_daily: int
+    exp: int
+    level: int
+
+
+@dataclass(slots=True)
+class ShopItemRow:
+    name: str
+    price: int
+    type: str
+    role_id: Optional[int]
+    level: Optional[int]
+    exp: Optional[int]
+
+
+@dataclass(slots=True)
+class CommandLogRow:
+    id: int
+    user_name: str
+    user_id: int
+    command_name: str
+    command_full: str
+    created_at: str
+
+
+@dataclass(slots=True)
+class RankChangeRow:
+    username: str
+    old_rank: Optional[int]         # None 이면 새로 들어온 유저
+    old_rank_name: Optional[str]
+    new_rank: Optional[int]         # None 이면 명단에서 빠진 유저
+    new_rank_name: Optional[str]
+
+
+@dataclass(slots=True)
+class LedgerEntry:
+    user_id: int
+    guild_id: Optional[int]
+    delta: int
+    reason: str
+    key: Optional[str]
+    created_at: str
+
+
+class EconomyRepo:
+    SQL_GET = "SELECT user_id, money, last_daily, exp, level FROM economy WHERE user_id=?"
+    SQL_TOP_BY_LEVEL = "SELECT user_id, money, last_daily, exp, level FROM economy ORDER BY level DESC, exp DESC LIMIT ?"
+    SQL_LEDGER_KEY = "SELECT 1 FROM economy_ledger WHERE idempotency_key=?"
+    SQL_REBUILD = """
+        UPDATE economy SET money = COALESCE(
+            (SELECT SUM(delta) FROM economy_ledger l WHERE l.user_id = economy.user_id), 0
+        )
+        WHERE money != COALESCE(
+            (SELECT SUM(delta) FROM economy_ledger l WHERE l.user_id = economy.user_id), 0
+        )
+    """
+
+    def __init__(self, database: Database):
+        self.db = database
+
+    async def get(self, user_id: int) -> Optional[EconomyRow]:
+        row = await self.db.fetchone(self.SQL_GET, (user_id,))
+        return EconomyRow(*row) if row else None
+
+    async def top_by_level(self, limit: int = 10) -> list[EconomyRow]:
+        return [EconomyRow(*r) for r in await self.db.fetchall(self.SQL_TOP_BY_LEVEL, (limit,))]
+
+    async def has_entry(self, key: str) -> bool:
+        return await self.db.fetchone(self.SQL_LEDGER_KEY, (key,)) is not None
+
+    async def commit_batch(
+        self,
+        entries: list[LedgerEntry],
+        rows: list[EconomyRow],
+        durable: bool = False,
+    ) -> list[tuple[int, int]]:
+        """원장 항목과 계정 상태를 한 트랜잭션으로 저장합니다.
+
+        원장 항목마다 SAVEPOINT 안에서 항목을 넣고 그 delta 만큼 잔액을 조건부 UPDATE 한다.
+        잔액이 모자라면 그 항목까지 되돌려, 원장 합계와 잔액이 항상 같게 둔다.
+        거절된 (user_id, delta) 목록을 돌려줍니다.
+        """
+        def work(c: sqlite3.Connection) -> list[tuple[int, int]]:
+            c.executemany(
+                "INSERT OR IGNORE INTO economy(user_id) VALUES(?)",
+                [(user_id,) for user_id in {r.user_id for r in rows} | {e.user_id for e in entries}],
+            )
+            rejected = []
+            for e in entries:
+                c.execute("SAVEPOINT ledger_entry")
+                cur = c.execute(
+                    "INSERT OR IGNORE INTO economy_ledger"
+                    "(user_id, guild_id, delta, reason, idempotency_key, created_at) "
+                    "VALUES(?, ?, ?, ?, ?, ?)",
+                    (e.user_id, e.guild_id, e.delta, e.reason, e.key, e.created_at),
+                )
+                # 같은 키가 이미 있으면(재시도) 잔액에 다시 반영하지 않는다
+                if cur.rowcount:
+                    cur = c.execute(
+                        "UPDATE economy SET money = money + ? WHERE user_id = ? AND money >= ?",
+                        (e.delta, e.user_id, max(0, -e.delta)),
+                    )
+                    if not cur.rowcount:
+                        c.execute("ROLLBACK TO ledger_entry")
+                        rejected.append((e.user_id, e.delta))
+                c.execute("RELEASE ledger_entry")
+            c.executemany(
+                "UPDATE economy SET last_daily=?, exp=?, level=? WHERE user_id=?",
+                [(r.last_daily, r.exp, r.level, r.user_id) for r in rows],
+            )
+            return rejected
+
+        return await self.db.run(work, durable)
+
+
+class UserRepo:
+    SQL_VERIFIED_NICKS = "SELECT roblox_nick FROM users WHERE guild_id=? AND verified=1"
+    SQL_VERIFIED_MEMBERS = "SELECT discord_id, roblox_nick FROM users WHERE guild_id=? AND verified=1"
+    SQL_VERIFIED_ROBLOX = "SELECT roblox_nick, roblox_user_id FROM users WHERE guild_id=? AND verified=1"
+    SQL_IS_VERIFIED = (
+        "SELECT 1 FROM users WHERE guild_id=? AND discord_id=? AND verified=1 "
+        "UNION ALL SELECT 1 FROM forced_verified WHERE guild_id=? AND discord_id=? "
+        "UNION ALL SELECT 1 FROM legacy_verified WHERE guild_id=? AND discord_id=? AND verified=1 LIMIT 1"
+    )
+
+    def __init__(self, database: Database):
+        self.db = database
+
+    async def verified_nicks(self, guild_id: int) -> list[str]:
+        return [r[0] for r in await self.db.fetchall(self.SQL_VERIFIED_NICKS, (guild_id,)) if r[0]]
+
+    async def verified_members(self, guild_id: int) -> list[tuple[int, str]]:
+        return [(r[0], r[1]) for r in await self.db.fetchall(self.SQL_VERIFIED_MEMBERS, (guild_id,))]
+
+    async def verified_roblox_ids(self, guild_id: int) -> dict[str, Optional[int]]:
+        """roblox_nick -> roblox_user_id"""
+        return {r[0]: r[1] for r in await self.db.fetchall(self.SQL_VERIFIED_ROBLOX, (guild_id,)) if r[0]}
+
+    async def is_verified(self, guild_id: int, discord_id: int) -> bool:
+        row = await self.db.fetchone(self.SQL_IS_VERIFIED, (guild_id, discord_id) * 3)
+        return row is not None
+
+    def all_verified_sync(self) -> list[tuple[int, int]]:
+        """시작 시 인덱스 적재용. (users + forced_verified + 예전 인증 확인 결과)"""
+        return self.db.fetchall_sync(
+            """
+            SELECT guild_id, discord_id FROM users WHERE verified=1
+            UNION
+            SELECT guild_id, discord_id FROM forced_verified
+            UNION
+            SELECT guild_id, discord_id FROM legacy_verified WHERE verified=1
+            """
+        )
+
+    def legacy_backfilled_sync(self) -> list[int]:
+        """웹 인증 로그를 이미 다 읽어 온 길드 id"""
+        return [r[0] for r in self.db.fetchall_sync("SELECT guild_id FROM legacy_backfill")]
+
+    async def save_legacy_backfill(self, guild_id: int, discord_ids: set[int]) -> None:
+        """웹 인증 로그에 있는 멤버와 '이 길드는 다 읽었음' 표시를 한 트랜잭션으로 저장합니다."""
+        now = datetime.now().isoformat()
+
+        def work(c: sqlite3.Connection) -> None:
+            c.executemany(
+                "INSERT OR REPLACE INTO legacy_verified(guild_id, discord_id, verified, checked_at) "
+                "VALUES(?, ?, 1, ?)",
+                [(guild_id, discord_id, now) for discord_id in discord_ids],
+            )
+            c.execute(
+                "INSERT OR REPLACE INTO legacy_backfill(guild_id, imported, completed_at) VALUES(?, ?, ?)",
+                (guild_id, len(discord_ids), now),
+            )
+
+        await self.db.run(work, durable=True)
+
+    async def upsert_verified(
+        self,
+        guild_id: int,
+        discord_id: int,
+        roblox_nick: str,
+        roblox_user_id: int,
+        code: str,
+    ) -> WriteResult:
+        return await self.db.execute(
+            """INSERT OR REPLACE INTO users(discord_id, guild_id, roblox_nick, roblox_user_id, code, expire_time, verified)
+               VALUES(?, ?, ?, ?, ?, ?, 1)""",
+            (discord_id, guild_id, roblox_nick, roblox_user_id, code, datetime.now().isoformat()),
+        )
+
+
+class ForcedVerifiedRepo:
+    SQL_NICKS = "SELECT roblox_nick FROM forced_verified WHERE guild_id=?"
+
+    def __init__(self, database: Database):
+        self.db = database
+
+    async def nicks(self, guild_id: int) -> set[str]:
+        return {r[0] for r in await self.db.fetchall(self.SQL_NICKS, (guild_id,)) if r[0]}
+
+    async def add_many(self, guild_id: int, discord_ids: list[int], rank_role: str = "forced") -> WriteResult:
+        """여러 명을 한 트랜잭션(executemany)으로 강제인증 처리합니다."""
+        return await self.db.executemany(
+            """
+            INSERT OR REPLACE INTO forced_verified(discord_id, guild_id, roblox_nick, roblox_user_id, rank_role)
+            VALUES(?, ?, NULL, NULL, ?)
+            """,
+            [(discord_id, guild_id, rank_role) for discord_id in discord_ids],
+        )
+
+    async def delete(self, guild_id: int, discord_id: int) -> WriteResult:
+        return await self.db.execute(
+            "DELETE FROM forced_verified WHERE discord_id = ? AND guild_id = ?",
+            (discord_id, guild_id),
+        )
+
+
+class ShopItemRepo:
+    SQL_LIST = (
+        "SELECT name, price, type, role_id, level, exp FROM shop_items "
+        "WHERE guild_id=? ORDER BY price ASC"
+    )
+    SQL_GET = (
+        "SELECT name, price, type, role_id, level, exp FROM shop_items "
+        "WHERE guild_id=? AND name=?"
+    )
+
+    def __init__(self, database: Database):
+        self.db = database
+
+    async def list(self, guild_id: int) -> list[ShopItemRow]:
+        return [ShopItemRow(*r) for r in await self.db.fetchall(self.SQL_LIST, (guild_id,))]
+
+    async def get(self, guild_id: int, name: str) -> Optional[ShopItemRow]:
+        row = await self.db.fetchone(self.SQL_GET, (guild_id, name))
+        return ShopItemRow(*row) if row else None
+
+    async def add(self, guild_id: int, item: ShopItemRow) -> WriteResult:
+        return await self.db.execute(
+            """
+            INSERT INTO shop_items(guild_id, name, price, type, role_id, level, exp)
+            VALUES(?, ?, ?, ?, ?, ?, ?)
+            """,
+            (guild_id, item.name, item.price, item.type, item.role_id, item.level, item.exp),
+        )
+
+    async def delete(self, guild_id: int, name: str) -> WriteResult:
+        return await self.db.execute(
+            "DELETE FROM shop_items WHERE guild_id=? AND name=?",
+            (guild_id, name),
+        )
+
+
+class CommandLogRepo:
+    SQL_RECENT = (
+        "SELECT id, user_name, user_id, command_name, command_full, created_at "
+        "FROM command_logs WHERE guild_id=? ORDER BY id DESC LIMIT ?"
+    )
+
+    def __init__(self, database: Database):
+        self.db = database
+
+    async def recent(self, guild_id: int, limit: int = 200) -> list[CommandLogRow]:
+        return [CommandLogRow(*r) for r in await self.db.fetchall(self.SQL_RECENT, (guild_id, limit))]
+
+    def add(self, guild_id: Optional[int], user_id: int, user_name: str, command_name: str, command_full: str) -> None:
+        self.db.submit(
+            """
+            INSERT INTO command_logs(
+                guild_id, user_id, user_name,
+                command_name, command_full, created_at
+            )
+            VALUES(?, ?, ?, ?, ?, datetime('now'))
+            """,
+            (guild_id, user_id, user_name, command_name, command_full),
+        )
+
+
+RANK_KEYFRAME_INTERVAL = 50   # 변경 기록 이만큼마다 전체 스냅샷(keyframe) 한 번
+
+# 랭크 상태: {username: {"rank": int, "rank_name": str}}
+RankState = dict[str, dict]
+
+
+class RankHistoryRepo:
+    """rank_log_history 는 keyframe(전체 스냅샷) 과 delta(변경만) 행을 섞어 저장한다.
+    delta 의 실제 변경 내용은 rank_log_changes 에 log_id 로 묶여 있다."""
+
+    SQL_LATEST_ID = "SELECT id FROM rank_log_history WHERE guild_id=? ORDER BY id DESC LIMIT 1"
+    SQL_KEYFRAME_AT = (
+        "SELECT id, log_data FROM rank_log_history "
+        "WHERE guild_id=? AND kind='keyframe' AND id<=? ORDER BY id DESC LIMIT 1"
+    )
+    SQL_CHANGES_BETWEEN = (
+        "SELECT username, new_rank, new_rank_name FROM rank_log_changes "
+        "WHERE guild_id=? AND log_id>? AND log_id<=? ORDER BY log_id, id"
+    )
+    SQL_CHANGES_OF = (
+        "SELECT username, old_rank, old_rank_name, new_rank, new_rank_name FROM rank_log_changes "
+        "WHERE guild_id=? AND log_id=? ORDER BY id"
+    )
+
+    def __init__(self, database: Database):
+        self.db = database
+        # guild_id -> 마지막 keyframe 이후 delta 수
+        self._since_keyframe: dict[int, int] = {}
+
+    async def _rebuild(self, guild_id: int, log_id: int) -> Optional[tuple[int, RankState]]:
+        keyframe = await self.db.fetchone(self.SQL_KEYFRAME_AT, (guild_id, log_id))
+        if keyframe is None:
+            return None
+        keyframe_id, log_data = keyframe
+        state: RankState = {
+            item["username"]: {"rank": item["rank"], "rank_name": item["rank_name"]}
+            for item in json.loads(log_data)
+        }
+        for username, new_rank, new_rank_name in await self.db.fetchall(
+            self.SQL_CHANGES_BETWEEN, (guild_id, keyframe_id, log_id)
+        ):
+            if new_rank is None:
+                state.pop(username, None)
+            else:
+                state[username] = {"rank": new_rank, "rank_name": new_rank_name}
+        return keyframe_id, state
+
+    async def state_at(self, guild_id: int, log_id: int) -> Optional[RankState]:
+        """log_id 시점의 랭크 상태를 keyframe + delta 로 복원합니다."""
+        rebuilt = await self._rebuild(guild_id, log_id)
+        return rebuilt[1] if rebuilt else None
+
+    async def changes_of(self, guild_id: int, log_id: int) -> list[RankChangeRow]:
+        return [RankChangeRow(*r) for r in await self.db.fetchall(self.SQL_CHANGES_OF, (guild_id, log_id))]
+
+    async def latest_state(self, guild_id: int) -> tuple[Optional[int], RankState]:
+        """가장 최근 기록 시점의 상태. (current_rank 가 비어 있을 때 씨앗으로만 사용)"""
+        row = await self.db.fetchone(self.SQL_LATEST_ID, (guild_id,))
+        if row is None:
+            return None, {}
+        state = await self.state_at(guild_id, row[0])
+        return (row[0], state) if state is not None else (None, {})
+
+    async def _deltas_since_keyframe(self, guild_id: int) -> Optional[int]:
+        count = self._since_keyframe.get(guild_id)
+        if count is not None:
+            return count
+        row = await self.db.fetchone(
+            """SELECT COUNT(*) FROM rank_log_history
+               WHERE guild_id=? AND id > (
+                   SELECT id FROM rank_log_history
+                   WHERE guild_id=? AND kind='keyframe' ORDER BY id DESC LIMIT 1
+               )""",
+            (guild_id, guild_id),
+        )
+        has_keyframe = await self.db.fetchone(
+            "SELECT 1 FROM rank_log_history WHERE guild_id=? AND kind='keyframe' LIMIT 1",
+            (guild_id,),
+        )
+        return row[0] if has_keyframe else None
+
+    async def record(
+        self,
+        guild_id: int,
+        changes: list[RankChangeRow],
+        snapshot: Callable[[], RankState],
+    ) -> int:
+        """변경 행만 delta 로 저장하고, 주기적으로 snapshot() 을 keyframe 으로 남깁니다."""
+        since_keyframe = await self._deltas_since_keyframe(guild_id)
+        keyframe = since_keyframe is None or since_keyframe + 1 >= RANK_KEYFRAME_INTERVAL
+        log_data = (
+            json.dumps([{"username": k, **v} for k, v in snapshot().items()], ensure_ascii=False)
+            if keyframe else None
+        )
+        now = datetime.now().isoformat()
+
+        def write(c: sqlite3.Connection) -> int:
+            log_id = c.execute(
+                "INSERT INTO rank_log_history(guild_id, log_data, created_at, kind) VALUES(?, ?, ?, ?)",
+                (guild_id, log_data, now, "keyframe" if keyframe else "delta"),
+            ).lastrowid
+            c.executemany(
+                """INSERT INTO rank_log_changes(
+                       log_id, guild_id, username, old_rank, old_rank_name, new_rank, new_rank_name, created_at
+                   ) VALUES(?, ?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (log_id, guild_id, ch.username, ch.old_rank, ch.old_rank_name,
+                     ch.new_rank, ch.new_rank_name, now)
+                    for ch in changes
+                ],
+            )
+            return log_id
+
+        log_id = await self.db.run(write)
+        self._since_keyframe[guild_id] = 0 if keyframe else since_keyframe + 1
+        return log_id
+
+
+@dataclass(slots=True)
+class CurrentRankRow:
+    username: str
+    roblox_user_id: Optional[int]
+    rank: int
+    rank_name: str
+
+
+class CurrentRankRepo:
+    """길드별 현재 랭크 (current_rank 테이블 + 메모리 미러).
+    bulk-status 결과와 한 번 훑어 비교하고, 바뀐 행만 upsert 한다."""
+
+    SQL_GUILD = "SELECT username, roblox_user_id, rank, rank_name FROM current_rank WHERE guild_id=?"
+
+    def __init__(self, database: Database, history: RankHistoryRepo):
+        self.db = database
+        self.history = history
+        self._mirror: dict[int, dict[str, CurrentRankRow]] = {}
+
+    async def mirror(self, guild_id: int) -> dict[str, CurrentRankRow]:
+        rows = self._mirror.get(guild_id)
+        if rows is not None:
+            return rows
+        rows = {r[0]: CurrentRankRow(*r) for r in await self.db.fetchall(self.SQL_GUILD, (guild_id,))}
+        if not rows:
+            # 처음 도입할 때: 기존 랭크 기록의 최신 상태를 기준으로 삼는다
+            _, state = await self.history.latest_state(guild_id)
+            rows = {
+                username: CurrentRankRow(username, None, v["rank"], v["rank_name"])
+                for username, v in state.items()
+            }
+            if rows:
+                await self._upsert(guild_id, list(rows.values()))
+        self._mirror[guild_id] = rows
+        return rows
+
+    def snapshot(self, guild_id: int) -> RankState:
+        return {
+            r.username: {"rank": r.rank, "rank_name": r.rank_name}
+            for r in self._mirror.get(guild_id, {}).values()
+        }
+
+    async def diff(self, guild_id: int, statuses: list) -> list[RankChangeRow]:
+        """새 조회 결과(bot.RankStatus 목록) 중 미러와 다른 행만 돌려줍니다. (아직 반영하지 않음)"""
+        rows = await self.mirror(guild_id)
+        changes = []
+        for r in statuses:
+            if not r.success:
+                continue
+            rank = r.role.rank if r.role else 0
+            rank_name = r.role.name if r.role else "?"
+            prev = rows.get(r.username)
+            if prev is None:
+                changes.append(RankChangeRow(r.username, None, None, rank, rank_name))
+            elif prev.rank != rank or prev.rank_name != rank_name:
+                changes.append(RankChangeRow(r.username, prev.rank, prev.rank_name, rank, rank_name))
+        return changes
+
+    async def apply(
+        self,
+        guild_id: int,
+        changes: list[RankChangeRow],
+        user_ids: dict[str, int] | None = None,
+    ) -> None:
+        if not changes:
+            return
+        rows = await self.mirror(guild_id)
+        updated = []
+        for ch in changes:
+            prev = rows.get(ch.username)
+            user_id = (user_ids or {}).get(ch.username) or (prev.roblox_user_id if prev else None)
+            row = CurrentRankRow(ch.username, user_id, ch.new_rank, ch.new_rank_name)
+            updated.append(row)
+        await self._upsert(guild_id, updated)
+        for row in updated:
+            rows[row.username] = row
+
+    async def _upsert(self, guild_id: int, rows: list[CurrentRankRow]) -> None:
+        now = datetime.now().isoformat()
+        await self.db.executemany(
+            """
+            INSERT INTO current_rank(guild_id, username, roblox_user_id, rank, rank_name, updated_at)
+            VALUES(?, ?, ?, ?, ?, ?)
+            ON CONFLICT(guild_id, username) DO UPDATE SET
+                roblox_user_id=COALESCE(excluded.roblox_user_id, current_rank.roblox_user_id),
+                rank=excluded.rank,
+                rank_name=excluded.rank_name,
+                updated_at=excluded.updated_at
+            """,
+            [(guild_id, r.username, r.roblox_user_id, r.rank, r.rank_name, now) for r in rows],
+        )
+
+
+# ---------- 보존 정책 ----------
+# bot.py 의 run_retention 이 정책마다 archive_expired_batch 를 writer 트랜잭션 안에서 반복 호출한다.
+
+RETENTION_BATCH_SIZE = 5000
+
+
+@dataclass(slots=True)
+class RetentionPolicy:
+    table: str
+    max_age_days: Optional[int] = None     # created_at 기준
+    keep_per_guild: Optional[int] = None   # 길드별 최신 N건만 유지
+    expired_sql: Optional[str] = None      # 직접 지정 (마지막 ? 는 LIMIT)
+
+    def expired_ids_sql(self) -> tuple[str, tuple]:
+        if self.expired_sql is not None:
+            return self.expired_sql, (RETENTION_BATCH_SIZE,)
+        if self.keep_per_guild is not None:
+            return (
+                f"""SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (PARTITION BY guild_id ORDER BY id DESC) AS rn
+                        FROM {self.table}
+                    ) WHERE rn > ? ORDER BY id LIMIT ?""",
+                (self.keep_per_guild, RETENTION_BATCH_SIZE),
+            )
+        return (
+            f"SELECT id FROM {self.table} WHERE julianday(created_at) < julianday('now', ?) ORDER BY id LIMIT ?",
+            (f"-{self.max_age_days} days", RETENTION_BATCH_SIZE),
+        )
+
+
+RETENTION_POLICIES = [
+    RetentionPolicy("command_logs", max_age_days=90),
+    # 최신 기록은 rank_log_task 의 비교 기준이므로 개수 기준으로만 자른다
+    # (RANK_KEYFRAME_INTERVAL 보다 넉넉히 남겨야 최신 상태를 복원할 keyframe 이 남는다)
+    RetentionPolicy("rank_log_history", keep_per_guild=500),
+    # 위에서 지워진 기록에 딸린 변경 행
+    RetentionPolicy(
+        "rank_log_changes",
+        expired_sql=(
+            "SELECT id FROM rank_log_changes ch WHERE NOT EXISTS "
+            "(SELECT 1 FROM rank_log_history h WHERE h.id = ch.log_id) ORDER BY id LIMIT ?"
+        ),
+    ),
+]
+
+
+def archive_expired_batch(
+    c: sqlite3.Connection, policy: RetentionPolicy, archive_dir: str
+) -> tuple[int, Optional[str]]:
+    """만료된 행 한 배치를 .tmp 아카이브에 쓰고 DELETE 합니다. (rename 은 커밋 뒤 호출자가)"""
+    sql, params = policy.expired_ids_sql()
+    ids = [r[0] for r in c.execute(sql, params).fetchall()]
+    if not ids:
+        return 0, None
+
+    placeholders = ",".join("?" * len(ids))
+    cur = c.execute(f"SELECT * FROM {policy.table} WHERE id IN ({placeholders}) ORDER BY id", ids)
+    columns = [d[0] for d in cur.description]
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(
+        archive_dir, f"{policy.table}-{datetime.now():%Y%m%d}-{ids[0]}.jsonl.gz"
+    )
+    tmp_path = path + ".tmp"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for row in cur:
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        c.execute(f"DELETE FROM {policy.table} WHERE id IN ({placeholders})", ids)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return len(ids), tmp_path
+
+
+# ---------- 핫 쿼리 실행 계획 점검 ----------
+# 자주 도는 쿼리는 여기에 등록한다. tests/test_query_plans.py 가 임시 DB 에
+# 마이그레이션을 적용한 뒤 EXPLAIN QUERY PLAN 을 돌려,
+# 인덱스 없는 테이블 풀스캔이나 정렬용 임시 B-tree 가 나오면 실패한다.
+HOT_QUERIES: list[tuple[str, str, tuple]] = [
+    ("users.verified_nicks", UserRepo.SQL_VERIFIED_NICKS, (1,)),
+    ("users.verified_members", UserRepo.SQL_VERIFIED_MEMBERS, (1,)),
+    ("users.verified_roblox", UserRepo.SQL_VERIFIED_ROBLOX, (1,)),
+    ("current_rank.guild", CurrentRankRepo.SQL_GUILD, (1,)),
+    ("users.is_verified", UserRepo.SQL_IS_VERIFIED, (1, 1) * 3),
+    ("forced_verified.nicks", ForcedVerifiedRepo.SQL_NICKS, (1,)),
+    ("command_logs.recent", CommandLogRepo.SQL_RECENT, (1, 200)),
+    ("economy.top_by_level", EconomyRepo.SQL_TOP_BY_LEVEL, (10,)),
+    ("economy.get", EconomyRepo.SQL_GET, (1,)),
+    ("economy_ledger.key", EconomyRepo.SQL_LEDGER_KEY, ("x",)),
+    ("shop_items.list", ShopItemRepo.SQL_LIST, (1,)),
+    ("shop_items.get", ShopItemRepo.SQL_GET, (1, "x")),
+    ("rank_history.latest_id", RankHistoryRepo.SQL_LATEST_ID, (1,)),
+    ("rank_history.keyframe_at", RankHistoryRepo.SQL_KEYFRAME_AT, (1, 1)),
+    ("rank_history.changes_between", RankHistoryRepo.SQL_CHANGES_BETWEEN, (1, 1, 2)),
+    ("rank_history.changes_of", RankHistoryRepo.SQL_CHANGES_OF, (1, 1)),
+]
+
+# 최신 SQLite 는 "SCAN x", 예전 버전은 "SCAN TABLE x" 로 찍는다.
+# 뒤에 별칭(AS ...)이 붙어도 풀스캔이고, 인덱스 순서대로 훑는 "USING [COVERING] INDEX" 만 제외한다.
+_FULL_SCAN_RE = re.compile(r"^SCAN (TABLE )?(?!TABLE )\w+\b(?! USING (COVERING )?INDEX)")
+
+
+def check_query_plans(c: sqlite3.Connection) -> list[str]:
+    """HOT_QUERIES 중 풀스캔/임시 정렬을 하는 쿼리의 설명 목록을 돌려줍니다."""
+    problems = []
+    for name, sql, params in HOT_QUERIES:
+        for row in c.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall():
+            detail = row[-1]
+            if _FULL_SCAN_RE.match(detail) or "TEMP B-TREE" in detail:
+                problems.append(f"{name}: {detail}")
+    return problems
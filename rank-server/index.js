@@ -46,6 +46,18 @@ async function changeRank(groupId, userId, change) {
   return result;
 }
 
+const BULK_CONCURRENCY = Number(process.env.BULK_CONCURRENCY || 8);
+
+// items 를 size 개씩 나눠 묶음 안에서는 동시에 처리한다 (결과 순서는 입력 순서 그대로)
+async function mapInChunks(items, size, fn) {
+  const results = [];
+  for (let i = 0; i < items.length; i += size) {
+    const chunk = items.slice(i, i + size);
+    results.push(...(await Promise.all(chunk.map(fn))));
+  }
+  return results;
+}
+
 function checkApiKey(req, res) {
   const auth = req.headers["x-api-key"];
   if (auth !== API_KEY) {
@@ -222,6 +234,58 @@ app.post("/bulk-demote", async (req, res) => {
   }
 });
 
+// 지정한 역할(이름 또는 rank 숫자)로 여러 명을 한 번에 맞춘다. (BULK_CONCURRENCY 명씩 병렬)
+// promote/demote 는 호출하는 쪽의 의도(로그)만 다르고 동작은 같다.
+function bulkSetRoleHandler(label) {
+  return async (req, res) => {
+    try {
+      if (!checkApiKey(req, res)) return;
+
+      const { usernames, rank } = req.body;
+      if (!Array.isArray(usernames) || usernames.length === 0) {
+        return res.status(400).json({ error: "usernames 배열이 필요합니다." });
+      }
+      if (rank === undefined || rank === null || rank === "") {
+        return res.status(400).json({ error: "rank가 필요합니다." });
+      }
+
+      const rankArg = await resolveRank(String(rank));
+
+      const results = await mapInChunks(usernames, BULK_CONCURRENCY, async (name) => {
+        try {
+          const userId = await getUserIdFromName(name);
+          const newRole = await noblox.setRank(GROUP_ID, userId, rankArg);
+          return {
+            username: name,
+            success: true,
+            newRole: {
+              id: newRole.id,
+              name: newRole.name,
+              rank: newRole.rank,
+            },
+          };
+        } catch (e) {
+          console.error(`${label} error for`, name, e);
+          return {
+            username: name,
+            success: false,
+            error: String(e),
+          };
+        }
+      });
+
+      res.json({ success: true, results });
+    } catch (err) {
+      console.error(`POST /${label} error:`, err);
+      res.status(500).json({ error: String(err) });
+    }
+  };
+}
+
+app.post("/bulk-promote-to-role", bulkSetRoleHandler("bulk-promote-to-role"));
+
+app.post("/bulk-demote-to-role", bulkSetRoleHandler("bulk-demote-to-role"));
+
 init().then(() => {
   app.listen(PORT, "0.0.0.0", () => {
     console.log("Rank server listening on port", PORT);
@@ -0,0 +1,28 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# bot/ 아래 모듈(storage 등)을 패키지 없이 바로 import 하기 위해
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def migrated(tmp_path):
+    c = sqlite3.connect(tmp_path / "plan.db", isolation_level=None)
+    c.execute("BEGIN")
+    storage.apply_migrations(c)
+    c.execute("COMMIT")
+    yield c
+    c.close()
+
+
+@pytest.fixture
+def database(migrated, tmp_path):
+    """migrated 와 같은 파일을 여는 Database (writer 스레드 포함)"""
+    db = storage.Database(str(tmp_path / "plan.db"), read_pool_size=1)
+    yield db
+    db.close()
@@ -0,0 +1,44 @@
+import asyncio
+
+import storage
+
+
+def entry(user_id: int, delta: int, key: str) -> storage.LedgerEntry:
+    return storage.LedgerEntry(user_id, 1, delta, "test", key, "2026-01-01T00:00:00")
+
+
+def balance_and_ledger(c, user_id: int) -> tuple[int, int]:
+    money = c.execute("SELECT money FROM economy WHERE user_id=?", (user_id,)).fetchone()[0]
+    total = c.execute(
+        "SELECT COALESCE(SUM(delta), 0) FROM economy_ledger WHERE user_id=?", (user_id,)
+    ).fetchone()[0]
+    return money, total
+
+
+def test_rejected_spend_leaves_no_ledger_row(database, migrated):
+    repo = storage.EconomyRepo(database)
+    row = storage.EconomyRow(1, 0, 0, 0, 1)
+
+    async def run():
+        assert await repo.commit_batch([entry(1, 100, "earn")], [row]) == []
+        # 같은 배치의 적립은 살고, 모자란 지출만 거절된다
+        return await repo.commit_batch(
+            [entry(1, 30, "earn2"), entry(1, -500, "spend"), entry(1, -20, "spend2")], [row]
+        )
+
+    assert asyncio.run(run()) == [(1, -500)]
+    assert balance_and_ledger(migrated, 1) == (110, 110)
+    assert migrated.execute(
+        "SELECT 1 FROM economy_ledger WHERE idempotency_key='spend'"
+    ).fetchone() is None
+
+
+def test_rebuild_matches_after_rejection(database, migrated):
+    repo = storage.EconomyRepo(database)
+
+    async def run():
+        await repo.commit_batch([entry(2, 50, "a"), entry(2, -80, "b")], [storage.EconomyRow(2, 0, 0, 0, 1)])
+        return await database.run(lambda c: c.execute(storage.EconomyRepo.SQL_REBUILD).rowcount)
+
+    assert asyncio.run(run()) == 0
+    assert balance_and_ledger(migrated, 2) == (50, 50)
@@ -0,0 +1,35 @@
+import pytest
+
+import storage
+
+
+def test_hot_queries_use_indexes(migrated):
+    assert storage.check_query_plans(migrated) == []
+
+
+def test_migrations_are_idempotent(migrated):
+    migrated.execute("BEGIN")
+    assert storage.apply_migrations(migrated) == []
+    migrated.execute("COMMIT")
+
+
+@pytest.mark.parametrize(
+    "detail, is_scan",
+    [
+        ("SCAN users", True),
+        ("SCAN TABLE users", True),
+        ("SEARCH users USING INDEX idx_users_guild_verified (guild_id=?)", False),
+        ("SCAN users AS u", True),
+        ("SCAN users USING COVERING INDEX idx_users_guild_verified", False),
+        ("SCAN TABLE economy USING INDEX idx_economy_level_exp", False),
+        ("SEARCH TABLE users USING INDEX idx_users_guild_verified (guild_id=?)", False),
+    ],
+)
+def test_full_scan_pattern(detail, is_scan):
+    assert bool(storage._FULL_SCAN_RE.match(detail)) is is_scan
+
+
+def test_import_does_not_open_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert not hasattr(storage, "db")
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,72 @@
+import asyncio
+import random
+
+import storage
+
+GUILD = 1
+RECORDS = 560   # keep_per_guild(500) 보다 많이, RANK_KEYFRAME_INTERVAL 을 여러 번 넘기게
+
+
+def random_changes(rng: random.Random, mirror: dict) -> list[storage.RankChangeRow]:
+    changes = []
+    for username in rng.sample([f"user{i}" for i in range(30)], rng.randint(1, 3)):
+        prev = mirror.get(username)
+        rank = rng.randint(1, 255)
+        changes.append(
+            storage.RankChangeRow(
+                username,
+                prev.rank if prev else None,
+                prev.rank_name if prev else None,
+                rank,
+                f"rank{rank}",
+            )
+        )
+    return changes
+
+
+def test_state_at_matches_mirror_across_keyframes_and_retention(database, tmp_path, monkeypatch):
+    # 쓰기를 하나씩 기다리므로 group commit 창을 없애야 빨리 끝난다
+    monkeypatch.setattr(storage, "DB_GROUP_COMMIT_WINDOW", 0)
+    history = storage.RankHistoryRepo(database)
+    current = storage.CurrentRankRepo(database, history)
+    policies = [p for p in storage.RETENTION_POLICIES if p.table.startswith("rank_log_")]
+    rng = random.Random(17)
+
+    async def run():
+        expected: dict[int, storage.RankState] = {}
+        for _ in range(RECORDS):
+            changes = random_changes(rng, await current.mirror(GUILD))
+            await current.apply(GUILD, changes)
+            log_id = await history.record(GUILD, changes, lambda: current.snapshot(GUILD))
+            expected[log_id] = current.snapshot(GUILD)
+
+        for log_id, state in expected.items():
+            assert await history.state_at(GUILD, log_id) == state
+
+        archived = {}
+        for policy in policies:
+            moved, tmp = await database.run(
+                lambda c, p=policy: storage.archive_expired_batch(c, p, str(tmp_path / "archive"))
+            )
+            assert tmp is not None
+            archived[policy.table] = moved
+        return expected, archived
+
+    expected, archived = asyncio.run(run())
+    assert archived["rank_log_history"] == RECORDS - 500
+    assert archived["rank_log_changes"] > 0
+
+    async def after():
+        latest_id, latest = await history.latest_state(GUILD)
+        assert latest_id == max(expected)
+        assert latest == expected[latest_id]
+
+        # 남은 기록 중 keyframe 이 앞에 남아 있는 시점은 모두 그대로 복원돼야 한다
+        first_keyframe = await database.fetchone(
+            "SELECT MIN(id) FROM rank_log_history WHERE guild_id=? AND kind='keyframe'", (GUILD,)
+        )
+        assert first_keyframe[0] <= latest_id - storage.RANK_KEYFRAME_INTERVAL
+        for log_id in range(first_keyframe[0], latest_id + 1):
+            assert await history.state_at(GUILD, log_id) == expected[log_id]
+
+    asyncio.run(after())
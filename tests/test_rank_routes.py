@@ -0,0 +1,30 @@
+import re
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# RankApiClient._request("POST", "/rank", ...) 형태의 호출
+CLIENT_CALL_RE = re.compile(r'_request\(\s*"(GET|POST)",\s*"(/[^"]*)"')
+# app.get("/roles", ...) / app.post("/rank", ...) 형태의 라우트
+SERVER_ROUTE_RE = re.compile(r'app\.(get|post)\(\s*"(/[^"]*)"')
+
+
+def client_routes() -> set[tuple[str, str]]:
+    source = (ROOT / "bot" / "bot.py").read_text(encoding="utf-8")
+    return {(method, path) for method, path in CLIENT_CALL_RE.findall(source)}
+
+
+def server_routes() -> set[tuple[str, str]]:
+    source = (ROOT / "rank-server" / "index.js").read_text(encoding="utf-8")
+    return {(method.upper(), path) for method, path in SERVER_ROUTE_RE.findall(source)}
+
+
+def test_client_calls_found():
+    routes = client_routes()
+    assert ("POST", "/rank") in routes
+    assert ("POST", "/bulk-status") in routes
+
+
+def test_every_client_route_is_served():
+    missing = client_routes() - server_routes()
+    assert not missing, f"rank-server/index.js 에 없는 경로: {sorted(missing)}"